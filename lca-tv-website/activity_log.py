@@ -0,0 +1,198 @@
+"""
+Asynchronous, batched activity logging
+
+log() only appends a row to a bounded in-memory queue; a writer thread drains
+it every second (or as soon as a batch fills up) with one executemany and
+one commit, so no request ever waits on an activity_logs fsync. When the
+queue is full the overflow policy decides what is lost:
+
+    drop_oldest  evict the oldest queued row (default: recent activity matters most)
+    drop_newest  refuse the new row
+
+Both are counted in the metrics. Rows keep the time they were logged, not the
+time they were written. purge() deletes rows older than the retention period
+in small chunks and is meant to run as a scheduled job.
+"""
+import atexit
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+MAX_QUEUE = 10000
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 1.0
+RETENTION_DAYS = 180
+PURGE_CHUNK = 5000
+OVERFLOW_POLICIES = ('drop_oldest', 'drop_newest')
+
+INSERT_SQL = '''
+    INSERT INTO activity_logs (user_id, action, description, ip_address, user_agent, created_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+
+class ActivityLogWriter:
+    """Bounded queue of activity_logs rows written by a background thread"""
+
+    name = 'activity-log'
+
+    def __init__(self, db_manager, max_queue=MAX_QUEUE, batch_size=BATCH_SIZE,
+                 flush_interval=FLUSH_INTERVAL, overflow='drop_oldest'):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.db = db_manager
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.queue = deque()
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.start_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.pid = None
+        self.exit_registered = False
+        # Metrics
+        self.logged = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.last_flush_time = 0
+        self.purged = 0
+
+    def start(self):
+        """Start the writer thread (again in a forked worker)"""
+        if self.pid == os.getpid() and self.thread and self.thread.is_alive():
+            return
+        with self.start_lock:
+            if self.pid == os.getpid() and self.thread and self.thread.is_alive():
+                return
+            with self.lock:
+                if self.pid != os.getpid():
+                    # Rows queued by the parent process are written by the parent
+                    self.queue.clear()
+                self.pid = os.getpid()
+            if not self.exit_registered:
+                atexit.register(self.flush_at_exit)
+                self.exit_registered = True
+            self.thread = threading.Thread(target=self.writer_loop, name=self.name, daemon=True)
+            self.thread.start()
+
+    def flush_at_exit(self):
+        # Un fils forké hérite de ce hook et de la file du parent: seul le processus propriétaire écrit
+        if self.pid == os.getpid():
+            self.flush()
+
+    def log(self, action, description=None, user_id=None, ip_address=None, user_agent=None):
+        """Queue one activity row; never blocks on the database"""
+        # Même format que CURRENT_TIMESTAMP (UTC) pour garder l'ordre avec l'historique
+        created_at = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        return self.enqueue((user_id, action, description, ip_address, user_agent, created_at))
+
+    def enqueue(self, row):
+        """Append a row to the queue, applying the overflow policy"""
+        self.start()
+        with self.lock:
+            if len(self.queue) >= self.max_queue:
+                self.dropped += 1
+                if self.overflow == 'drop_newest':
+                    return False
+                self.queue.popleft()
+            self.queue.append(row)
+            self.logged += 1
+            depth = len(self.queue)
+            self.max_depth = max(self.max_depth, depth)
+        if depth >= self.batch_size:
+            self.wakeup.set()
+        return True
+
+    def writer_loop(self):
+        while True:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """Write everything queued, batch_size rows per transaction; returns rows written"""
+        written = 0
+        with self.flush_lock:
+            while True:
+                with self.lock:
+                    if not self.queue:
+                        break
+                    batch = [self.queue.popleft() for _ in range(min(self.batch_size, len(self.queue)))]
+
+                start = time.perf_counter()
+                conn = self.db.get_connection()
+                try:
+                    self.write_batch(conn, batch)
+                    conn.commit()
+                except Exception as e:
+                    conn.rollback()
+                    self.errors += 1
+                    print(f"{self.name} flush failed, requeueing {len(batch)} rows: {e}")
+                    self.requeue(batch)
+                    break
+                finally:
+                    conn.close()
+
+                self.batches += 1
+                self.written += len(batch)
+                self.last_flush_time = time.perf_counter() - start
+                written += len(batch)
+        return written
+
+    def write_batch(self, conn, batch):
+        conn.executemany(INSERT_SQL, batch)
+
+    def requeue(self, batch):
+        """Put a failed batch back in front, within the queue bound"""
+        with self.lock:
+            room = max(0, self.max_queue - len(self.queue))
+            kept = batch[len(batch) - room:] if room < len(batch) else batch
+            self.dropped += len(batch) - len(kept)
+            self.queue.extendleft(reversed(kept))
+
+    def purge(self, retention_days=RETENTION_DAYS, chunk=PURGE_CHUNK):
+        """Delete rows older than the retention period, `chunk` rows per transaction"""
+        cutoff = (datetime.utcnow() - timedelta(days=retention_days)).strftime('%Y-%m-%d %H:%M:%S')
+        deleted = 0
+        while True:
+            conn = self.db.get_connection()
+            try:
+                cursor = conn.execute('''
+                    DELETE FROM activity_logs WHERE id IN (
+                        SELECT id FROM activity_logs WHERE created_at < ? ORDER BY created_at LIMIT ?
+                    )
+                ''', (cutoff, chunk))
+                conn.commit()
+                count = cursor.rowcount
+            finally:
+                conn.close()
+            deleted += count
+            if count < chunk:
+                break
+        self.purged += deleted
+        return deleted
+
+    def get_stats(self):
+        with self.lock:
+            depth = len(self.queue)
+        return {
+            'queued': depth,
+            'max_queue': self.max_queue,
+            'max_depth': self.max_depth,
+            'overflow_policy': self.overflow,
+            'logged': self.logged,
+            'written': self.written,
+            'dropped': self.dropped,
+            'batches': self.batches,
+            'errors': self.errors,
+            'last_flush_time': self.last_flush_time,
+            'purged': self.purged,
+        }
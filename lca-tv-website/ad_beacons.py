@@ -0,0 +1,141 @@
+"""
+Client-side ad impression beacons
+
+Pages no longer count impressions while rendering: ad_display.html observes
+which ad slots actually became visible and posts them in batches with
+navigator.sendBeacon. This module validates a beacon payload
+
+    {"events": [{"ad_id": 3, "slot": "header", "ts": 1718000000000, "token": "..."}, ...]}
+
+against the ad-serving index before the events reach the counter pipeline.
+Bots, prefetches, stale or future timestamps, unknown ads, ads shown in a slot
+they do not belong to and duplicates inside a batch are dropped.
+
+Every ad served by /api/ads/slots carries a serve token: an HMAC over the ad,
+slot, visitor and a random serve id. An impression counts only when it
+redeems a valid token of that visitor and ad, once; replaying a beacon, or
+sending ids of ads that were never served to the visitor, counts nothing.
+"""
+import hashlib
+import hmac
+import json
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+MAX_BEACON_BYTES = 8192
+MAX_EVENTS_PER_BEACON = 20
+# Accepted clock skew between the browser and the server, in seconds
+MAX_EVENT_AGE = 600
+MAX_EVENT_SKEW = 60
+# An ad may become visible long after the page loaded
+SERVE_TOKEN_MAX_AGE = 3600
+MAX_REDEEMED_TOKENS = 200000
+
+BOT_USER_AGENT = re.compile(
+    r'bot|crawl|spider|slurp|preview|headless|lighthouse|facebookexternalhit|curl|wget|python-requests',
+    re.IGNORECASE
+)
+
+
+def is_automated_request(headers):
+    """Crawlers and speculative loads must not count as impressions"""
+    user_agent = headers.get('User-Agent', '')
+    if not user_agent or BOT_USER_AGENT.search(user_agent):
+        return True
+    purpose = headers.get('Sec-Purpose') or headers.get('Purpose') or headers.get('X-Moz') or ''
+    return 'prefetch' in purpose.lower() or 'prerender' in purpose.lower()
+
+
+class ServeTokens:
+    """Signed proof that an ad was served to a visitor, redeemable once"""
+
+    def __init__(self, secret, max_age=SERVE_TOKEN_MAX_AGE, max_entries=MAX_REDEEMED_TOKENS):
+        self.secret = secret.encode() if isinstance(secret, str) else secret
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self.redeemed = OrderedDict()   # (visitor, ad_id, serve_id) -> issued at
+        self.lock = threading.Lock()
+        self.rejected = 0
+
+    def sign(self, ad_id, slot, visitor, serve_id, issued):
+        message = f'{ad_id}|{slot}|{visitor}|{serve_id}|{issued}'.encode()
+        return hmac.new(self.secret, message, hashlib.sha256).hexdigest()[:32]
+
+    def issue(self, ad_id, slot, visitor, now=None):
+        serve_id = uuid.uuid4().hex[:16]
+        issued = int(now or time.time())
+        return f'{serve_id}.{issued}.{self.sign(ad_id, slot, visitor, serve_id, issued)}'
+
+    def redeem(self, token, ad_id, slot, visitor, now=None):
+        """True the first time a valid token of this visitor, ad and slot is presented"""
+        now = now or time.time()
+        try:
+            serve_id, issued, signature = str(token).split('.')
+            issued = int(issued)
+        except (TypeError, ValueError):
+            self.rejected += 1
+            return False
+        expected = self.sign(ad_id, slot, visitor, serve_id, issued)
+        if not (now - self.max_age <= issued <= now + MAX_EVENT_SKEW) or not hmac.compare_digest(signature, expected):
+            self.rejected += 1
+            return False
+
+        key = (visitor, ad_id, serve_id)
+        with self.lock:
+            if key in self.redeemed:
+                self.rejected += 1
+                return False
+            self.redeemed[key] = issued
+            # Les jetons expirés ne peuvent plus être rejoués: on les oublie
+            while self.redeemed and (len(self.redeemed) > self.max_entries
+                                     or next(iter(self.redeemed.values())) < now - self.max_age):
+                self.redeemed.popitem(last=False)
+        return True
+
+
+def parse_beacon(body, get_ad, now=None, redeem=None):
+    """Validated [(ad, slot), ...] from a raw beacon body; raises ValueError
+
+    `redeem(ad, slot, token)` decides whether an event proves a serve
+    (see ServeTokens); events it rejects are dropped.
+    """
+    if len(body) > MAX_BEACON_BYTES:
+        raise ValueError('Beacon too large')
+    try:
+        payload = json.loads(body)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid JSON')
+
+    events = payload.get('events') if isinstance(payload, dict) else None
+    if not isinstance(events, list):
+        raise ValueError('Missing events')
+
+    now = now or time.time()
+    accepted = []
+    seen = set()
+    for event in events[:MAX_EVENTS_PER_BEACON]:
+        if not isinstance(event, dict):
+            continue
+        try:
+            ad_id = int(event['ad_id'])
+            slot = str(event['slot'])
+            timestamp = float(event['ts']) / 1000
+        except (KeyError, TypeError, ValueError):
+            continue
+
+        if not now - MAX_EVENT_AGE <= timestamp <= now + MAX_EVENT_SKEW:
+            continue
+        if (ad_id, slot) in seen:
+            continue
+        ad = get_ad(ad_id)
+        if ad is None or ad.get('location') != slot:
+            continue
+        if redeem is not None and not redeem(ad, slot, event.get('token')):
+            continue
+
+        seen.add((ad_id, slot))
+        accepted.append((ad, slot))
+    return accepted
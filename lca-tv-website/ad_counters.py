@@ -0,0 +1,283 @@
+"""
+Batched impression and click counters for advertisements
+
+Page renders and clicks only bump an in-memory (ad_id, date, hour) -> counts
+map. A background thread flushes it every few seconds (or as soon as enough
+events are pending) in a single transaction that maintains every rollup
+incrementally: UPSERTs into ad_stats_hourly, ad_stats (daily) and
+ad_stats_monthly, and one UPDATE per ad for the lifetime totals. Pending counts
+are flushed on interpreter shutdown as well, by the process that started the
+flush thread only (a forked worker never writes its parent's counts twice).
+Repeated clicks by the same visitor within a short window are only counted
+once.
+
+Visitors seen per (ad, day) are tracked in HyperLogLog sketches, merged into
+the ad_reach blobs by the same flush, to estimate unique reach.
+"""
+import atexit
+import os
+import threading
+import time
+from datetime import datetime
+
+from hyperloglog import HyperLogLog
+
+FLUSH_INTERVAL = 5.0
+MAX_PENDING_EVENTS = 1000
+CLICK_DEDUP_WINDOW = 30
+
+
+def ensure_rollup_schema(conn):
+    """Create the hourly and monthly rollups next to the daily ad_stats table"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ad_stats_hourly (
+            advertisement_id INTEGER NOT NULL,
+            date DATE NOT NULL,
+            hour INTEGER NOT NULL,
+            impressions INTEGER DEFAULT 0,
+            clicks INTEGER DEFAULT 0,
+            PRIMARY KEY (advertisement_id, date, hour)
+        )
+    ''')
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ad_stats_monthly'"
+    ).fetchone()
+    if not exists:
+        conn.execute('''
+            CREATE TABLE ad_stats_monthly (
+                advertisement_id INTEGER NOT NULL,
+                month TEXT NOT NULL,
+                impressions INTEGER DEFAULT 0,
+                clicks INTEGER DEFAULT 0,
+                PRIMARY KEY (advertisement_id, month)
+            )
+        ''')
+        # Backfill from the daily history
+        conn.execute('''
+            INSERT INTO ad_stats_monthly (advertisement_id, month, impressions, clicks)
+            SELECT advertisement_id, substr(date, 1, 7), SUM(impressions), SUM(clicks)
+            FROM ad_stats GROUP BY advertisement_id, substr(date, 1, 7)
+        ''')
+    # Unique visitors per ad and day (HyperLogLog sketch)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ad_reach (
+            advertisement_id INTEGER NOT NULL,
+            date DATE NOT NULL,
+            sketch BLOB NOT NULL,
+            PRIMARY KEY (advertisement_id, date)
+        )
+    ''')
+    conn.commit()
+
+
+class AdCounterAggregator:
+    """In-process accumulator of ad impressions and clicks"""
+
+    def __init__(self, db_manager, flush_interval=FLUSH_INTERVAL, max_pending=MAX_PENDING_EVENTS):
+        self.db = db_manager
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.pending = {}          # (ad_id, 'YYYY-MM-DD', hour) -> [impressions, clicks]
+        self.pending_events = 0
+        self.pending_reach = {}    # (ad_id, 'YYYY-MM-DD') -> HyperLogLog of visitors
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.start_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.pid = None
+        self.exit_registered = False
+        self.flushes = 0
+        self.flushed_events = 0
+        self.last_flush_time = 0
+        self.errors = 0
+
+    def start(self):
+        """Start the flush thread (again in a forked worker)"""
+        if self.pid == os.getpid() and self.thread and self.thread.is_alive():
+            return
+        with self.start_lock:
+            if self.pid == os.getpid() and self.thread and self.thread.is_alive():
+                return
+            with self.lock:
+                if self.pid != os.getpid():
+                    # Counts inherited from the parent process belong to the parent
+                    self.pending = {}
+                    self.pending_events = 0
+                    self.pending_reach = {}
+                self.pid = os.getpid()
+            if not self.exit_registered:
+                atexit.register(self.flush_at_exit)
+                self.exit_registered = True
+            self.thread = threading.Thread(target=self.flush_loop, name='ad-counters', daemon=True)
+            self.thread.start()
+
+    def flush_at_exit(self):
+        # Un fils forké hérite de ce hook: seul le processus propriétaire écrit
+        if self.pid == os.getpid():
+            self.flush()
+
+    def add(self, ad_id, impressions=0, clicks=0, visitor=None):
+        self.start()
+        now = datetime.now()
+        key = (ad_id, now.strftime('%Y-%m-%d'), now.hour)
+        with self.lock:
+            if visitor:
+                sketch = self.pending_reach.get(key[:2])
+                if sketch is None:
+                    sketch = self.pending_reach[key[:2]] = HyperLogLog()
+                sketch.add(visitor)
+            counts = self.pending.get(key)
+            if counts is None:
+                self.pending[key] = [impressions, clicks]
+            else:
+                counts[0] += impressions
+                counts[1] += clicks
+            self.pending_events += impressions + clicks
+            if self.pending_events >= self.max_pending:
+                self.wakeup.set()
+
+    def record_impression(self, ad_id, visitor=None):
+        self.add(ad_id, impressions=1, visitor=visitor)
+
+    def record_click(self, ad_id):
+        self.add(ad_id, clicks=1)
+
+    def flush_loop(self):
+        while True:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """Write all pending counts in one transaction; returns the number of events"""
+        with self.flush_lock:
+            with self.lock:
+                if not self.pending:
+                    return 0
+                batch, self.pending = self.pending, {}
+                events, self.pending_events = self.pending_events, 0
+                reach, self.pending_reach = self.pending_reach, {}
+
+            daily, monthly, totals = {}, {}, {}
+            for (ad_id, day, _), counts in batch.items():
+                for rollup, key in ((daily, (ad_id, day)), (monthly, (ad_id, day[:7])), (totals, ad_id)):
+                    total = rollup.setdefault(key, [0, 0])
+                    total[0] += counts[0]
+                    total[1] += counts[1]
+
+            start = time.perf_counter()
+            conn = self.db.get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.executemany('''
+                    INSERT INTO ad_stats_hourly (advertisement_id, date, hour, impressions, clicks)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(advertisement_id, date, hour) DO UPDATE SET
+                        impressions = impressions + excluded.impressions,
+                        clicks = clicks + excluded.clicks
+                ''', [key + tuple(counts) for key, counts in batch.items()])
+                cursor.executemany('''
+                    INSERT INTO ad_stats (advertisement_id, date, impressions, clicks)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(advertisement_id, date) DO UPDATE SET
+                        impressions = impressions + excluded.impressions,
+                        clicks = clicks + excluded.clicks
+                ''', [key + tuple(counts) for key, counts in daily.items()])
+                cursor.executemany('''
+                    INSERT INTO ad_stats_monthly (advertisement_id, month, impressions, clicks)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(advertisement_id, month) DO UPDATE SET
+                        impressions = impressions + excluded.impressions,
+                        clicks = clicks + excluded.clicks
+                ''', [key + tuple(counts) for key, counts in monthly.items()])
+                cursor.executemany('''
+                    UPDATE advertisements
+                    SET impressions = impressions + ?, clicks = clicks + ?
+                    WHERE id = ?
+                ''', [(impressions, clicks, ad_id) for ad_id, (impressions, clicks) in totals.items()])
+                self.merge_reach(cursor, reach)
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                self.errors += 1
+                print(f"Ad counters flush failed, keeping {events} events: {e}")
+                self.merge_back(batch, events, reach)
+                return 0
+            finally:
+                conn.close()
+
+            self.flushes += 1
+            self.flushed_events += events
+            self.last_flush_time = time.perf_counter() - start
+            return events
+
+    def merge_reach(self, cursor, reach):
+        """Merge pending sketches into the stored ad_reach blobs"""
+        for (ad_id, day), sketch in reach.items():
+            cursor.execute('SELECT sketch FROM ad_reach WHERE advertisement_id = ? AND date = ?', (ad_id, day))
+            row = cursor.fetchone()
+            if row:
+                sketch = HyperLogLog.from_bytes(row[0]).merge(sketch)
+            cursor.execute('''
+                INSERT INTO ad_reach (advertisement_id, date, sketch) VALUES (?, ?, ?)
+                ON CONFLICT(advertisement_id, date) DO UPDATE SET sketch = excluded.sketch
+            ''', (ad_id, day, sketch.to_bytes()))
+
+    def merge_back(self, batch, events, reach):
+        with self.lock:
+            for key, (impressions, clicks) in batch.items():
+                counts = self.pending.setdefault(key, [0, 0])
+                counts[0] += impressions
+                counts[1] += clicks
+            self.pending_events += events
+            for key, sketch in reach.items():
+                if key in self.pending_reach:
+                    sketch.merge(self.pending_reach[key])
+                self.pending_reach[key] = sketch
+
+    def get_stats(self):
+        with self.lock:
+            pending_events = self.pending_events
+            pending_keys = len(self.pending)
+        return {
+            'pending_events': pending_events,
+            'pending_keys': pending_keys,
+            'flushes': self.flushes,
+            'flushed_events': self.flushed_events,
+            'last_flush_time': self.last_flush_time,
+            'errors': self.errors
+        }
+
+
+class ClickDeduplicator:
+    """Counts one click per (ad, visitor) per time window"""
+
+    def __init__(self, window=CLICK_DEDUP_WINDOW, max_entries=50000):
+        self.window = window
+        self.max_entries = max_entries
+        self.seen = {}             # (ad_id, visitor) -> last counted click time
+        self.lock = threading.Lock()
+        self.duplicates = 0
+
+    def is_duplicate(self, ad_id, visitor):
+        """True if this visitor's click on the ad was already counted recently"""
+        now = time.monotonic()
+        key = (ad_id, visitor)
+        with self.lock:
+            last = self.seen.get(key)
+            if last is not None and now - last < self.window:
+                self.duplicates += 1
+                return True
+            if len(self.seen) >= self.max_entries:
+                self.prune(now)
+            self.seen[key] = now
+            return False
+
+    def prune(self, now):
+        expired = [key for key, last in self.seen.items() if now - last >= self.window]
+        for key in expired:
+            del self.seen[key]
+        # Under a burst of distinct visitors, start over rather than grow unbounded
+        if len(self.seen) >= self.max_entries:
+            self.seen.clear()
@@ -0,0 +1,186 @@
+"""
+In-memory ad-serving index
+
+All ads that are active today are loaded with a single query and grouped by
+ad space location, so serving the ads of a page is a dict lookup. The index
+is rebuilt lazily when an admin write invalidates it, when the date rolls
+over (flight dates are day-granular) or when PRAGMA data_version reports a
+commit from another connection or worker. Most of those commits are counter
+updates, so a data_version change first compares a cheap signature of the
+source tables (row count, updated_at and which rows are active, since status
+changes are not always stamped) and only rebuilds when it moved.
+
+Both queries are built from the columns each database actually has: ads
+either reference an ad space and a client by id (lcatv_advanced.db) or carry
+their `position` and client name themselves (lca_tv.db), and tables without
+`updated_at` are signed by row count and MAX(rowid). Ads of the second kind
+are given the field names the templates use (title, image_url, ...).
+"""
+import threading
+import time
+from datetime import date
+
+
+SOURCE_TABLES = ('advertisements', 'ad_spaces', 'clients')
+
+
+def table_columns(cursor, table):
+    return {row[1] for row in cursor.execute(f'PRAGMA table_info({table})').fetchall()}
+
+
+def signature_query(columns):
+    """One row signing each source table with what it has (row count, MAX(rowid), MAX(updated_at), status)"""
+    parts = []
+    for table in SOURCE_TABLES:
+        if not columns[table]:
+            parts.append("''")
+            continue
+        signature = "COUNT(*) || '/' || IFNULL(MAX(rowid), '')"
+        if 'updated_at' in columns[table]:
+            signature += " || '/' || IFNULL(MAX(updated_at), '')"
+        if 'status' in columns[table]:
+            # Changements de statut sans updated_at (UPDATE du lifecycle_scheduler): lignes actives et leur somme de rowid
+            signature += " || '/' || COUNT(CASE WHEN status = 'active' THEN 1 END)"
+            signature += " || '/' || TOTAL(CASE WHEN status = 'active' THEN rowid END)"
+        parts.append(f'(SELECT {signature} FROM {table})')
+    return 'SELECT ' + ', '.join(parts)
+
+
+def active_ads_query(columns):
+    """Active ads of the day with their location, size and client name"""
+    ads, spaces, clients = (columns[table] for table in SOURCE_TABLES)
+    if 'ad_space_id' in ads:
+        client = 'c.name' if 'client_id' in ads and clients else 'NULL'
+        joins = 'JOIN ad_spaces s ON a.ad_space_id = s.id'
+        if client != 'NULL':
+            joins += ' JOIN clients c ON a.client_id = c.id'
+        select = f's.location, s.width, s.height, {client} as client_name'
+    else:
+        # Emplacement porté par la publicité; taille de l'espace du même emplacement
+        size = ('(SELECT s.{0} FROM ad_spaces s WHERE s.location = a.position ORDER BY s.id LIMIT 1)'
+                if {'location', 'width', 'height'} <= spaces else 'NULL')
+        joins = ''
+        select = f"a.position as location, {size.format('width')} as width, {size.format('height')} as height"
+    return f'''
+        SELECT a.*, {select}
+        FROM advertisements a
+        {joins}
+        WHERE a.status = 'active'
+        -- Statuts tenus à jour par lifecycle_scheduler; les dates couvrent
+        -- les minutes entre minuit et son prochain passage
+        AND a.start_date <= ?
+        AND a.end_date >= ?
+        ORDER BY a.created_at DESC
+    '''
+
+
+def normalize_ad(ad):
+    """Fill the template field names from the columns of a position-keyed ad"""
+    if 'ad_title' in ad:
+        ad.setdefault('title', ad['ad_title'])
+    if 'media_type' in ad and 'content_type' not in ad:
+        is_image = ad['media_type'] == 'image' and ad.get('media_url')
+        ad['content_type'] = 'image' if is_image else 'html'
+        ad['image_url'] = ad.get('media_url') if is_image else None
+        ad['html_content'] = None if is_image else ad.get('ad_content')
+    ad.setdefault('target_url', None)
+    return ad
+
+
+class AdServingIndex:
+    """Active ads pre-filtered by status and flight dates, keyed by location"""
+
+    def __init__(self, db_manager, watcher):
+        self.db = db_manager
+        self.watcher = watcher
+        self.by_location = {}
+        self.by_id = {}
+        self.built_for = None      # date the index was filtered for
+        self.built_version = None  # data_version the index was built from
+        self.signature = None
+        self.queries = None        # (signature, active ads) for this database's schema
+        self.dirty = True
+        self.lock = threading.Lock()
+        self.rebuilds = 0
+        self.last_build_time = 0
+
+    def is_stale(self):
+        return (self.dirty or self.built_for != date.today()
+                or self.built_version != self.watcher.version())
+
+    def resolve_queries(self, cursor):
+        if self.queries is None:
+            columns = {table: table_columns(cursor, table) for table in SOURCE_TABLES}
+            self.queries = (signature_query(columns), active_ads_query(columns))
+        return self.queries
+
+    def read_signature(self, cursor):
+        cursor.execute(self.resolve_queries(cursor)[0])
+        return tuple(cursor.fetchone())
+
+    def invalidate(self):
+        """Rebuild on next lookup (called after admin writes)"""
+        self.dirty = True
+        self.watcher.force_check()
+
+    def rebuild(self):
+        start = time.perf_counter()
+        today = date.today()
+        # Read the version first so a commit racing the query triggers another rebuild
+        version = self.watcher.version()
+
+        conn = self.db.get_connection()
+        try:
+            cursor = conn.cursor()
+            signature = self.read_signature(cursor)
+            if (signature == self.signature and self.built_for == today
+                    and not self.dirty):
+                # Only counters changed since the last build
+                self.built_version = version
+                return
+            self.dirty = False
+            cursor.execute(self.resolve_queries(cursor)[1], (today, today))
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
+
+        by_location = {}
+        by_id = {}
+        for row in rows:
+            ad = normalize_ad(dict(row))
+            by_location.setdefault(ad['location'], []).append(ad)
+            by_id[ad['id']] = ad
+
+        self.by_location = {location: tuple(ads) for location, ads in by_location.items()}
+        self.by_id = by_id
+        self.built_for = today
+        self.built_version = version
+        self.signature = signature
+        self.rebuilds += 1
+        self.last_build_time = time.perf_counter() - start
+
+    def ensure_fresh(self):
+        if self.is_stale():
+            with self.lock:
+                if self.is_stale():
+                    self.rebuild()
+
+    def get_ads(self, locations):
+        """{location: [ad, ...]} for the requested locations (ads are shared, read-only)"""
+        self.ensure_fresh()
+        by_location = self.by_location
+        return {location: list(by_location[location]) for location in locations if location in by_location}
+
+    def get_ad(self, ad_id):
+        """An active ad by id, or None"""
+        self.ensure_fresh()
+        return self.by_id.get(ad_id)
+
+    def get_stats(self):
+        return {
+            'locations': {location: len(ads) for location, ads in self.by_location.items()},
+            'ads': len(self.by_id),
+            'built_for': self.built_for.isoformat() if self.built_for else None,
+            'rebuilds': self.rebuilds,
+            'last_build_time': self.last_build_time
+        }
@@ -0,0 +1,137 @@
+"""
+Ad performance reports read from the pre-aggregated rollups
+
+Each granularity maps to one rollup table (ad_stats_hourly, ad_stats for days,
+ad_stats_monthly), so a report over any range reads at most one row per
+period and never sums raw events. Unique reach comes from the daily
+HyperLogLog sketches of ad_reach, merged over each period and over the whole
+range; frequency is impressions per unique visitor. Rows can be returned as
+JSON or streamed as CSV for clients with long histories.
+"""
+import csv
+import io
+from datetime import date, datetime, timedelta
+
+from hyperloglog import HyperLogLog
+
+DEFAULT_RANGE_DAYS = 30
+
+# granularity -> (period expression, table, period column used for filtering)
+GRANULARITIES = {
+    'hour': ("date || ' ' || printf('%02d:00', hour)", 'ad_stats_hourly', 'date'),
+    'day': ('date', 'ad_stats', 'date'),
+    'month': ('month', 'ad_stats_monthly', 'month'),
+}
+
+CSV_COLUMNS = ('period', 'impressions', 'clicks', 'ctr', 'uniques', 'frequency')
+
+
+def parse_report_args(args):
+    """(start, end, granularity) from the query string; raises ValueError"""
+    granularity = args.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Granularité invalide: {granularity}")
+
+    end = datetime.strptime(args['to'], '%Y-%m-%d').date() if args.get('to') else date.today()
+    start = (datetime.strptime(args['from'], '%Y-%m-%d').date() if args.get('from')
+             else end - timedelta(days=DEFAULT_RANGE_DAYS - 1))
+    if start > end:
+        raise ValueError('La date de début est postérieure à la date de fin')
+    return start, end, granularity
+
+
+def iter_report_rows(conn, ad_id, start, end, granularity):
+    """Yield (period, impressions, clicks) for each period with activity"""
+    period, table, column = GRANULARITIES[granularity]
+    if granularity == 'month':
+        low, high = start.strftime('%Y-%m'), end.strftime('%Y-%m')
+    else:
+        low, high = start.isoformat(), end.isoformat()
+
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT {period} AS period, impressions, clicks
+        FROM {table}
+        WHERE advertisement_id = ? AND {column} BETWEEN ? AND ?
+        ORDER BY {column}{', hour' if granularity == 'hour' else ''}
+    ''', (ad_id, low, high))
+    for row in cursor:
+        yield row['period'], row['impressions'] or 0, row['clicks'] or 0
+
+
+def ctr(impressions, clicks):
+    return round(clicks * 100.0 / impressions, 2) if impressions else 0.0
+
+
+def frequency(impressions, uniques):
+    return round(impressions / uniques, 2) if uniques else None
+
+
+def load_reach(conn, ad_id, start, end, granularity):
+    """{'YYYY-MM-DD': HyperLogLog} for the days covered by the report periods"""
+    if granularity == 'month':
+        start = start.replace(day=1)
+        end = (end.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT date, sketch FROM ad_reach
+        WHERE advertisement_id = ? AND date BETWEEN ? AND ?
+    ''', (ad_id, start.isoformat(), end.isoformat()))
+    return {row['date']: HyperLogLog.from_bytes(row['sketch']) for row in cursor.fetchall()}
+
+
+def period_uniques(sketches, period, granularity):
+    """Estimated uniques of one period (None below daily resolution or without sketches)"""
+    if granularity == 'day':
+        days = [sketches[period]] if period in sketches else []
+    elif granularity == 'month':
+        days = [sketch for day, sketch in sketches.items() if day.startswith(period)]
+    else:
+        return None
+    return HyperLogLog.union(days).count() if days else None
+
+
+def report_rows(conn, ad_id, start, end, granularity, sketches):
+    for period, impressions, clicks in iter_report_rows(conn, ad_id, start, end, granularity):
+        uniques = period_uniques(sketches, period, granularity)
+        yield {'period': period, 'impressions': impressions, 'clicks': clicks,
+               'ctr': ctr(impressions, clicks), 'uniques': uniques,
+               'frequency': frequency(impressions, uniques)}
+
+
+def build_report(conn, ad_id, start, end, granularity):
+    """JSON-ready report with per-period rows and totals"""
+    sketches = load_reach(conn, ad_id, start, end, granularity)
+    rows = list(report_rows(conn, ad_id, start, end, granularity, sketches))
+    total_impressions = sum(row['impressions'] for row in rows)
+    total_clicks = sum(row['clicks'] for row in rows)
+    uniques = HyperLogLog.union(sketches.values()).count() if sketches else None
+    return {
+        'advertisement_id': ad_id,
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'granularity': granularity,
+        'rows': rows,
+        'totals': {'impressions': total_impressions, 'clicks': total_clicks,
+                   'ctr': ctr(total_impressions, total_clicks),
+                   'uniques': uniques, 'frequency': frequency(total_impressions, uniques)}
+    }
+
+
+def stream_report_csv(db_manager, ad_id, start, end, granularity, chunk_rows=500):
+    """Generator of CSV chunks; owns its connection for the lifetime of the stream"""
+    conn = db_manager.get_connection()
+    try:
+        sketches = load_reach(conn, ad_id, start, end, granularity)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(CSV_COLUMNS)
+        for count, row in enumerate(report_rows(conn, ad_id, start, end, granularity, sketches), 1):
+            writer.writerow([row[column] for column in CSV_COLUMNS])
+            if count % chunk_rows == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    finally:
+        conn.close()
@@ -0,0 +1,204 @@
+"""
+Weighted ad rotation, pacing and frequency capping per ad space
+
+For each slot (ad space location) one ad is drawn among the active ads of the
+ad-serving index, by weighted random choice over cumulative weights (binary
+search with bisect). Ads with a booked `impressions_target` are paced evenly
+over the remaining days of their flight: an ad that reached its daily goal is
+left out, and ahead/behind-schedule ads have their weight scaled down/up.
+`frequency_cap` limits how many times a visitor (identified by the `lca_vid`
+cookie) sees an ad per day, counted from the impression beacons. Everything
+is decided in memory; the only query is a refresh of delivered impressions
+once a minute.
+"""
+import bisect
+import itertools
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import date, datetime
+
+from flask import request, g
+
+VISITOR_COOKIE = 'lca_vid'
+VISITOR_COOKIE_MAX_AGE = 365 * 24 * 3600
+DELIVERY_REFRESH_INTERVAL = 60
+MAX_TRACKED_VISITORS = 100000
+# Emplacements demandés par une page à /api/ads/slots
+MAX_SLOTS_PER_REQUEST = 8
+# Bounds of the pacing factor applied to an ad's weight
+MIN_PACING_FACTOR = 0.25
+MAX_PACING_FACTOR = 4.0
+
+
+def ensure_selection_schema(conn):
+    """Add the delivery columns of advertisements if missing"""
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(advertisements)')}
+    for column, definition in (('weight', 'REAL DEFAULT 1'),
+                               ('impressions_target', 'INTEGER'),
+                               ('frequency_cap', 'INTEGER')):
+        if columns and column not in columns:
+            conn.execute(f'ALTER TABLE advertisements ADD COLUMN {column} {definition}')
+    conn.commit()
+
+
+def get_visitor_id():
+    """Visitor id from the lca_vid cookie, created on first visit"""
+    visitor_id = g.get('visitor_id')
+    if visitor_id is None:
+        visitor_id = request.cookies.get(VISITOR_COOKIE)
+        if not visitor_id or len(visitor_id) != 32:
+            visitor_id = uuid.uuid4().hex
+            g.new_visitor_id = True
+        g.visitor_id = visitor_id
+    return visitor_id
+
+
+class FrequencyCaps:
+    """Per-visitor daily impression counts, bounded LRU in memory"""
+
+    def __init__(self, max_visitors=MAX_TRACKED_VISITORS):
+        self.max_visitors = max_visitors
+        self.visitors = OrderedDict()   # visitor -> (day, {ad_id: count})
+        self.lock = threading.Lock()
+
+    def counts(self, visitor, day):
+        with self.lock:
+            entry = self.visitors.get(visitor)
+            if entry is None or entry[0] != day:
+                return {}
+            self.visitors.move_to_end(visitor)
+            return entry[1]
+
+    def record(self, visitor, day, ad_id):
+        with self.lock:
+            entry = self.visitors.get(visitor)
+            if entry is None or entry[0] != day:
+                entry = (day, {})
+                self.visitors[visitor] = entry
+                if len(self.visitors) > self.max_visitors:
+                    self.visitors.popitem(last=False)
+            self.visitors.move_to_end(visitor)
+            entry[1][ad_id] = entry[1].get(ad_id, 0) + 1
+
+
+class AdSelector:
+    """Chooses which active ad fills each slot of a page"""
+
+    def __init__(self, ad_index, db_manager, rng=None):
+        self.index = ad_index
+        self.db = db_manager
+        self.rng = rng or random.Random()
+        self.caps = FrequencyCaps()
+        self.lock = threading.Lock()
+        # Pacing state: delivered impressions read from the database, plus local picks since
+        self.delivered_day = None
+        self.delivered_before_today = {}   # ad_id -> lifetime impressions before today
+        self.delivered_today = {}          # ad_id -> impressions today at last refresh
+        self.served_since_refresh = {}     # ad_id -> picks by this process since refresh
+        self.refreshed_at = 0
+
+    def refresh_delivery(self, today):
+        """Reload delivered impressions of paced ads (once a minute)"""
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT a.id, a.impressions, COALESCE(s.impressions, 0) AS today
+            FROM advertisements a
+            LEFT JOIN ad_stats s ON s.advertisement_id = a.id AND s.date = ?
+            WHERE a.status = 'active' AND a.impressions_target IS NOT NULL
+        ''', (today,))
+        rows = cursor.fetchall()
+        conn.close()
+
+        self.delivered_before_today = {row['id']: (row['impressions'] or 0) - row['today'] for row in rows}
+        self.delivered_today = {row['id']: row['today'] for row in rows}
+        self.served_since_refresh = {}
+        self.delivered_day = today
+        self.refreshed_at = time.monotonic()
+
+    def ensure_delivery(self, today):
+        if self.delivered_day != today or time.monotonic() - self.refreshed_at > DELIVERY_REFRESH_INTERVAL:
+            with self.lock:
+                if self.delivered_day != today or time.monotonic() - self.refreshed_at > DELIVERY_REFRESH_INTERVAL:
+                    self.refresh_delivery(today)
+
+    def daily_goal(self, ad, today):
+        """Impressions the ad should get today to meet its target at the end of its flight"""
+        end_date = datetime.strptime(str(ad['end_date'])[:10], '%Y-%m-%d').date()
+        days_left = max(1, (end_date - today).days + 1)
+        remaining = ad['impressions_target'] - self.delivered_before_today.get(ad['id'], 0)
+        return max(0, remaining) / days_left
+
+    def effective_weight(self, ad, today, day_fraction):
+        weight = ad.get('weight')
+        weight = 1.0 if weight is None else float(weight)
+        if weight <= 0 or not ad.get('impressions_target'):
+            return max(weight, 0)
+
+        goal = self.daily_goal(ad, today)
+        delivered = self.delivered_today.get(ad['id'], 0) + self.served_since_refresh.get(ad['id'], 0)
+        if delivered >= goal:
+            return 0
+        expected = goal * day_fraction
+        factor = (expected + 1) / (delivered + 1)
+        return weight * min(MAX_PACING_FACTOR, max(MIN_PACING_FACTOR, factor))
+
+    def choose(self, weights):
+        """Index of a weighted random pick: bisect over cumulative weights"""
+        cumulative = list(itertools.accumulate(weights))
+        total = cumulative[-1] if cumulative else 0
+        if total <= 0:
+            return None
+        return bisect.bisect_right(cumulative, self.rng.random() * total)
+
+    def select(self, locations, visitor=None, per_slot=1):
+        """{location: [ad, ...]} with at most `per_slot` ads per location"""
+        ads = self.index.get_ads(locations)
+        today = date.today()
+        day_key = today.isoformat()
+        now = datetime.now()
+        day_fraction = max(0.05, (now.hour * 3600 + now.minute * 60 + now.second) / 86400)
+        if any(ad.get('impressions_target') for location_ads in ads.values() for ad in location_ads):
+            self.ensure_delivery(day_key)
+        seen = self.caps.counts(visitor, day_key) if visitor else {}
+
+        selected = {}
+        for location, candidates in ads.items():
+            candidates = [ad for ad in candidates
+                          if not (ad.get('frequency_cap') and seen.get(ad['id'], 0) >= ad['frequency_cap'])]
+            weights = [self.effective_weight(ad, today, day_fraction) for ad in candidates]
+
+            chosen = []
+            while candidates and len(chosen) < per_slot:
+                position = self.choose(weights)
+                if position is None:
+                    break
+                chosen.append(candidates.pop(position))
+                del weights[position]
+
+            if chosen:
+                selected[location] = chosen
+                # Même verrou que refresh_delivery: aucune diffusion perdue entre threads ou au rechargement
+                with self.lock:
+                    for ad in chosen:
+                        self.served_since_refresh[ad['id']] = self.served_since_refresh.get(ad['id'], 0) + 1
+        return selected
+
+    def record_view(self, ad, visitor):
+        """Count a confirmed view of a capped ad against the visitor's daily cap"""
+        if visitor and ad.get('frequency_cap'):
+            self.caps.record(visitor, date.today().isoformat(), ad['id'])
+
+
+def init_ad_selection(app):
+    """Set the lca_vid visitor cookie on responses to new visitors"""
+    @app.after_request
+    def set_visitor_cookie(response):
+        if g.get('new_visitor_id'):
+            response.set_cookie(VISITOR_COOKIE, g.visitor_id, max_age=VISITOR_COOKIE_MAX_AGE,
+                                httponly=True, samesite='Lax',
+                                secure=app.config.get('PREFERRED_URL_SCHEME') == 'https')
+        return response
@@ -0,0 +1,262 @@
+"""
+Append-only analytics events with daily rollups
+
+track(event_type, data) queues an event in memory and returns immediately;
+the writer thread of ActivityLogWriter appends queued events in batches to
+one table per UTC day, `analytics_events_YYYYMMDD`. Day partitions keep
+every insert an append to a small table, let the rollup read exactly one
+day, and make retention a DROP TABLE instead of a large DELETE. (The
+`analytics` table of models.py is left as is; nothing wrote to it.)
+
+A scheduled rollup recounts today and yesterday into `analytics_daily`
+(date, event_type, category -> events, distinct visitors), which is what the
+dashboard reads:
+
+    page_view      public HTML pages, category = video category or endpoint
+    video_play     trackVideoPlay() in base.html, called by the players of
+                   the home, videos, emissions and journal pages, through
+                   POST /api/analytics/events
+    ad_impression  confirmed by the ad beacon, category = slot
+    ad_click       category = ad position
+"""
+import json
+import re
+from datetime import datetime, timedelta
+
+from flask import g, jsonify, request, url_for
+
+from activity_log import ActivityLogWriter
+from ad_beacons import is_automated_request
+from ad_selection import VISITOR_COOKIE
+from row_mapping import fetch_records
+
+ROLLUP_INTERVAL = 600
+RETENTION_DAYS = 90
+PARTITION_PREFIX = 'analytics_events_'
+PARTITION_NAME = re.compile(r'^analytics_events_(\d{8})$')
+CLIENT_EVENTS = ('video_play',)
+MAX_CLIENT_EVENTS = 20
+MAX_CLIENT_BYTES = 4096
+UNTRACKED_ENDPOINTS = ('static', 'login', 'logout', 'dashboard', 'uploaded_file', 'health_check', 'debug_info')
+UNTRACKED_PATH_PREFIXES = ('/dashboard', '/admin', '/api/')
+
+
+def ensure_analytics_schema(conn):
+    """Create the daily rollup table"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS analytics_daily (
+            date TEXT NOT NULL,
+            event_type TEXT NOT NULL,
+            category TEXT NOT NULL DEFAULT '',
+            events INTEGER NOT NULL DEFAULT 0,
+            visitors INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (date, event_type, category)
+        ) WITHOUT ROWID
+    ''')
+    conn.commit()
+
+
+def partition_name(day):
+    """Table holding the events of a UTC day ('YYYYMMDD')"""
+    if not day.isdigit() or len(day) != 8:
+        raise ValueError(f"Invalid partition day: {day}")
+    return PARTITION_PREFIX + day
+
+
+class AnalyticsTracker(ActivityLogWriter):
+    """Buffered analytics events appended to one table per day"""
+
+    name = 'analytics'
+
+    def __init__(self, db_manager, retention_days=RETENTION_DAYS, **kwargs):
+        super().__init__(db_manager, **kwargs)
+        self.retention_days = retention_days
+        self.partitions = set()
+        self.tracked = {}
+        self.rollups = 0
+        self.last_rollup_time = 0
+
+    def track(self, event_type, data=None, visitor=None):
+        """Queue one event; `data['category']` is what the rollup groups by"""
+        now = datetime.utcnow()
+        data = data or {}
+        category = data.get('category')
+        row = (now.strftime('%Y%m%d'), event_type, str(category) if category is not None else None, visitor,
+               json.dumps(data, separators=(',', ':'), default=str) if data else None,
+               now.strftime('%Y-%m-%d %H:%M:%S'))
+        self.tracked[event_type] = self.tracked.get(event_type, 0) + 1
+        return self.enqueue(row)
+
+    def ensure_partition(self, conn, day):
+        table = partition_name(day)
+        if table not in self.partitions:
+            conn.execute(f'''
+                CREATE TABLE IF NOT EXISTS {table} (
+                    id INTEGER PRIMARY KEY,
+                    event_type TEXT NOT NULL,
+                    category TEXT,
+                    visitor TEXT,
+                    event_data TEXT,
+                    created_at TEXT NOT NULL
+                )
+            ''')
+            self.partitions.add(table)
+        return table
+
+    def write_batch(self, conn, batch):
+        by_day = {}
+        for day, *row in batch:
+            by_day.setdefault(day, []).append(row)
+        for day, rows in by_day.items():
+            table = self.ensure_partition(conn, day)
+            conn.executemany(f'''
+                INSERT INTO {table} (event_type, category, visitor, event_data, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', rows)
+
+    def requeue(self, batch):
+        # Une table créée dans la transaction annulée n'existe plus
+        self.partitions.clear()
+        super().requeue(batch)
+
+    def existing_partitions(self, conn):
+        names = (row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ?", (PARTITION_PREFIX + '%',)))
+        return sorted(name for name in names if PARTITION_NAME.match(name))
+
+    def rollup(self, days=None):
+        """Recount the given days ('YYYYMMDD', default today and yesterday) into analytics_daily"""
+        start = datetime.utcnow()
+        if days is None:
+            days = [(start - timedelta(days=offset)).strftime('%Y%m%d') for offset in (1, 0)]
+        self.flush()
+
+        rolled = 0
+        with self.db.transaction() as conn:
+            existing = set(self.existing_partitions(conn))
+            for day in days:
+                table = partition_name(day)
+                if table not in existing:
+                    continue
+                date = f'{day[:4]}-{day[4:6]}-{day[6:]}'
+                conn.execute('DELETE FROM analytics_daily WHERE date = ?', (date,))
+                conn.execute(f'''
+                    INSERT INTO analytics_daily (date, event_type, category, events, visitors)
+                    SELECT ?, event_type, COALESCE(category, ''), COUNT(*), COUNT(DISTINCT visitor)
+                    FROM {table}
+                    GROUP BY event_type, COALESCE(category, '')
+                ''', (date,))
+                rolled += 1
+        self.rollups += 1
+        self.last_rollup_time = (datetime.utcnow() - start).total_seconds()
+        return rolled
+
+    def purge(self, retention_days=None):
+        """Drop day partitions older than the retention period (rollups are kept)"""
+        retention_days = self.retention_days if retention_days is None else retention_days
+        cutoff = PARTITION_PREFIX + (datetime.utcnow() - timedelta(days=retention_days)).strftime('%Y%m%d')
+        conn = self.db.get_connection()
+        try:
+            expired = [name for name in self.existing_partitions(conn) if name < cutoff]
+            for name in expired:
+                conn.execute(f'DROP TABLE IF EXISTS {name}')
+                self.partitions.discard(name)
+            conn.commit()
+        finally:
+            conn.close()
+        self.purged += len(expired)
+        return len(expired)
+
+    def daily(self, days=30, event_type=None):
+        """Rolled-up rows of the last `days` days, newest first"""
+        since = (datetime.utcnow() - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+        query = 'SELECT date, event_type, category, events, visitors FROM analytics_daily WHERE date >= ?'
+        params = [since]
+        if event_type:
+            query += ' AND event_type = ?'
+            params.append(event_type)
+        query += ' ORDER BY date DESC, event_type, events DESC'
+        conn = self.db.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            return fetch_records(cursor, 'AnalyticsDay')
+        finally:
+            conn.close()
+
+    def totals(self, date=None):
+        """event_type -> events for one day (default: today, as of the last rollup)"""
+        date = date or datetime.utcnow().strftime('%Y-%m-%d')
+        conn = self.db.get_connection()
+        try:
+            rows = conn.execute('''
+                SELECT event_type, SUM(events) FROM analytics_daily WHERE date = ? GROUP BY event_type
+            ''', (date,)).fetchall()
+        finally:
+            conn.close()
+        return {event_type: events for event_type, events in rows}
+
+    def get_stats(self):
+        stats = super().get_stats()
+        stats.update({
+            'tracked': dict(self.tracked),
+            'rollups': self.rollups,
+            'last_rollup_time': self.last_rollup_time,
+            'retention_days': self.retention_days,
+        })
+        return stats
+
+
+def current_visitor():
+    # Lecture seule: pas de nouveau cookie sur des pages publiques mises en cache
+    return g.get('visitor_id') or request.cookies.get(VISITOR_COOKIE)
+
+
+def init_analytics(app, tracker, is_staff=None):
+    """Track public page views and accept player events on POST /api/analytics/events
+
+    `is_staff()` is true for a logged-in admin, whose browsing is not counted.
+    """
+
+    def is_public_page(response):
+        endpoint = request.endpoint
+        return (request.method == 'GET' and response.status_code == 200 and response.mimetype == 'text/html'
+                and endpoint and endpoint not in UNTRACKED_ENDPOINTS
+                and not request.path.startswith(UNTRACKED_PATH_PREFIXES)
+                and not is_automated_request(request.headers)
+                and not (is_staff and is_staff()))
+
+    @app.after_request
+    def track_page_view(response):
+        if is_public_page(response):
+            category = (request.view_args or {}).get('category') or request.endpoint
+            tracker.track('page_view', {'category': category, 'path': request.path}, current_visitor())
+        return response
+
+    @app.route('/api/analytics/events', methods=['POST'])
+    def analytics_events():
+        """Événements envoyés par le lecteur vidéo (navigator.sendBeacon)"""
+        if is_automated_request(request.headers) or (is_staff and is_staff()):
+            return '', 204
+        if (request.content_length or 0) > MAX_CLIENT_BYTES:
+            return jsonify({'success': False, 'error': 'Requête trop volumineuse'}), 413
+        try:
+            payload = json.loads(request.get_data(cache=False, as_text=True) or '{}')
+            events = payload.get('events', [])
+            if not isinstance(events, list) or len(events) > MAX_CLIENT_EVENTS:
+                raise ValueError('events must be a list of at most %d items' % MAX_CLIENT_EVENTS)
+        except (ValueError, AttributeError) as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+        visitor = current_visitor()
+        for event in events:
+            if not isinstance(event, dict) or event.get('type') not in CLIENT_EVENTS:
+                continue
+            data = {key: str(event[key])[:100] for key in ('category', 'video_id') if event.get(key)}
+            tracker.track(event['type'], data, visitor)
+        return '', 204
+
+    # URL du beacon pour trackVideoPlay() de base.html
+    app.jinja_env.globals['analytics_events_url'] = lambda: url_for('analytics_events')
+    app.extensions['analytics'] = tracker
+    return tracker
@@ -4,7 +4,7 @@ LCA TV - Complete Admin Backend Application
 Full-featured dashboard with user management, publicity, videos, articles, and more
 """
 
-from flask import Flask, render_template, jsonify, request, session, redirect, url_for, flash, send_from_directory
+from flask import Flask, render_template, jsonify, request, session, redirect, url_for, flash
 import requests
 import os
 from datetime import datetime, timedelta
@@ -21,6 +21,13 @@ import mimetypes
 from PIL import Image
 import io
 
+from image_derivatives import init_image_derivatives
+from asset_manifest import init_asset_manifest
+from media_jobs import init_media_jobs
+from db_pool import init_db_pool
+from upload_serving import send_upload
+from json_provider import init_json_provider
+
 # Import our models
 from models import (
     db_manager, user_manager, publicity_manager, video_manager, 
@@ -37,6 +44,21 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+# Responsive image helpers (srcset/sizes) for templates
+init_image_derivatives(app)
+
+# Content-hashed static URLs served with Cache-Control: immutable
+init_asset_manifest(app)
+
+# Uploaded images are validated and resized by background workers
+media_jobs = init_media_jobs(app, db_manager)
+
+# Pooled per-thread connections are reset at the end of every request
+init_db_pool(app, db_manager.pool)
+
+# jsonify() serializes the row records returned by the managers
+init_json_provider(app)
+
 # Configuration
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'lcatv-admin-secret-key-change-me')
 app.config['DEBUG'] = os.environ.get('FLASK_ENV') == 'development'
@@ -156,7 +178,7 @@ def save_uploaded_file(file, description=''):
     file_size = os.path.getsize(file_path)
     mime_type = mimetypes.guess_type(file_path)[0]
     
-    # For images, get dimensions
+    # For images, get dimensions (header only; decoding happens in the background job)
     dimensions = None
     if file_type == 'image':
         try:
@@ -180,6 +202,12 @@ def save_uploaded_file(file, description=''):
     conn.commit()
     conn.close()
     
+    # Dimensions, thumbnail and optimized variants are computed in the background
+    job_id = None
+    if file_type == 'image':
+        job_id = media_jobs.enqueue('media_upload', file_path, media_id=media_id,
+                                    uploaded_by=session.get('user_id', 1))
+    
     return {
         'id': media_id,
         'filename': unique_filename,
@@ -188,7 +216,8 @@ def save_uploaded_file(file, description=''):
         'file_type': file_type,
         'file_size': file_size,
         'mime_type': mime_type,
-        'dimensions': dimensions
+        'dimensions': dimensions,
+        'job_id': job_id
     }
 
 # Routes
@@ -554,11 +583,12 @@ def api_media():
             SELECT m.*, u.username as uploaded_by_username
             FROM media_files m
             LEFT JOIN users u ON m.uploaded_by = u.id
+            WHERE m.parent_id IS NULL
         '''
         params = []
         
         if file_type:
-            query += ' WHERE m.file_type = ?'
+            query += ' AND m.file_type = ?'
             params.append(file_type)
         
         query += ' ORDER BY m.created_at DESC'
@@ -601,6 +631,15 @@ def api_upload_media():
         logger.error(f"Upload media error: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/admin/media/jobs/<int:job_id>')
+@login_required
+def api_media_job(job_id):
+    """Status of a background media processing job"""
+    job = media_jobs.get_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
 # Settings APIs
 
 @app.route('/api/admin/settings')
@@ -635,7 +674,7 @@ def api_save_settings():
 @app.route('/static/uploads/<path:filename>')
 def uploaded_file(filename):
     """Serve uploaded files"""
-    return send_from_directory(UPLOAD_FOLDER, filename)
+    return send_upload(UPLOAD_FOLDER, filename)
 
 # Error handlers
 
@@ -4,7 +4,7 @@ LCA TV - Application Avancée avec Système de Gestion Complet
 Gestion des utilisateurs, clients, publicités et espaces publicitaires
 """
 
-from flask import Flask, render_template, jsonify, request, session, redirect, url_for, flash, send_from_directory
+from flask import Flask, render_template, jsonify, request, session, redirect, url_for, flash, Response, stream_with_context, get_template_attribute
 import requests
 import os
 import json
@@ -19,6 +19,31 @@ import uuid
 from PIL import Image
 import base64
 
+from cache_layer import cache
+from page_cache import page_cache, cached_page
+from image_derivatives import init_image_derivatives
+from asset_manifest import init_asset_manifest
+from fragment_cache import init_fragment_cache, render_stats
+from media_jobs import init_media_jobs
+from upload_serving import send_upload
+from data_version import DataVersionWatcher
+from ad_index import AdServingIndex
+from ad_counters import AdCounterAggregator, ClickDeduplicator
+from ad_reports import parse_report_args, build_report, stream_report_csv
+from ad_beacons import parse_beacon, is_automated_request, ServeTokens, MAX_BEACON_BYTES
+from ad_selection import AdSelector, get_visitor_id, init_ad_selection, VISITOR_COOKIE, MAX_SLOTS_PER_REQUEST
+from lifecycle_scheduler import init_lifecycle_scheduler
+from dashboard_counters import DashboardCounters, RECONCILE_INTERVAL
+from migrations import migrate
+from activity_log import ActivityLogWriter
+from settings_snapshot import SettingsSnapshot
+from db_pool import ConnectionPool, init_db_pool
+from row_mapping import Projection, fetch_records
+from json_provider import init_json_provider
+from search_index import init_search
+from analytics_events import AnalyticsTracker, init_analytics, ROLLUP_INTERVAL
+from db_backup import DatabaseBackup, BACKUP_INTERVAL
+
 app = Flask(__name__)
 
 # Configuration
@@ -44,6 +69,18 @@ YOUTUBE_API_KEY = os.environ.get('YOUTUBE_API_KEY', 'AIzaSyC-9RCCz6mRrNWbUBhmrp3
 YOUTUBE_CHANNEL_ID = os.environ.get('YOUTUBE_CHANNEL_ID', 'UCkquZjmd6ubRQh2W2YpbSLQ')
 YOUTUBE_LIVE_VIDEO_ID = os.environ.get('YOUTUBE_LIVE_VIDEO_ID', 'ixQEmhTbvTI')
 
+# Helpers Jinja pour les images responsives (srcset WebP/AVIF)
+init_image_derivatives(app)
+
+# URLs statiques versionnées (?v=<hash>) servies avec Cache-Control: immutable
+init_asset_manifest(app)
+
+# Blocs {% cache %} dans les templates et mesure des temps de rendu
+init_fragment_cache(app)
+
+# jsonify() sérialise les enregistrements de row_mapping (orjson si installé)
+init_json_provider(app)
+
 # Extensions de fichiers autorisées
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
@@ -55,18 +92,26 @@ class DatabaseManager:
     
     def __init__(self, db_path='lca_tv.db'):
         self.db_path = db_path
+        # Une connexion réglée (WAL, mmap, cache) par thread, réutilisée d'un appel à l'autre
+        self.pool = ConnectionPool(db_path)
         self.init_database()
     
     def get_connection(self):
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+        return self.pool.get_connection()
+    
+    def transaction(self):
+        return self.pool.transaction()
     
     def init_database(self):
         """Initialiser la base de données avec toutes les tables"""
         # Ne pas créer de nouvelles tables, utiliser la base existante
         # Juste s'assurer que l'utilisateur admin existe
         self.ensure_admin_user()
+        
+        # Migrations de schéma en attente (colonnes, agrégats, compteurs, index)
+        conn = self.get_connection()
+        migrate(conn)
+        conn.close()
     
     def ensure_admin_user(self):
         """S'assurer que l'utilisateur admin existe"""
@@ -89,6 +134,83 @@ class DatabaseManager:
     
 # Initialiser la base de données
 db_manager = DatabaseManager()
+init_db_pool(app, db_manager.pool)
+
+# Détection des écritures faites par les autres workers (PRAGMA data_version)
+data_version = DataVersionWatcher(db_manager.db_path)
+
+# Pages invalidées quand une vidéo, un article ou un paramètre change (tout worker)
+page_cache.watch(db_manager, 'catalog', 'catalog_version')
+page_cache.watch(db_manager, 'settings', 'settings_version')
+
+# Index en mémoire des publicités actives, par emplacement
+ad_index = AdServingIndex(db_manager, data_version)
+
+# Rotation pondérée, rythme de diffusion et plafonnement par visiteur
+ad_selector = AdSelector(ad_index, db_manager)
+init_ad_selection(app)
+
+# Jetons signés des publicités servies: seul un affichage réel compte une impression
+serve_tokens = ServeTokens(app.config['SECRET_KEY'])
+
+# URLs des emplacements et du beacon d'impressions pour components/ad_display.html
+app.jinja_env.globals['ad_slots_url'] = lambda: url_for('ad_slot_content')
+app.jinja_env.globals['ad_beacon_url'] = lambda: url_for('ad_beacon')
+
+def invalidate_ads():
+    """Reconstruire l'index des publicités (les pages en cache n'en contiennent pas)"""
+    ad_index.invalidate()
+
+# Compteurs d'impressions/clics agrégés en mémoire et écrits par lots
+ad_counters = AdCounterAggregator(db_manager)
+click_deduplicator = ClickDeduplicator()
+
+# Traitement des images uploadées (validation, redimensionnement) en arrière-plan
+media_jobs = init_media_jobs(app, db_manager)
+media_jobs.on_ad_updated = lambda ad_id: invalidate_ads()
+
+# Passage des publicités et abonnements en attente/actif/expiré/archivé à leurs dates
+scheduler, lifecycle = init_lifecycle_scheduler(app, db_manager)
+
+@lifecycle.on_change
+def on_lifecycle_change(table, rows):
+    if table == 'advertisements':
+        invalidate_ads()
+
+# Chiffres du dashboard lus en une requête, recomptés chaque heure
+dashboard_counters = DashboardCounters(db_manager)
+scheduler.add_job('dashboard-reconcile', RECONCILE_INTERVAL, dashboard_counters.reconcile, run_now=False)
+
+# Paramètres du site gardés en mémoire, relus quand leur version change
+settings_snapshot = SettingsSnapshot(db_manager)
+
+# Journal d'activité écrit par lots en arrière-plan, purgé chaque jour
+activity_log = ActivityLogWriter(db_manager)
+scheduler.add_job('activity-log-purge', 24 * 3600, activity_log.purge, run_now=False)
+
+# GET /api/search: recherche plein texte (FTS5) dans les vidéos et les articles
+init_search(app, db_manager)
+
+# Événements analytics écrits par lots dans une table par jour, agrégés par jour
+analytics = init_analytics(app, AnalyticsTracker(db_manager), is_staff=lambda: 'user' in session)
+scheduler.add_job('analytics-rollup', ROLLUP_INTERVAL, analytics.rollup, run_now=False)
+scheduler.add_job('analytics-purge', 24 * 3600, analytics.purge, run_now=False)
+
+# Sauvegarde en ligne quotidienne (backups/), un seul worker à la fois; une
+# sauvegarde de moins de 23 h compte comme faite, même après un redémarrage
+db_backup = DatabaseBackup(db_manager.db_path, min_interval=BACKUP_INTERVAL - 3600)
+scheduler.add_job('db-backup', BACKUP_INTERVAL, db_backup.run)
+
+# Colonnes renvoyées par les listes de l'admin (pas de SELECT *)
+CLIENT_COLUMNS = Projection('clients', (
+    'id', 'name', 'email', 'phone', 'company_name', 'address', 'notes', 'status', 'created_at'), alias='c')
+AD_SPACE_COLUMNS = Projection('ad_spaces', (
+    'id', 'name', 'location', 'width', 'height', 'price_monthly', 'description', 'created_at'), alias='s')
+ADVERTISEMENT_COLUMNS = Projection('advertisements', (
+    'id', 'client_id', 'ad_space_id', 'title', 'content_type', 'image_url', 'target_url',
+    'start_date', 'end_date', 'status', 'impressions', 'clicks', 'created_at'), alias='a')
+ACTIVITY_COLUMNS = Projection('activity_logs', (
+    'id', 'user_id', 'action', 'description', 'ip_address', 'created_at'), alias='l')
 
 def login_required(f):
     """Decorator pour les routes admin"""
@@ -107,27 +229,20 @@ def log_activity(action, description=None, user_id=None):
     if not user_id:
         user_id = session.get('user_id')
     
-    conn = db_manager.get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        INSERT INTO activity_logs (user_id, action, description, ip_address, user_agent)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (user_id, action, description, request.remote_addr, request.headers.get('User-Agent')))
-    
-    conn.commit()
-    conn.close()
+    # Mis en file: écrit par le thread du journal, hors du temps de la requête
+    activity_log.log(action, description, user_id, request.remote_addr, request.headers.get('User-Agent'))
 
 # ============================================================================
 # ROUTES PUBLIQUES DU SITE
 # ============================================================================
 
 @app.route('/')
+@cached_page('catalog', 'settings')
 def home():
     """Page d'accueil avec publicités intégrées"""
     try:
-        # Charger les publicités actives pour la page d'accueil
-        ads = get_active_ads_for_location(['header', 'sidebar', 'popup'])
+        # Emplacements publicitaires, remplis pour chaque visiteur hors du cache
+        ad_slots = ['header', 'sidebar', 'popup']
         
         # Simuler des vidéos (à remplacer par l'API YouTube)
         featured_videos = [
@@ -139,27 +254,31 @@ def home():
             }
         ] * 6
         
-        return render_template('home.html', featured_videos=featured_videos, ads=ads)
+        return render_template('home.html', featured_videos=featured_videos, ad_slots=ad_slots)
     except Exception as e:
         print(f"Home page error: {e}")
-        return render_template('home.html', featured_videos=[], ads={})
+        page_cache.skip()
+        return render_template('home.html', featured_videos=[], ad_slots=[])
 
 @app.route('/videos')
+@cached_page('catalog', 'settings')
 def videos():
     """Page des vidéos avec publicités"""
     try:
-        ads = get_active_ads_for_location(['header', 'sidebar-video', 'banner'])
+        ad_slots = ['header', 'sidebar-video', 'banner']
         videos = []  # À implémenter avec l'API YouTube
-        return render_template('videos.html', videos=videos, ads=ads)
+        return render_template('videos.html', videos=videos, ad_slots=ad_slots)
     except Exception as e:
         print(f"Videos page error: {e}")
-        return render_template('videos.html', videos=[], ads={})
+        page_cache.skip()
+        return render_template('videos.html', videos=[], ad_slots=[])
 
 @app.route('/videos/category/<category>')
+@cached_page('catalog', 'settings')
 def videos_by_category(category):
     """Vidéos par catégorie"""
     try:
-        ads = get_active_ads_for_location(['header', 'sidebar-video', 'banner'])
+        ad_slots = ['header', 'sidebar-video', 'banner']
         # Simuler des vidéos par catégorie
         videos = [
             {
@@ -170,173 +289,170 @@ def videos_by_category(category):
                 'published_at': '2024-12-15T19:00:00Z'
             }
         ] * 3
-        return render_template('videos.html', videos=videos, ads=ads, category=category)
+        return render_template('videos.html', videos=videos, ad_slots=ad_slots, category=category)
     except Exception as e:
         print(f"Category videos error: {e}")
-        return render_template('videos.html', videos=[], ads={}, category=category)
+        page_cache.skip()
+        return render_template('videos.html', videos=[], ad_slots=[], category=category)
 
 @app.route('/live')
+@cached_page('settings')
 def live():
     """Page de diffusion en direct avec publicités"""
     try:
-        ads = get_active_ads_for_location(['header', 'sidebar'])
-        return render_template('live.html', ads=ads)
+        ad_slots = ['header', 'sidebar']
+        return render_template('live.html', ad_slots=ad_slots)
     except Exception as e:
         print(f"Live page error: {e}")
-        return render_template('live.html', ads={})
+        page_cache.skip()
+        return render_template('live.html', ad_slots=[])
 
 @app.route('/about')
+@cached_page('settings')
 def about():
     """Page à propos"""
     try:
-        ads = get_active_ads_for_location(['header', 'sidebar'])
-        return render_template('about.html', ads=ads)
+        ad_slots = ['header', 'sidebar']
+        return render_template('about.html', ad_slots=ad_slots)
     except Exception as e:
         print(f"About page error: {e}")
-        return render_template('about.html', ads={})
+        page_cache.skip()
+        return render_template('about.html', ad_slots=[])
 
 @app.route('/contact')
+@cached_page('settings')
 def contact():
     """Page de contact"""
     try:
-        ads = get_active_ads_for_location(['header', 'sidebar'])
-        return render_template('contact.html', ads=ads)
+        ad_slots = ['header', 'sidebar']
+        return render_template('contact.html', ad_slots=ad_slots)
     except Exception as e:
         print(f"Contact page error: {e}")
-        return render_template('contact.html', ads={})
+        page_cache.skip()
+        return render_template('contact.html', ad_slots=[])
 
 @app.route('/emissions')
+@cached_page('catalog', 'settings')
 def emissions():
     """Page des émissions"""
     try:
-        ads = get_active_ads_for_location(['header', 'sidebar-video', 'banner'])
+        ad_slots = ['header', 'sidebar-video', 'banner']
         videos = []  # À implémenter avec l'API YouTube
-        return render_template('emissions.html', videos=videos, ads=ads)
+        return render_template('emissions.html', videos=videos, ad_slots=ad_slots)
     except Exception as e:
         print(f"Emissions page error: {e}")
-        return render_template('emissions.html', videos=[], ads={})
+        page_cache.skip()
+        return render_template('emissions.html', videos=[], ad_slots=[])
 
 @app.route('/publicite')
+@cached_page('settings')
 def publicite():
     """Page publicité"""
     try:
-        ads = get_active_ads_for_location(['header', 'sidebar'])
-        return render_template('publicite.html', ads=ads)
+        ad_slots = ['header', 'sidebar']
+        return render_template('publicite.html', ad_slots=ad_slots)
     except Exception as e:
         print(f"Publicite page error: {e}")
-        return render_template('publicite.html', ads={})
+        page_cache.skip()
+        return render_template('publicite.html', ad_slots=[])
 
 @app.route('/journal')
+@cached_page('catalog', 'settings')
 def journal():
     """Page journal/actualités"""
     try:
-        ads = get_active_ads_for_location(['header', 'sidebar', 'banner'])
+        ad_slots = ['header', 'sidebar', 'banner']
         videos = []  # À implémenter avec l'API YouTube
-        return render_template('journal.html', videos=videos, ads=ads)
+        return render_template('journal.html', videos=videos, ad_slots=ad_slots)
     except Exception as e:
         print(f"Journal page error: {e}")
-        return render_template('journal.html', videos=[], ads={})
+        page_cache.skip()
+        return render_template('journal.html', videos=[], ad_slots=[])
 
 def get_active_ads_for_location(locations):
-    """Récupérer les publicités actives pour des emplacements donnés"""
-    conn = db_manager.get_connection()
-    cursor = conn.cursor()
-    
-    today = datetime.now().date()
-    placeholders = ','.join(['?' for _ in locations])
-    
-    cursor.execute(f'''
-        SELECT a.*, s.location, s.width, s.height, c.name as client_name
-        FROM advertisements a
-        JOIN ad_spaces s ON a.ad_space_id = s.id
-        JOIN clients c ON a.client_id = c.id
-        WHERE s.location IN ({placeholders})
-        AND a.status = 'active'
-        AND a.start_date <= ?
-        AND a.end_date >= ?
-        ORDER BY a.created_at DESC
-    ''', locations + [today, today])
-    
-    ads_data = cursor.fetchall()
-    conn.close()
-    
-    # Organiser les publicités par emplacement
-    ads = {}
-    for ad in ads_data:
-        location = ad['location']
-        if location not in ads:
-            ads[location] = []
-        
-        ad_dict = dict(ad)
-        ads[location].append(ad_dict)
-        
-        # Incrémenter les impressions
-        increment_ad_impressions(ad['id'])
-    
-    return ads
+    """Choisir les publicités à afficher pour des emplacements donnés"""
+    # Les impressions sont comptées par les beacons des publicités réellement vues
+    visitor = get_visitor_id()
+    ads = ad_selector.select(locations, visitor)
+    # Copies: les publicités de l'index sont partagées entre les requêtes
+    return {location: [dict(ad, serve_token=serve_tokens.issue(ad['id'], location, visitor)) for ad in location_ads]
+            for location, location_ads in ads.items()}
+
+@app.route('/api/ads/slots')
+def ad_slot_content():
+    """Publicités des emplacements d'une page, choisies pour ce visiteur (jamais en cache)"""
+    # Seuls les emplacements présents dans l'index sont rendus
+    locations = list(dict.fromkeys(request.args.get('slots', '').split(',')))[:MAX_SLOTS_PER_REQUEST]
+    ads = get_active_ads_for_location(locations)
+    render_ad_space = get_template_attribute('components/ad_display.html', 'render_ad_space')
+    response = jsonify({'slots': {location: str(render_ad_space(location, ads)) for location in ads}})
+    response.headers['Cache-Control'] = 'private, no-store'
+    return response
 
 def increment_ad_impressions(ad_id):
-    """Incrémenter le compteur d'impressions d'une publicité"""
-    conn = db_manager.get_connection()
-    cursor = conn.cursor()
-    
-    today = datetime.now().date()
+    """Incrémenter le compteur d'impressions d'une publicité (écrit par lots)"""
+    ad_counters.record_impression(ad_id, get_visitor_id())
+
+@app.route('/api/ads/beacon', methods=['POST'])
+def ad_beacon():
+    """Impressions visibles envoyées par navigator.sendBeacon"""
+    if is_automated_request(request.headers):
+        return '', 204
+    if (request.content_length or 0) > MAX_BEACON_BYTES:
+        return jsonify({'success': False, 'error': 'Beacon trop volumineux'}), 413
     
-    # Incrémenter dans la table des statistiques
-    cursor.execute('''
-        INSERT OR IGNORE INTO ad_stats (advertisement_id, date, impressions, clicks)
-        VALUES (?, ?, 0, 0)
-    ''', (ad_id, today))
+    visitor = get_visitor_id()
+    try:
+        # Chaque jeton de diffusion ne compte qu'une fois, pour le visiteur qui l'a reçu
+        events = parse_beacon(request.get_data(cache=False, as_text=True), ad_index.get_ad,
+                              redeem=lambda ad, slot, token: serve_tokens.redeem(token, ad['id'], slot, visitor))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     
-    cursor.execute('''
-        UPDATE ad_stats SET impressions = impressions + 1
-        WHERE advertisement_id = ? AND date = ?
-    ''', (ad_id, today))
+    for ad, slot in events:
+        increment_ad_impressions(ad['id'])
+        ad_selector.record_view(ad, visitor)
+        analytics.track('ad_impression', {'category': slot, 'ad_id': ad['id']}, visitor)
     
-    # Incrémenter dans la table des publicités
-    cursor.execute('''
-        UPDATE advertisements SET impressions = impressions + 1
-        WHERE id = ?
-    ''', (ad_id,))
+    return '', 204
+
+def get_ad_target_url(ad_id):
+    """URL de destination d'une publicité, depuis l'index ou le cache"""
+    ad = ad_index.get_ad(ad_id)
+    if ad is not None:
+        return ad['target_url']
     
-    conn.commit()
-    conn.close()
+    # Publicité hors index (expirée, désactivée): une seule requête, puis mise en cache
+    cache_key = f"ad-target:{ad_id}"
+    target_url = cache.get(cache_key)
+    if target_url is None:
+        conn = db_manager.get_connection()
+        cursor = conn.cursor()
+        # SELECT *: la colonne target_url n'existe pas dans toutes les bases
+        cursor.execute('SELECT * FROM advertisements WHERE id = ?', (ad_id,))
+        result = cursor.fetchone()
+        conn.close()
+        target_url = (dict(result).get('target_url') if result else None) or ''
+        cache.set(cache_key, target_url, 300, ('ads',))
+    return target_url
 
 @app.route('/ad-click/<int:ad_id>')
 def ad_click(ad_id):
     """Gérer les clics sur les publicités"""
-    conn = db_manager.get_connection()
-    cursor = conn.cursor()
-    
-    # Récupérer l'URL de destination
-    cursor.execute('SELECT target_url FROM advertisements WHERE id = ?', (ad_id,))
-    result = cursor.fetchone()
+    target_url = get_ad_target_url(ad_id)
     
-    if result and result['target_url']:
-        # Incrémenter les clics
-        today = datetime.now().date()
-        
-        cursor.execute('''
-            INSERT OR IGNORE INTO ad_stats (advertisement_id, date, impressions, clicks)
-            VALUES (?, ?, 0, 0)
-        ''', (ad_id, today))
-        
-        cursor.execute('''
-            UPDATE ad_stats SET clicks = clicks + 1
-            WHERE advertisement_id = ? AND date = ?
-        ''', (ad_id, today))
-        
-        cursor.execute('''
-            UPDATE advertisements SET clicks = clicks + 1
-            WHERE id = ?
-        ''', (ad_id,))
-        
-        conn.commit()
-        conn.close()
-        
-        return redirect(result['target_url'])
+    if target_url:
+        # Clic compté par lots, une seule fois par visiteur sur la fenêtre de déduplication
+        visitor = (request.access_route[0] if request.access_route else request.remote_addr,
+                   request.headers.get('User-Agent', ''))
+        if not click_deduplicator.is_duplicate(ad_id, visitor):
+            ad_counters.record_click(ad_id)
+            ad = ad_index.get_ad(ad_id)
+            analytics.track('ad_click', {'category': ad['location'] if ad else None, 'ad_id': ad_id},
+                            request.cookies.get(VISITOR_COOKIE))
+        
+        return redirect(target_url)
     
-    conn.close()
     return redirect(url_for('home'))
 
 # ============================================================================
@@ -394,42 +510,8 @@ def logout():
 def dashboard():
     """Dashboard administrateur avancé"""
     try:
-        # Statistiques générales
-        conn = db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        # Compter les utilisateurs
-        cursor.execute('SELECT COUNT(*) FROM users WHERE is_active = 1')
-        total_users = cursor.fetchone()[0]
-        
-        # Compter les clients
-        cursor.execute('SELECT COUNT(*) FROM clients WHERE status = "active"')
-        total_clients = cursor.fetchone()[0]
-        
-        # Compter les publicités actives
-        today = datetime.now().date()
-        cursor.execute('''
-            SELECT COUNT(*) FROM advertisements 
-            WHERE status = "active" AND start_date <= ? AND end_date >= ?
-        ''', (today, today))
-        total_ads = cursor.fetchone()[0]
-        
-        # Calculer les revenus mensuels
-        cursor.execute('''
-            SELECT SUM(price) FROM subscriptions 
-            WHERE status = "active" AND start_date <= ? AND end_date >= ?
-        ''', (today, today))
-        result = cursor.fetchone()
-        monthly_revenue = result[0] if result[0] else 0
-        
-        conn.close()
-        
-        stats = {
-            'total_users': total_users,
-            'total_clients': total_clients,
-            'total_ads': total_ads,
-            'monthly_revenue': monthly_revenue
-        }
+        # Statistiques générales (compteurs matérialisés, une seule lecture)
+        stats = dashboard_counters.read()
         
         settings = get_all_settings()
         
@@ -461,7 +543,7 @@ def get_users():
         FROM users ORDER BY created_at DESC
     ''')
     
-    users = [dict(row) for row in cursor.fetchall()]
+    users = fetch_records(cursor, 'User')
     conn.close()
     
     return jsonify(users)
@@ -587,8 +669,8 @@ def get_clients():
     conn = db_manager.get_connection()
     cursor = conn.cursor()
     
-    cursor.execute('''
-        SELECT c.*, 
+    cursor.execute(f'''
+        SELECT {CLIENT_COLUMNS.sql(db_manager)},
                COUNT(s.id) as subscriptions_count,
                COALESCE(SUM(s.price), 0) as total_revenue
         FROM clients c
@@ -598,7 +680,7 @@ def get_clients():
         ORDER BY c.created_at DESC
     ''')
     
-    clients = [dict(row) for row in cursor.fetchall()]
+    clients = fetch_records(cursor, 'Client')
     conn.close()
     
     return jsonify(clients)
@@ -662,6 +744,7 @@ def update_client(client_id):
         conn.close()
         
         log_activity('client_updated', f'Client ID {client_id} modifié', session.get('user_id'))
+        invalidate_ads()
         
         return jsonify({'success': True})
     except Exception as e:
@@ -679,6 +762,7 @@ def delete_client(client_id):
         conn.close()
         
         log_activity('client_deleted', f'Client ID {client_id} supprimé', session.get('user_id'))
+        invalidate_ads()
         
         return jsonify({'success': True})
     except Exception as e:
@@ -702,22 +786,18 @@ def get_ad_spaces():
     conn = db_manager.get_connection()
     cursor = conn.cursor()
     
-    today = datetime.now().date()
-    
-    cursor.execute('''
-        SELECT s.*, 
+    cursor.execute(f'''
+        SELECT {AD_SPACE_COLUMNS.sql(db_manager)},
                CASE WHEN a.id IS NOT NULL THEN 1 ELSE 0 END as occupied,
                a.client_name
         FROM ad_spaces s
         LEFT JOIN advertisements a ON s.location = a.position 
-            AND a.status = 'active' 
-            AND a.start_date <= ? 
-            AND a.end_date >= ?
+            AND a.status = 'active'
         WHERE s.is_active = 1
         ORDER BY s.location, s.name
-    ''', (today, today))
+    ''')
     
-    spaces = [dict(row) for row in cursor.fetchall()]
+    spaces = fetch_records(cursor, 'AdSpace')
     conn.close()
     
     return jsonify(spaces)
@@ -748,6 +828,7 @@ def create_ad_space():
         conn.close()
         
         log_activity('ad_space_created', f'Espace publicitaire {name} créé', session.get('user_id'))
+        invalidate_ads()
         
         return jsonify({'success': True, 'space_id': space_id})
     except Exception as e:
@@ -767,6 +848,7 @@ def api_ad_space_detail(space_id):
         conn.close()
         
         log_activity('ad_space_deleted', f'Espace publicitaire ID {space_id} supprimé', session.get('user_id'))
+        invalidate_ads()
         
         return jsonify({'success': True})
     except Exception as e:
@@ -790,15 +872,16 @@ def get_advertisements():
     conn = db_manager.get_connection()
     cursor = conn.cursor()
     
-    cursor.execute('''
-        SELECT a.*, c.name as client_name, s.name as space_name, s.location as position
+    cursor.execute(f'''
+        SELECT {ADVERTISEMENT_COLUMNS.sql(db_manager)},
+               c.name as client_name, s.name as space_name, s.location as position
         FROM advertisements a
         JOIN clients c ON a.client_id = c.id
         JOIN ad_spaces s ON a.ad_space_id = s.id
         ORDER BY a.created_at DESC
     ''')
     
-    ads = [dict(row) for row in cursor.fetchall()]
+    ads = fetch_records(cursor, 'Advertisement')
     conn.close()
     
     return jsonify(ads)
@@ -853,7 +936,7 @@ def create_advertisement():
             return jsonify({'success': False, 'error': 'Format de date invalide'}), 400
         
         # Connexion à la base de données
-        conn = sqlite3.connect('lca_tv.db')
+        conn = db_manager.get_connection()
         cursor = conn.cursor()
         
         # Récupérer les informations du client
@@ -866,13 +949,13 @@ def create_advertisement():
         client_name, client_email, client_phone = client_info
         
         # Récupérer les informations de l'espace publicitaire
-        cursor.execute('SELECT name, location FROM ad_spaces WHERE id = ?', (space_id,))
+        cursor.execute('SELECT name, location, width, height FROM ad_spaces WHERE id = ?', (space_id,))
         space_info = cursor.fetchone()
         if not space_info:
             conn.close()
             return jsonify({'success': False, 'error': 'Espace publicitaire introuvable'}), 400
         
-        space_name, space_location = space_info
+        space_name, space_location, space_width, space_height = space_info
         
         # Traiter le contenu selon le type
         ad_content = ""
@@ -917,14 +1000,20 @@ def create_advertisement():
                 (client_name, client_email, client_phone, ad_title, ad_content, 
                  media_type, media_url, media_filename, start_date, end_date, 
                  position, status, price)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'active', 0.00)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0.00)
             """, (client_name, client_email, client_phone, ad_title, ad_content,
-                  content_type, media_url, media_filename, start_date, end_date, space_location))
+                  content_type, media_url, media_filename, start_date, end_date, space_location,
+                  'pending' if start_date_obj > datetime.now().date() else 'active'))
             
             ad_id = cursor.lastrowid
             conn.commit()
             print(f"Publicité créée avec ID: {ad_id}")
             
+            # Redimensionnement au format de l'espace et variantes optimisées en arrière-plan
+            if media_filename:
+                media_jobs.enqueue('ad_creative', file_path, ad_id=ad_id, width=space_width,
+                                   height=space_height, uploaded_by=session.get('user_id'))
+            
         except sqlite3.Error as e:
             conn.rollback()
             conn.close()
@@ -933,6 +1022,8 @@ def create_advertisement():
         
         conn.close()
         
+        invalidate_ads()
+        
         return jsonify({'success': True, 'ad_id': ad_id, 'message': 'Publicité créée avec succès'})
         
     except Exception as e:
@@ -955,51 +1046,88 @@ def api_advertisement_detail(ad_id):
         conn.close()
         
         log_activity('advertisement_deleted', f'Publicité ID {ad_id} supprimée', session.get('user_id'))
+        invalidate_ads()
         
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-# ============================================================================
-# API ADMINISTRATIVE - STATISTIQUES ET AUTRES
-# ============================================================================
-
-@app.route('/api/admin/overview')
+@app.route('/api/admin/advertisements/<int:ad_id>/delivery', methods=['PUT'])
 @login_required
-def api_admin_overview():
-    """Statistiques générales du dashboard"""
+def api_advertisement_delivery(ad_id):
+    """Paramètres de diffusion: poids, objectif d'impressions, plafond par visiteur"""
     try:
-        conn = db_manager.get_connection()
-        cursor = conn.cursor()
+        data = request.get_json() or {}
         
-        # Statistiques de base
-        cursor.execute('SELECT COUNT(*) FROM users WHERE is_active = 1')
-        total_users = cursor.fetchone()[0]
+        def optional_int(name):
+            value = data.get(name)
+            return int(value) if value not in (None, '') else None
         
-        cursor.execute('SELECT COUNT(*) FROM clients WHERE status = "active"')
-        total_clients = cursor.fetchone()[0]
+        weight = float(data.get('weight', 1))
+        impressions_target = optional_int('impressions_target')
+        frequency_cap = optional_int('frequency_cap')
+        if weight < 0 or (impressions_target or 0) < 0 or (frequency_cap or 0) < 0:
+            return jsonify({'success': False, 'error': 'Valeurs négatives interdites'}), 400
         
-        today = datetime.now().date()
+        conn = db_manager.get_connection()
+        cursor = conn.cursor()
         cursor.execute('''
-            SELECT COUNT(*) FROM advertisements 
-            WHERE status = "active" AND start_date <= ? AND end_date >= ?
-        ''', (today, today))
-        total_ads = cursor.fetchone()[0]
+            UPDATE advertisements
+            SET weight = ?, impressions_target = ?, frequency_cap = ?, updated_at = ?
+            WHERE id = ?
+        ''', (weight, impressions_target, frequency_cap, datetime.now(), ad_id))
+        conn.commit()
+        conn.close()
         
-        cursor.execute('''
-            SELECT COALESCE(SUM(price), 0) FROM subscriptions 
-            WHERE status = "active" AND start_date <= ? AND end_date >= ?
-        ''', (today, today))
-        monthly_revenue = cursor.fetchone()[0]
+        log_activity('advertisement_delivery_updated', f'Diffusion de la publicité ID {ad_id} modifiée', session.get('user_id'))
+        invalidate_ads()
         
-        conn.close()
+        return jsonify({'success': True})
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'Valeurs invalides'}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/admin/ads/<int:ad_id>/report')
+@login_required
+def api_ad_report(ad_id):
+    """Rapport d'une publicité (?from&to&granularity=hour|day|month&format=csv)"""
+    try:
+        start, end, granularity = parse_report_args(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    try:
+        # Inclure les compteurs encore en mémoire
+        ad_counters.flush()
         
-        return jsonify({
-            'total_users': total_users,
-            'total_clients': total_clients,
-            'total_ads': total_ads,
-            'monthly_revenue': monthly_revenue
-        })
+        if request.args.get('format') == 'csv':
+            filename = f"publicite-{ad_id}-{start.isoformat()}-{end.isoformat()}-{granularity}.csv"
+            return Response(
+                stream_with_context(stream_report_csv(db_manager, ad_id, start, end, granularity)),
+                mimetype='text/csv',
+                headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+            )
+        
+        conn = db_manager.get_connection()
+        report = build_report(conn, ad_id, start, end, granularity)
+        conn.close()
+        return jsonify(report)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# ============================================================================
+# API ADMINISTRATIVE - STATISTIQUES ET AUTRES
+# ============================================================================
+
+@app.route('/api/admin/overview')
+@login_required
+def api_admin_overview():
+    """Statistiques générales du dashboard"""
+    try:
+        overview = dashboard_counters.read()
+        overview['analytics_today'] = analytics.totals()
+        return jsonify(overview)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1011,17 +1139,16 @@ def api_admin_recent_activity():
         conn = db_manager.get_connection()
         cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT l.*, u.username
+        cursor.execute(f'''
+            SELECT {ACTIVITY_COLUMNS.sql(db_manager)}, u.username
             FROM activity_logs l
             LEFT JOIN users u ON l.user_id = u.id
             ORDER BY l.created_at DESC
             LIMIT 10
         ''')
         
-        activities = []
-        for row in cursor.fetchall():
-            activity = dict(row)
+        activities = fetch_records(cursor, 'Activity', extra=('icon', 'time'))
+        for activity in activities:
             # Mapper les actions vers des icônes
             icon_map = {
                 'login': 'sign-in-alt',
@@ -1045,8 +1172,6 @@ def api_admin_recent_activity():
                 activity['time'] = f"{time_diff.seconds // 60} min"
             else:
                 activity['time'] = "À l'instant"
-            
-            activities.append(activity)
         
         conn.close()
         return jsonify(activities)
@@ -1063,15 +1188,8 @@ def api_admin_settings():
         return jsonify(get_all_settings())
 
 def get_all_settings():
-    """Récupérer tous les paramètres"""
-    conn = db_manager.get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT key, value FROM settings')
-    settings = {row['key']: row['value'] for row in cursor.fetchall()}
-    
-    conn.close()
-    return settings
+    """Récupérer tous les paramètres (copie modifiable de l'instantané)"""
+    return dict(settings_snapshot.get_all())
 
 def save_settings():
     """Sauvegarder les paramètres"""
@@ -1091,7 +1209,10 @@ def save_settings():
         conn.commit()
         conn.close()
         
+        # Les triggers de settings_version propagent le changement aux autres workers
+        settings_snapshot.invalidate()
         log_activity('settings_updated', 'Paramètres mis à jour', user_id)
+        page_cache.invalidate('settings')
         
         return jsonify({'success': True})
     except Exception as e:
@@ -1101,10 +1222,83 @@ def save_settings():
 # ROUTES UTILITAIRES
 # ============================================================================
 
+@app.route('/api/admin/cache', methods=['GET', 'DELETE'])
+@login_required
+def api_admin_cache():
+    """Statistiques et purge du cache des pages"""
+    if request.method == 'DELETE':
+        cache.clear()
+        log_activity('cache_cleared', 'Cache des pages vidé', session.get('user_id'))
+        return jsonify({'success': True})
+    return jsonify(dict(cache.get_stats(), ad_index=ad_index.get_stats()))
+
+@app.route('/api/admin/activity-log', methods=['GET', 'POST'])
+@login_required
+def api_admin_activity_log():
+    """État de la file du journal d'activité; POST force l'écriture en base"""
+    if request.method == 'POST':
+        return jsonify({'success': True, 'written': activity_log.flush()})
+    return jsonify(activity_log.get_stats())
+
+@app.route('/api/admin/ad-counters', methods=['GET', 'POST'])
+@login_required
+def api_admin_ad_counters():
+    """État des compteurs en attente; POST force l'écriture en base"""
+    if request.method == 'POST':
+        return jsonify({'success': True, 'flushed': ad_counters.flush()})
+    return jsonify(dict(ad_counters.get_stats(), duplicate_clicks=click_deduplicator.duplicates))
+
+@app.route('/api/admin/analytics', methods=['GET', 'POST'])
+@login_required
+def api_admin_analytics():
+    """Chiffres agrégés par jour et catégorie; POST relance l'agrégation"""
+    if request.method == 'POST':
+        return jsonify({'success': True, 'days': analytics.rollup()})
+    days = min(max(request.args.get('days', 30, type=int), 1), 366)
+    return jsonify({
+        'daily': analytics.daily(days, request.args.get('event_type')),
+        'stats': analytics.get_stats(),
+    })
+
+@app.route('/api/admin/backups', methods=['GET', 'POST'])
+@login_required
+def api_admin_backups():
+    """Sauvegardes de la base; POST en lance une tout de suite"""
+    if request.method == 'POST':
+        try:
+            snapshot = db_backup.run(force=True)
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
+        return jsonify({'success': snapshot is not None, 'snapshot': snapshot and os.path.basename(snapshot)})
+    return jsonify(db_backup.get_stats())
+
+@app.route('/api/admin/scheduler', methods=['GET', 'POST'])
+@login_required
+def api_admin_scheduler():
+    """Tâches planifiées; POST applique tout de suite les transitions de statut"""
+    if request.method == 'POST':
+        return jsonify({'success': True, 'changed': lifecycle.run()})
+    return jsonify({'jobs': scheduler.get_stats(), 'transitions': lifecycle.transitions})
+
+@app.route('/api/admin/template-stats')
+@login_required
+def api_admin_template_stats():
+    """Temps de rendu par template et gains du cache de fragments"""
+    return jsonify(render_stats.get_stats())
+
+@app.route('/api/admin/media-jobs/<int:job_id>')
+@login_required
+def api_admin_media_job(job_id):
+    """État d'un traitement d'image en arrière-plan"""
+    job = media_jobs.get_job(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Traitement introuvable'}), 404
+    return jsonify(job)
+
 @app.route('/static/uploads/<path:filename>')
 def uploaded_file(filename):
     """Servir les fichiers uploadés"""
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    return send_upload(app.config['UPLOAD_FOLDER'], filename)
 
 @app.route('/health')
 def health_check():
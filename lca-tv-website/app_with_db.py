@@ -15,9 +15,14 @@ import time
 
 # Import des managers de base de données
 from models import db_manager, user_manager, publicity_manager, video_manager, settings_manager
+from json_provider import init_json_provider
+from search_index import init_search
 
 app = Flask(__name__)
 
+# jsonify() sérialise les enregistrements renvoyés par les managers
+init_json_provider(app)
+
 # Configuration pour production avec sous-répertoire
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'lcatv-secret-key')
 app.config['DEBUG'] = os.environ.get('FLASK_ENV') == 'development'
@@ -348,6 +353,9 @@ def api_videos_by_category(category):
     except Exception as e:
         return jsonify([])
 
+# GET /api/search: recherche plein texte (FTS5) dans les vidéos et les articles
+init_search(app, db_manager)
+
 # ============================================================================
 # API ADMINISTRATIVE
 # ============================================================================
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Content-hashed static asset URLs with immutable caching
+
+Every file under static/js, static/images and static/document is fingerprinted
+at build time. At boot each worker stats the files against the manifest and
+re-hashes only the ones whose mtime or size changed (all of them when there is
+no manifest yet), then writes the manifest back if anything moved, so a deploy
+without a rebuild never serves a changed file under its old fingerprint and
+later boots start from the saved hashes. url_for('static')
+and the asset_url() template global append the fingerprint as ?v=<hash>, and
+requests carrying the current fingerprint are served with
+Cache-Control: immutable so browsers never revalidate unchanged assets.
+
+Usage:
+    python asset_manifest.py build
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+
+from flask import request, url_for
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+MANIFEST_PATH = os.path.join(STATIC_DIR, 'asset-manifest.json')
+
+ASSET_DIRS = ('js', 'images', 'document')
+HASH_LENGTH = 12
+IMMUTABLE_MAX_AGE = 31536000  # 1 an
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+class AssetManifest:
+    """Fingerprints of static assets, keyed by static-relative path"""
+
+    def __init__(self, static_dir=STATIC_DIR, path=MANIFEST_PATH):
+        self.static_dir = static_dir
+        self.path = path
+        self.assets = {}       # relpath -> {'hash', 'mtime', 'size'}
+        self.verify = False    # re-stat files on every lookup (debug mode)
+        self.lock = threading.Lock()
+
+    def load(self):
+        """Load the manifest, re-hash the files changed since, and save it if needed"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            stored = {}
+        self.assets = self.scan(stored)
+        if self.assets != stored:
+            try:
+                self.save()
+            except OSError as e:
+                print(f"⚠️ Manifeste des assets non écrit: {e}")
+        return self.assets
+
+    def scan(self, previous=None):
+        """Fingerprints of every asset, reusing the entries whose mtime and size match"""
+        previous = previous or {}
+        assets = {}
+        for asset_dir in ASSET_DIRS:
+            for root, _, files in os.walk(os.path.join(self.static_dir, asset_dir)):
+                for name in files:
+                    full_path = os.path.join(root, name)
+                    relpath = os.path.relpath(full_path, self.static_dir).replace(os.sep, '/')
+                    stat = os.stat(full_path)
+                    entry = previous.get(relpath)
+                    if not self._matches(entry, stat):
+                        entry = self._fingerprint(full_path, stat)
+                    assets[relpath] = entry
+        return assets
+
+    def save(self):
+        # Fichier temporaire par processus: plusieurs workers peuvent écrire au démarrage
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.assets, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def build(self):
+        """Write a fresh manifest to disk, re-hashing every file"""
+        self.assets = self.scan()
+        self.save()
+        return self.assets
+
+    def get_hash(self, filename):
+        """Fingerprint of an asset, or None if it is not a versioned asset"""
+        if filename.split('/', 1)[0] not in ASSET_DIRS:
+            return None
+
+        entry = self.assets.get(filename)
+        if entry is not None and not self.verify:
+            return entry['hash']
+
+        full_path = os.path.join(self.static_dir, filename)
+        try:
+            stat = os.stat(full_path)
+        except OSError:
+            return None
+
+        if not self._matches(entry, stat):
+            entry = self._fingerprint(full_path, stat)
+            with self.lock:
+                self.assets[filename] = entry
+        return entry['hash']
+
+    @staticmethod
+    def _matches(entry, stat):
+        return (isinstance(entry, dict) and entry.get('mtime') == int(stat.st_mtime)
+                and entry.get('size') == stat.st_size and 'hash' in entry)
+
+    def _fingerprint(self, full_path, stat=None):
+        stat = stat or os.stat(full_path)
+        return {'hash': file_hash(full_path), 'mtime': int(stat.st_mtime), 'size': stat.st_size}
+
+
+asset_manifest = AssetManifest()
+
+
+def asset_url(filename, **values):
+    """Versioned URL of a static asset"""
+    return url_for('static', filename=filename, **values)
+
+
+def init_asset_manifest(app):
+    """Version static URLs and serve fingerprinted assets as immutable"""
+    asset_manifest.verify = app.debug
+    asset_manifest.load()
+    app.jinja_env.globals['asset_url'] = asset_url
+
+    @app.url_defaults
+    def add_asset_version(endpoint, values):
+        if endpoint == 'static' and 'filename' in values and 'v' not in values:
+            version = asset_manifest.get_hash(values['filename'])
+            if version:
+                values['v'] = version
+
+    @app.after_request
+    def immutable_assets(response):
+        if request.endpoint == 'static' and response.status_code in (200, 206, 304):
+            version = request.args.get('v')
+            if version and version == asset_manifest.get_hash(request.view_args.get('filename', '')):
+                response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+        return response
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] != 'build':
+        print(__doc__)
+        sys.exit(1)
+    assets = asset_manifest.build()
+    print(f"✅ {len(assets)} fichiers indexés dans {MANIFEST_PATH}")
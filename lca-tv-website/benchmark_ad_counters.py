@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Page-view throughput with per-impression writes vs. batched ad counters
+
+Runs app_advanced against a temporary copy of the database (all ads made
+active) with the page cache disabled. Each page view renders a page and posts
+the impression beacon of the ads it showed, first with the historical
+"three statements + commit per impression" counter, then with the
+AdCounterAggregator.
+
+Usage:
+    python benchmark_ad_counters.py [source.db] [requests] [threads]
+"""
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PAGES = ['/videos', '/journal', '/emissions', '/about', '/live']
+LOCATIONS = ['header', 'sidebar', 'popup']
+
+
+def prepare_database(source, workdir):
+    path = os.path.join(workdir, 'lca_tv.db')
+    shutil.copy(source, path)
+    conn = sqlite3.connect(path)
+    year = date.today().year
+    conn.execute("UPDATE advertisements SET status = 'active', start_date = ?, end_date = ?",
+                 (f'{year}-01-01', f'{year}-12-31'))
+    conn.execute('DELETE FROM ad_stats')
+    conn.commit()
+    conn.close()
+    return path
+
+
+def legacy_increment(app_module):
+    """Counter as it was before batching: one connection and commit per impression"""
+    def increment_ad_impressions(ad_id):
+        conn = app_module.db_manager.get_connection()
+        cursor = conn.cursor()
+        today = datetime.now().date()
+        cursor.execute('''
+            INSERT OR IGNORE INTO ad_stats (advertisement_id, date, impressions, clicks)
+            VALUES (?, ?, 0, 0)
+        ''', (ad_id, today))
+        cursor.execute('''
+            UPDATE ad_stats SET impressions = impressions + 1
+            WHERE advertisement_id = ? AND date = ?
+        ''', (ad_id, today))
+        cursor.execute('UPDATE advertisements SET impressions = impressions + 1 WHERE id = ?', (ad_id,))
+        conn.commit()
+        conn.close()
+    return increment_ad_impressions
+
+
+def run(app_module, num_requests, threads):
+    client = app_module.app.test_client()
+
+    def fetch(i):
+        status = client.get(PAGES[i % len(PAGES)]).status_code
+        ads = app_module.ad_selector.select(LOCATIONS)
+        events = [{'ad_id': ad['id'], 'slot': slot, 'ts': int(time.time() * 1000)}
+                  for slot, slot_ads in ads.items() for ad in slot_ads]
+        beacon = client.post('/api/ads/beacon', data=json.dumps({'events': events}),
+                             headers={'User-Agent': 'Mozilla/5.0 (benchmark)'})
+        return status if beacon.status_code == 204 else beacon.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        statuses = list(executor.map(fetch, range(num_requests)))
+    elapsed = time.perf_counter() - start
+    return {
+        'elapsed': elapsed,
+        'throughput': num_requests / elapsed,
+        'errors': sum(1 for status in statuses if status != 200)
+    }
+
+
+def total_impressions(db_path):
+    conn = sqlite3.connect(db_path)
+    total = conn.execute('SELECT COALESCE(SUM(impressions), 0) FROM ad_stats').fetchone()[0]
+    conn.close()
+    return total
+
+
+def main(argv):
+    source = argv[1] if len(argv) > 1 else os.path.join(BASE_DIR, 'lcatv_advanced.db')
+    num_requests = int(argv[2]) if len(argv) > 2 else 500
+    threads = int(argv[3]) if len(argv) > 3 else 8
+
+    workdir = tempfile.mkdtemp(prefix='lcatv-bench-')
+    db_path = prepare_database(source, workdir)
+    os.chdir(workdir)
+    sys.path.insert(0, BASE_DIR)
+    import app_advanced
+
+    app_advanced.page_cache.enabled = False
+    app_advanced.ad_index.ensure_fresh()
+
+    batched_increment = app_advanced.increment_ad_impressions
+    results = {}
+    for name, increment in (('per-impression', legacy_increment(app_advanced)),
+                            ('batched', batched_increment)):
+        app_advanced.increment_ad_impressions = increment
+        before = total_impressions(db_path)
+        results[name] = run(app_advanced, num_requests, threads)
+        app_advanced.ad_counters.flush()
+        results[name]['impressions'] = total_impressions(db_path) - before
+
+    print(f"\n📊 {num_requests} pages, {threads} threads ({os.path.basename(source)})")
+    for name, result in results.items():
+        print(f"  {name:15} {result['throughput']:8.1f} pages/s  "
+              f"{result['elapsed']:6.2f}s  impressions={result['impressions']}  errors={result['errors']}")
+    speedup = results['batched']['throughput'] / results['per-impression']['throughput']
+    print(f"  ⚡ x{speedup:.2f}")
+
+    shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
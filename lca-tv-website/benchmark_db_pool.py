@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Manager call throughput: connection per call vs. pooled thread-local connections
+
+Builds two fresh models.py databases in a temporary directory and seeds them
+with the same users, videos, ads and packages. The first is driven through a
+DatabaseManager that opens a plain sqlite3 connection per call in
+rollback-journal mode, the historical behaviour. The second uses the pooled,
+WAL-tuned connections. Both run the hot UserManager, PublicityManager and
+VideoManager calls, from several threads, including a share of writes.
+
+Usage:
+    python benchmark_db_pool.py [calls] [threads]
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from models import DatabaseManager, UserManager, PublicityManager, VideoManager
+
+CATEGORIES = ['actualites', 'sport', 'culture', 'emissions']
+
+
+class LegacyDatabaseManager(DatabaseManager):
+    """Previous behaviour: a new connection for every manager call"""
+
+    def get_connection(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def ensure_initialized(self):
+        # The schema is created through the pool, which switches the file to WAL
+        super().ensure_initialized()
+        self.pool.close()
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('PRAGMA journal_mode=DELETE')
+        conn.close()
+
+
+def seed(db, videos=2000, ads=200, users=50):
+    db.ensure_initialized()
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    today = date.today()
+    cursor.executemany('''
+        INSERT INTO users (username, email, password_hash, role, full_name, is_active)
+        VALUES (?, ?, 'x', 'editor', ?, 1)
+    ''', [(f'user{i}', f'user{i}@lcatv.bf', f'User {i}') for i in range(users)])
+    cursor.executemany('''
+        INSERT INTO videos (youtube_id, title, description, category, published_at, status, created_by)
+        VALUES (?, ?, ?, ?, ?, 'published', 1)
+    ''', [(f'yt{i:08d}', f'Vidéo {i}', 'Description ' * 20, CATEGORIES[i % len(CATEGORIES)],
+           today - timedelta(days=i % 365)) for i in range(videos)])
+    cursor.executemany('''
+        INSERT INTO advertisements (title, content, position, start_date, end_date, status, created_by)
+        VALUES (?, '', ?, ?, ?, ?, 1)
+    ''', [(f'Pub {i}', ['header', 'sidebar', 'footer'][i % 3], today - timedelta(days=30),
+           today + timedelta(days=30), 'active' if i % 4 else 'expired') for i in range(ads)])
+    conn.commit()
+    conn.close()
+
+
+def workload(managers, rng):
+    users, publicity, videos = managers
+    roll = rng.random()
+    if roll < 0.35:
+        videos.get_videos(category=rng.choice(CATEGORIES), status='published')
+    elif roll < 0.55:
+        publicity.get_advertisements(status='active')
+    elif roll < 0.70:
+        publicity.get_packages()
+    elif roll < 0.90:
+        users.get_users()
+    else:
+        users.update_user(rng.randint(2, 50), full_name=f'User {rng.random():.6f}')
+
+
+def run(db, calls, threads):
+    managers = (UserManager(db), PublicityManager(db), VideoManager(db))
+
+    def worker(count):
+        rng = random.Random(count)
+        for _ in range(count):
+            workload(managers, rng)
+
+    per_thread = calls // threads
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(worker, [per_thread] * threads))
+    return per_thread * threads / (time.perf_counter() - start)
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    with tempfile.TemporaryDirectory() as workdir:
+        results = {}
+        for name, manager_class in (('per-call connections', LegacyDatabaseManager),
+                                    ('pooled connections', DatabaseManager)):
+            db = manager_class(os.path.join(workdir, f"{name.split()[0]}.db"))
+            seed(db)
+            run(db, threads * 50, threads)  # échauffement
+            results[name] = run(db, calls, threads)
+            print(f"{name:22s} {results[name]:10.0f} calls/s")
+
+        speedup = results['pooled connections'] / results['per-call connections']
+        print(f"speedup: {speedup:.2f}x ({calls} calls, {threads} threads)")
+
+
+if __name__ == '__main__':
+    main()
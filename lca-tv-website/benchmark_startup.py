@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Worker boot time: full schema/seed bootstrap vs. the version fast path
+
+Each sample is a fresh interpreter, as a newly forked or spawned worker
+would be. The interpreter imports models.py and serves one settings lookup
+against an already initialised database in a temporary directory. The
+"full bootstrap" runs the historical startup work on every boot: nine
+CREATE TABLE IF NOT EXISTS, the migration check and one SELECT per default
+row. The "fast path" only reads the schema/seed version row. The import
+alone is also timed; it no longer touches the database.
+
+Usage:
+    python benchmark_startup.py [samples]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+TIMER = '''
+import sys, time
+sys.path.insert(0, {base!r})
+start = time.perf_counter()
+import models
+imported = time.perf_counter()
+{boot}
+models.settings_manager.get_setting('site_title')
+print(imported - start, time.perf_counter() - start)
+'''
+
+SCENARIOS = {
+    'full bootstrap': 'models.db_manager.init_database(); models.db_manager.initialized = True',
+    'fast path': '',
+}
+
+
+def sample(workdir, boot):
+    code = TIMER.format(base=BASE_DIR, boot=boot)
+    output = subprocess.run([sys.executable, '-c', code], cwd=workdir, check=True,
+                            capture_output=True, text=True).stdout
+    import_time, boot_time = map(float, output.split()[-2:])
+    return import_time * 1000, boot_time * 1000
+
+
+def main():
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 15
+
+    with tempfile.TemporaryDirectory() as workdir:
+        sample(workdir, SCENARIOS['full bootstrap'])  # crée et initialise lcatv.db
+        results = {}
+        for name, boot in SCENARIOS.items():
+            timings = [sample(workdir, boot) for _ in range(samples)]
+            import_ms = statistics.median(t[0] for t in timings)
+            boot_ms = statistics.median(t[1] for t in timings)
+            results[name] = boot_ms - import_ms
+            print(f"{name:15s} import {import_ms:7.1f} ms   import + first query {boot_ms:7.1f} ms")
+
+        print(f"database startup work: {results['full bootstrap']:.2f} ms -> {results['fast path']:.2f} ms "
+              f"(median of {samples} boots)")
+
+
+if __name__ == '__main__':
+    main()
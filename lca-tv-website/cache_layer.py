@@ -0,0 +1,104 @@
+"""
+Tagged in-memory cache shared by the page and fragment caches
+"""
+import threading
+import time
+
+
+class TaggedCache:
+    """Thread-safe TTL cache whose entries can be invalidated by dependency tag"""
+
+    def __init__(self, max_entries=2000):
+        self.entries = {}      # key -> (expires_at, value, tags)
+        self.tag_index = {}    # tag -> set of keys
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """Return the cached value or None if missing/expired"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            if entry[0] < time.time():
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=300, tags=()):
+        """Store a value for `ttl` seconds, attached to the given tags"""
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            elif len(self.entries) >= self.max_entries:
+                self._evict()
+
+            tags = frozenset(tags)
+            self.entries[key] = (time.time() + ttl, value, tags)
+            for tag in tags:
+                self.tag_index.setdefault(tag, set()).add(key)
+
+    def delete(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def invalidate_tags(self, *tags):
+        """Drop every entry depending on one of the tags"""
+        with self.lock:
+            removed = 0
+            for tag in tags:
+                for key in self.tag_index.pop(tag, ()):
+                    if key in self.entries:
+                        self._remove(key)
+                        removed += 1
+            self.invalidations += removed
+            return removed
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.tag_index.clear()
+
+    def get_stats(self):
+        total = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'hit_rate': (self.hits / total * 100) if total else 0
+        }
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self.tag_index.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tag_index[tag]
+
+    def _evict(self):
+        """Drop expired entries, then the oldest ones, to make room"""
+        now = time.time()
+        for key in [k for k, e in self.entries.items() if e[0] < now]:
+            self._remove(key)
+
+        overflow = len(self.entries) - self.max_entries + 1
+        if overflow > 0:
+            for key in list(self.entries)[:overflow]:
+                self._remove(key)
+
+
+# Global cache instance
+cache = TaggedCache()
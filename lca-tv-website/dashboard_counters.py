@@ -0,0 +1,126 @@
+"""
+Materialized admin dashboard counters
+
+The dashboard and /api/admin/overview used to recount users, clients, active
+ads and active subscription revenue on every poll. Those four figures now
+live in the single-row `dashboard_counters` table. It is kept up to date by
+SQLite triggers on the source tables, so every writer (admin routes, the
+lifecycle scheduler, models.py managers, scripts) updates it in the same
+transaction as its own write. Reading the overview costs one primary-key
+lookup. A periodic reconcile recounts everything, repairs any drift (rows
+written before the triggers existed, bulk imports with triggers disabled)
+and records how much it had to correct.
+"""
+from datetime import datetime
+
+RECONCILE_INTERVAL = 3600
+COUNTER_COLUMNS = ('total_users', 'total_clients', 'total_ads', 'monthly_revenue')
+
+RECOUNT_QUERY = '''
+    SELECT (SELECT COUNT(*) FROM users WHERE is_active = 1),
+           (SELECT COUNT(*) FROM clients WHERE status = 'active'),
+           (SELECT COUNT(*) FROM advertisements WHERE status = 'active'),
+           (SELECT COALESCE(SUM(price), 0) FROM subscriptions WHERE status = 'active')
+'''
+
+# table -> (counter column, contribution of one row as a SQL expression on NEW./OLD.)
+COUNTED_TABLES = {
+    'users': ('total_users', "({row}.is_active = 1)"),
+    'clients': ('total_clients', "({row}.status = 'active')"),
+    'advertisements': ('total_ads', "({row}.status = 'active')"),
+    'subscriptions': ('monthly_revenue', "(CASE WHEN {row}.status = 'active' THEN COALESCE({row}.price, 0) ELSE 0 END)"),
+}
+
+
+def ensure_dashboard_schema(conn):
+    """Create the counters row and its maintenance triggers if missing"""
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    if not all(table in existing for table in COUNTED_TABLES):
+        return
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS dashboard_counters (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            total_users INTEGER NOT NULL DEFAULT 0,
+            total_clients INTEGER NOT NULL DEFAULT 0,
+            total_ads INTEGER NOT NULL DEFAULT 0,
+            monthly_revenue REAL NOT NULL DEFAULT 0,
+            reconciled_at DATETIME,
+            drift INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+    for table, (column, contribution) in COUNTED_TABLES.items():
+        new, old = (f"COALESCE({contribution.format(row=row)}, 0)" for row in ('NEW', 'OLD'))
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS dashboard_{table}_insert AFTER INSERT ON {table}
+            BEGIN
+                UPDATE dashboard_counters SET {column} = {column} + {new} WHERE id = 1;
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS dashboard_{table}_update AFTER UPDATE ON {table}
+            WHEN {new} IS NOT {old}
+            BEGIN
+                UPDATE dashboard_counters SET {column} = {column} + {new} - {old} WHERE id = 1;
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS dashboard_{table}_delete AFTER DELETE ON {table}
+            BEGIN
+                UPDATE dashboard_counters SET {column} = {column} - {old} WHERE id = 1;
+            END
+        ''')
+
+    if conn.execute('SELECT 1 FROM dashboard_counters WHERE id = 1').fetchone() is None:
+        reconcile(conn)
+    conn.commit()
+
+
+def reconcile(conn):
+    """Recount every figure and overwrite the counters row; returns the drift found"""
+    counts = conn.execute(RECOUNT_QUERY).fetchone()
+    current = conn.execute(f"SELECT {', '.join(COUNTER_COLUMNS)} FROM dashboard_counters WHERE id = 1").fetchone()
+    drift = 0 if current is None else sum(1 for stored, real in zip(current, counts) if stored != real)
+
+    conn.execute(f'''
+        INSERT INTO dashboard_counters (id, {', '.join(COUNTER_COLUMNS)}, reconciled_at, drift)
+        VALUES (1, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET
+            total_users = excluded.total_users,
+            total_clients = excluded.total_clients,
+            total_ads = excluded.total_ads,
+            monthly_revenue = excluded.monthly_revenue,
+            reconciled_at = excluded.reconciled_at,
+            drift = excluded.drift
+    ''', (*counts, datetime.now(), drift))
+    return drift
+
+
+class DashboardCounters:
+    """Access to the materialized counters of one database"""
+
+    def __init__(self, db_manager):
+        self.db = db_manager
+
+    def read(self):
+        """The four dashboard figures as a dict (single primary-key read)"""
+        conn = self.db.get_connection()
+        try:
+            row = conn.execute(f"SELECT {', '.join(COUNTER_COLUMNS)} FROM dashboard_counters WHERE id = 1").fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return dict.fromkeys(COUNTER_COLUMNS, 0)
+        return dict(zip(COUNTER_COLUMNS, row))
+
+    def reconcile(self):
+        conn = self.db.get_connection()
+        try:
+            drift = reconcile(conn)
+            conn.commit()
+        finally:
+            conn.close()
+        if drift:
+            print(f"Compteurs du dashboard corrigés ({drift} valeur(s) divergente(s))")
+        return drift
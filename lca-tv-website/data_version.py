@@ -0,0 +1,55 @@
+"""
+Cross-process change detection for the SQLite database
+
+`PRAGMA data_version` changes whenever another connection (in this process or
+in another Passenger worker) commits to the database. Polling it on a
+dedicated, long-lived connection is far cheaper than re-running the queries
+behind an in-memory cache, so caches compare the version they were built from
+with the current one instead of expiring blindly.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_INTERVAL = 1.0
+
+
+class DataVersionWatcher:
+    """Throttled reader of PRAGMA data_version on a dedicated connection"""
+
+    def __init__(self, db_path, interval=DEFAULT_INTERVAL):
+        self.db_path = db_path
+        self.interval = interval
+        self.conn = None
+        self.pid = None
+        self.value = None
+        self.checked_at = 0
+        self.lock = threading.Lock()
+
+    def _connection(self):
+        # A connection must not be shared across a fork: reopen in each worker
+        if self.conn is None or self.pid != os.getpid():
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            self.pid = os.getpid()
+        return self.conn
+
+    def version(self):
+        """Current data version, read at most once per `interval` seconds"""
+        now = time.monotonic()
+        if self.value is not None and now - self.checked_at < self.interval:
+            return self.value
+
+        with self.lock:
+            if self.value is None or now - self.checked_at >= self.interval:
+                try:
+                    self.value = self._connection().execute('PRAGMA data_version').fetchone()[0]
+                except sqlite3.Error as e:
+                    print(f"data_version check failed: {e}")
+                    self.conn = None
+                self.checked_at = now
+            return self.value
+
+    def force_check(self):
+        """Make the next version() call read the pragma again"""
+        self.checked_at = 0
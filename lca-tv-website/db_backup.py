@@ -0,0 +1,256 @@
+"""
+Online SQLite backups: stepped copy, compressed rotated snapshots, restore check
+
+Copying a live database file can capture a half-written page and, with WAL,
+misses whatever is still in the -wal file. DatabaseBackup instead:
+
+    1. runs a PASSIVE WAL checkpoint, which folds committed frames back into
+       the database without waiting on (or blocking) readers and writers;
+    2. copies the database with the online backup API, `pages` pages per
+       step with a pause between steps, so the copy never monopolizes the
+       disk. A write by another connection restarts the copy; after
+       MAX_RESTARTS the remainder is copied in one pass, which in WAL mode
+       only holds a read snapshot and still does not block writers;
+    3. gzips the copy to <backup_dir>/<name>-YYYYmmdd-HHMMSS.db.gz;
+    4. verifies the snapshot by restoring it to a temporary file and running
+       PRAGMA integrity_check, and deletes it if that fails;
+    5. keeps the `keep` most recent snapshots of each database.
+
+A lock file makes concurrent runs (several Passenger workers sharing one
+scheduler job) skip instead of backing up twice, and a snapshot newer than
+`min_interval` counts as done. Command line:
+
+    python db_backup.py [--dest backups] [--keep 7] [lca_tv.db ...]
+    python db_backup.py --verify backups/lca_tv-20250101-030000.db.gz
+    python db_backup.py --restore backups/lca_tv-20250101-030000.db.gz restored.db
+"""
+import argparse
+import fcntl
+import glob
+import gzip
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BACKUP_INTERVAL = 24 * 3600
+BACKUP_DIR = os.environ.get('BACKUP_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backups'))
+DEFAULT_DATABASES = ('lca_tv.db', 'lcatv.db', 'lcatv_advanced.db')
+KEEP = 7
+STEP_PAGES = 256
+STEP_SLEEP = 0.05
+MAX_RESTARTS = 20
+
+
+class BackupRestarted(Exception):
+    """The source kept changing under the stepped copy"""
+
+
+def snapshot_pattern(backup_dir, name):
+    return os.path.join(backup_dir, f'{name}-????????-??????.db.gz')
+
+
+def verify_snapshot(snapshot):
+    """Restore a .db.gz to a temporary file and run integrity_check; returns (ok, detail)"""
+    handle, path = tempfile.mkstemp(suffix='.db')
+    os.close(handle)
+    try:
+        with gzip.open(snapshot, 'rb') as source, open(path, 'wb') as target:
+            shutil.copyfileobj(source, target)
+        conn = sqlite3.connect(path)
+        try:
+            result = conn.execute('PRAGMA integrity_check').fetchone()[0]
+            tables = conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table'").fetchone()[0]
+        finally:
+            conn.close()
+        return result == 'ok', f'{result}, {tables} table(s)'
+    except (OSError, EOFError, sqlite3.DatabaseError) as e:
+        return False, str(e)
+    finally:
+        os.remove(path)
+
+
+def restore_snapshot(snapshot, target):
+    """Decompress a verified snapshot to `target`, which must not exist yet"""
+    if os.path.exists(target):
+        raise FileExistsError(f"{target} exists; restore to a new path and swap it in while the app is stopped")
+    ok, detail = verify_snapshot(snapshot)
+    if not ok:
+        raise ValueError(f"Snapshot {snapshot} failed verification: {detail}")
+    partial = target + '.partial'
+    with gzip.open(snapshot, 'rb') as source, open(partial, 'wb') as copy:
+        shutil.copyfileobj(source, copy)
+    os.replace(partial, target)
+    return target
+
+
+class DatabaseBackup:
+    """Stepped online backup of one SQLite file into rotated .db.gz snapshots"""
+
+    def __init__(self, db_path, backup_dir=BACKUP_DIR, keep=KEEP, pages=STEP_PAGES,
+                 sleep=STEP_SLEEP, min_interval=0):
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.keep = keep
+        self.pages = pages
+        self.sleep = sleep
+        self.min_interval = min_interval
+        self.name = os.path.splitext(os.path.basename(db_path))[0]
+        # Metrics
+        self.runs = 0
+        self.skipped = 0
+        self.failures = 0
+        self.last_snapshot = None
+        self.last_duration = 0
+        self.last_restarts = 0
+        self.last_error = None
+
+    def snapshots(self):
+        """Existing snapshots of this database, oldest first"""
+        return sorted(glob.glob(snapshot_pattern(self.backup_dir, self.name)))
+
+    def run(self, force=False):
+        """Back up once; returns the snapshot path, or None if skipped"""
+        os.makedirs(self.backup_dir, exist_ok=True)
+        lock = open(os.path.join(self.backup_dir, f'.{self.name}.lock'), 'w')
+        try:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self.skipped += 1  # un autre worker sauvegarde déjà
+                return None
+            snapshots = self.snapshots()
+            if not force and snapshots and time.time() - os.path.getmtime(snapshots[-1]) < self.min_interval:
+                self.skipped += 1
+                return None
+            return self.backup()
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            print(f"❌ Sauvegarde de {self.db_path} échouée: {e}")
+            raise
+        finally:
+            lock.close()
+
+    def backup(self):
+        start = time.perf_counter()
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        snapshot = os.path.join(self.backup_dir, f'{self.name}-{stamp}.db.gz')
+        copy = os.path.join(self.backup_dir, f'.{self.name}-{stamp}.db.partial')
+        try:
+            self.copy_database(copy)
+            with open(copy, 'rb') as source, gzip.open(snapshot + '.partial', 'wb', compresslevel=6) as target:
+                shutil.copyfileobj(source, target)
+        finally:
+            if os.path.exists(copy):
+                os.remove(copy)
+
+        ok, detail = verify_snapshot(snapshot + '.partial')
+        if not ok:
+            os.remove(snapshot + '.partial')
+            raise ValueError(f"snapshot failed restore verification: {detail}")
+        os.replace(snapshot + '.partial', snapshot)
+
+        self.rotate()
+        self.runs += 1
+        self.last_snapshot = snapshot
+        self.last_duration = time.perf_counter() - start
+        self.last_error = None
+        print(f"💾 Sauvegarde {snapshot} ({detail}, {self.last_duration:.1f}s)")
+        return snapshot
+
+    def copy_database(self, path):
+        source = sqlite3.connect(self.db_path, timeout=5)
+        try:
+            # PASSIVE: ne bloque ni n'attend les lecteurs et écrivains en cours
+            source.execute('PRAGMA wal_checkpoint(PASSIVE)')
+            self.last_restarts = 0
+            try:
+                self.stepped_copy(source, path)
+            except BackupRestarted:
+                # Base trop active pour la copie par étapes: une passe sur un instantané de lecture
+                self.single_pass_copy(source, path)
+        finally:
+            source.close()
+
+    def stepped_copy(self, source, path):
+        previous = [None]
+
+        def progress(status, remaining, total):
+            if previous[0] is not None and remaining >= previous[0]:
+                self.last_restarts += 1
+                if self.last_restarts > MAX_RESTARTS:
+                    raise BackupRestarted()
+            previous[0] = remaining
+
+        target = sqlite3.connect(path)
+        try:
+            source.backup(target, pages=self.pages, progress=progress, sleep=self.sleep)
+        finally:
+            target.close()
+
+    def single_pass_copy(self, source, path):
+        os.remove(path)
+        target = sqlite3.connect(path)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+
+    def rotate(self):
+        snapshots = self.snapshots()
+        for old in snapshots[:max(0, len(snapshots) - self.keep)]:
+            os.remove(old)
+
+    def get_stats(self):
+        snapshots = self.snapshots() if os.path.isdir(self.backup_dir) else []
+        return {
+            'database': self.db_path,
+            'backup_dir': self.backup_dir,
+            'snapshots': [{'file': os.path.basename(path), 'bytes': os.path.getsize(path)} for path in snapshots],
+            'keep': self.keep,
+            'runs': self.runs,
+            'skipped': self.skipped,
+            'failures': self.failures,
+            'last_snapshot': self.last_snapshot,
+            'last_duration': self.last_duration,
+            'last_restarts': self.last_restarts,
+            'last_error': self.last_error,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sauvegarde en ligne des bases SQLite de LCA TV')
+    parser.add_argument('databases', nargs='*', help='bases à sauvegarder (défaut: celles du dossier courant)')
+    parser.add_argument('--dest', default=BACKUP_DIR, help='dossier des sauvegardes')
+    parser.add_argument('--keep', type=int, default=KEEP, help='sauvegardes conservées par base')
+    parser.add_argument('--verify', metavar='SNAPSHOT', help='vérifier une sauvegarde .db.gz')
+    parser.add_argument('--restore', nargs=2, metavar=('SNAPSHOT', 'TARGET'), help='restaurer vers un nouveau fichier')
+    args = parser.parse_args(argv)
+
+    if args.verify:
+        ok, detail = verify_snapshot(args.verify)
+        print(f"{'✅' if ok else '❌'} {args.verify}: {detail}")
+        return 0 if ok else 1
+    if args.restore:
+        print(f"✅ Restauré vers {restore_snapshot(*args.restore)}")
+        return 0
+
+    databases = args.databases or [path for path in DEFAULT_DATABASES if os.path.exists(path)]
+    if not databases:
+        print("Aucune base à sauvegarder")
+        return 1
+    status = 0
+    for path in databases:
+        try:
+            DatabaseBackup(path, args.dest, keep=args.keep).run()
+        except Exception:
+            status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,219 @@
+"""
+Thread-local pooled SQLite connections
+
+Every manager method used to open a fresh sqlite3 connection and close it
+afterwards, paying the open, the schema parse and a cold page cache on each
+call, in rollback-journal mode where readers block writers. ConnectionPool
+keeps one tuned connection per thread (and per process, so forked workers
+never share one) and hands out lightweight proxies:
+
+    conn = pool.get_connection()   # same underlying connection for the thread
+    ...
+    conn.close()                   # no-op, except that the outermost close of
+                                   # the thread rolls back an uncommitted
+                                   # transaction, like closing a real connection
+
+A connection checked out while the thread is already inside a transaction
+(a manager method called from another one) works in a savepoint: its
+commit() releases the savepoint and its rollback() or close() undo only its
+own writes, never the caller's transaction.
+
+Connections run with WAL, synchronous=NORMAL, a memory-mapped database, a
+larger page cache, a busy timeout and a prepared-statement cache. Writes that
+must be atomic use the transaction() context manager. Web apps call
+release() at request teardown and the scheduler after each job, so code that
+failed before its close() cannot leave a transaction, and the write lock,
+open on the thread. A proxy dropped without close() is checked in when it is
+garbage collected.
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+DEFAULT_PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -16000,       # en KiB: 16 Mo de cache de pages
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+}
+CACHED_STATEMENTS = 256
+
+
+class PooledConnection:
+    """Proxy of the thread's connection whose close() only releases it"""
+
+    __slots__ = ('_pool', '_conn', '_released', '_generation', '_savepoint')
+
+    def __init__(self, pool, conn, generation, savepoint=None):
+        object.__setattr__(self, '_pool', pool)
+        object.__setattr__(self, '_conn', conn)
+        object.__setattr__(self, '_released', False)
+        object.__setattr__(self, '_generation', generation)
+        object.__setattr__(self, '_savepoint', savepoint)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        # row_factory, text_factory...: restored when the thread releases the connection
+        setattr(self._conn, name, value)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._savepoint is None:
+            return self._conn.__exit__(exc_type, exc_value, traceback)
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+    def savepoint(self, statement):
+        """Run a savepoint statement; the caller may already have ended its transaction"""
+        try:
+            self._conn.execute(f'{statement} {self._savepoint}')
+        except sqlite3.OperationalError:
+            pass
+
+    def commit(self):
+        if self._savepoint is None:
+            return self._conn.commit()
+        # Imbriquée: la transaction appartient à l'appelant, on valide seulement le savepoint
+        self.savepoint('RELEASE')
+        if self._conn.in_transaction:
+            self.savepoint('SAVEPOINT')
+
+    def rollback(self):
+        if self._savepoint is None:
+            return self._conn.rollback()
+        self.savepoint('ROLLBACK TO')
+
+    def close(self):
+        if not self._released:
+            object.__setattr__(self, '_released', True)
+            if self._savepoint is not None and self._pool.is_current(self._conn, self._generation):
+                # Comme une vraie connexion fermée: les écritures non validées sont perdues
+                self.savepoint('ROLLBACK TO')
+                self.savepoint('RELEASE')
+            self._pool.checkin(self._conn, self._generation)
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """One tuned connection per thread for a database file"""
+
+    def __init__(self, db_path, pragmas=None, cached_statements=CACHED_STATEMENTS):
+        self.db_path = db_path
+        self.pragmas = dict(DEFAULT_PRAGMAS, **(pragmas or {}))
+        self.cached_statements = cached_statements
+        self.local = threading.local()
+        self.opened = 0
+        self.checkouts = 0
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=self.pragmas['busy_timeout'] / 1000,
+                               cached_statements=self.cached_statements)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+        except sqlite3.OperationalError as e:
+            # Base verrouillée par un autre processus: le mode WAL sera activé à la prochaine connexion
+            print(f"WAL non activé pour {self.db_path}: {e}")
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name}={value}')
+        self.opened += 1
+        return conn
+
+    def raw_connection(self):
+        """The thread's sqlite3.Connection (opened on first use, reopened after a fork)"""
+        local = self.local
+        if getattr(local, 'conn', None) is None or local.pid != os.getpid():
+            local.conn = self.connect()
+            local.pid = os.getpid()
+            local.depth = 0
+            local.generation = 0
+        return local.conn
+
+    def get_connection(self):
+        conn = self.raw_connection()
+        local = self.local
+        local.depth += 1
+        self.checkouts += 1
+        savepoint = None
+        if local.depth > 1 and conn.in_transaction:
+            savepoint = f'pool_sp_{local.depth}'
+            conn.execute(f'SAVEPOINT {savepoint}')
+        return PooledConnection(self, conn, local.generation, savepoint)
+
+    def is_current(self, conn, generation):
+        """True when a proxy still belongs to the calling thread's live checkouts"""
+        local = self.local
+        return (getattr(local, 'conn', None) is conn and local.pid == os.getpid()
+                and local.generation == generation)
+
+    def checkin(self, conn, generation):
+        # Proxies from another thread, or checked out before a release(), are ignored
+        if not self.is_current(conn, generation):
+            return
+        local = self.local
+        local.depth = max(0, local.depth - 1)
+        if local.depth == 0:
+            self.reset(local.conn)
+
+    def reset(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        conn.row_factory = sqlite3.Row
+        conn.text_factory = str
+
+    def release(self, *args):
+        """Return the thread's connection to a clean state (request teardown)"""
+        local = self.local
+        if getattr(local, 'conn', None) is not None and local.pid == os.getpid():
+            local.depth = 0
+            local.generation += 1
+            self.reset(local.conn)
+
+    def close(self):
+        """Really close the calling thread's connection"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None and self.local.pid == os.getpid():
+            conn.close()
+        self.local.conn = None
+
+    @contextmanager
+    def transaction(self, immediate=True):
+        """Commit on success, roll back on error; nested blocks use savepoints"""
+        conn = self.get_connection()
+        try:
+            if not conn.in_transaction:
+                conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get_stats(self):
+        return {'db_path': self.db_path, 'connections_opened': self.opened,
+                'checkouts': self.checkouts, 'pragmas': self.pragmas}
+
+
+def init_db_pool(app, pool):
+    """Release the request thread's connection when each app context ends"""
+    app.teardown_appcontext(pool.release)
+    app.extensions['db_pool'] = pool
+    return pool
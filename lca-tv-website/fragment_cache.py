@@ -0,0 +1,125 @@
+"""
+Jinja fragment caching and per-template render instrumentation
+
+Adds a {% cache key, ttl, tags %} ... {% endcache %} block backed by the app
+cache layer: the rendered HTML of the block is stored under `key` for `ttl`
+seconds and dropped when one of `tags` is invalidated. Render times are
+recorded per template and per fragment so the savings can be measured.
+"""
+import threading
+import time
+
+from flask import before_render_template, template_rendered, g
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from cache_layer import cache
+
+DEFAULT_FRAGMENT_TTL = 300
+
+
+class TemplateRenderStats:
+    """Render-time metrics per template and per cached fragment"""
+
+    def __init__(self):
+        self.templates = {}
+        self.fragments = {}
+        self.lock = threading.Lock()
+
+    def record_template(self, name, duration):
+        with self.lock:
+            metric = self.templates.setdefault(name, {'count': 0, 'total_time': 0, 'max_time': 0})
+            metric['count'] += 1
+            metric['total_time'] += duration
+            metric['max_time'] = max(metric['max_time'], duration)
+
+    def record_fragment(self, key, hit, duration):
+        with self.lock:
+            metric = self.fragments.setdefault(key, {
+                'hits': 0, 'misses': 0, 'render_time': 0, 'last_render_time': 0, 'saved_time': 0
+            })
+            if hit:
+                metric['hits'] += 1
+                metric['saved_time'] += metric['last_render_time']
+            else:
+                metric['misses'] += 1
+                metric['render_time'] += duration
+                metric['last_render_time'] = duration
+
+    def get_stats(self):
+        with self.lock:
+            templates = {
+                name: dict(m, avg_time=m['total_time'] / m['count'])
+                for name, m in self.templates.items()
+            }
+            fragments = {key: dict(m) for key, m in self.fragments.items()}
+        return {
+            'templates': templates,
+            'fragments': fragments,
+            'total_saved_time': sum(m['saved_time'] for m in fragments.values())
+        }
+
+
+render_stats = TemplateRenderStats()
+
+
+class FragmentCacheExtension(Extension):
+    """{% cache key, ttl, tags %} block tag"""
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache_store=cache)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if('comma') and len(args) < 3:
+            args.append(parser.parse_expression())
+        while len(args) < 3:
+            args.append(nodes.Const(None))
+
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method('_render_fragment', args), [], [], body
+        ).set_lineno(lineno)
+
+    def _render_fragment(self, key, ttl, tags, caller):
+        store = self.environment.fragment_cache_store
+        cache_key = f"fragment:{key}"
+
+        rv = store.get(cache_key)
+        if rv is not None:
+            render_stats.record_fragment(key, True, 0)
+            return rv
+
+        start = time.perf_counter()
+        rv = Markup(caller())
+        render_stats.record_fragment(key, False, time.perf_counter() - start)
+
+        if isinstance(tags, str):
+            tags = (tags,)
+        store.set(cache_key, rv, ttl or DEFAULT_FRAGMENT_TTL, tags or ())
+        return rv
+
+
+def invalidate_fragments(*tags):
+    return cache.invalidate_tags(*tags)
+
+
+def init_fragment_cache(app):
+    """Enable {% cache %} blocks and template render instrumentation"""
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.globals['fragment_cache_enabled'] = True
+
+    def template_started(sender, template, context, **extra):
+        g.setdefault('template_render_starts', []).append(time.perf_counter())
+
+    def template_finished(sender, template, context, **extra):
+        starts = g.get('template_render_starts')
+        if starts:
+            render_stats.record_template(template.name or 'string', time.perf_counter() - starts.pop())
+
+    before_render_template.connect(template_started, app, weak=False)
+    template_rendered.connect(template_finished, app, weak=False)
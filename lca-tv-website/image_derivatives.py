@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Responsive image derivatives for static/images and uploads
+
+Generates resized WebP (and AVIF when the pillow-avif plugin is installed)
+copies of each original under static/derivatives/, records them in a JSON
+manifest and exposes Jinja helpers emitting srcset/sizes markup, used by the
+ad component and by components/thumbnail.html for video and emission
+thumbnails. External URLs (YouTube thumbnails) are passed through as is.
+
+Usage:
+    python image_derivatives.py build [--force]
+    python image_derivatives.py report
+"""
+import fcntl
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+from PIL import Image
+from markupsafe import Markup, escape
+
+try:
+    import pillow_avif  # noqa: F401  (registers the AVIF codec in Pillow)
+    AVIF_AVAILABLE = True
+except ImportError:
+    AVIF_AVAILABLE = False
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
+DERIVATIVES_DIR = os.path.join(STATIC_DIR, 'derivatives')
+MANIFEST_PATH = os.path.join(DERIVATIVES_DIR, 'manifest.json')
+
+SOURCE_DIRS = ('images', os.path.join('uploads', 'images'), os.path.join('uploads', 'ads'))
+SOURCE_EXTENSIONS = {'.png', '.jpg', '.jpeg'}
+WIDTHS = (320, 640, 960, 1280, 1920)
+QUALITY = {'webp': 80, 'avif': 55}
+# Width a mobile visitor typically downloads, used by the savings report
+REPORT_WIDTH = 640
+EXTERNAL_URL = re.compile(r'^(?:[a-z][a-z0-9+.-]*:|//)', re.IGNORECASE)
+
+
+class DerivativeManifest:
+    """Mapping of original static paths to their generated derivatives"""
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self.entries = {}
+        self.loaded_mtime = None
+        self.checked_at = 0
+        self.lock = threading.Lock()
+
+    def refresh(self, max_age=5):
+        """Reload the manifest from disk if another process rewrote it"""
+        now = time.time()
+        if now - self.checked_at < max_age:
+            return
+        self.checked_at = now
+        with self.lock:
+            self.reload()
+
+    def reload(self):
+        # Appelé avec self.lock tenu (verrou non réentrant)
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime != self.loaded_mtime:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+                self.loaded_mtime = mtime
+            except (OSError, ValueError) as e:
+                print(f"Error loading image manifest: {e}")
+
+    def get(self, original):
+        self.refresh()
+        return self.entries.get(original)
+
+    def update(self, original, entry):
+        """Record an entry and persist the manifest atomically"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self.lock, open(f'{self.path}.lock', 'w') as lock:
+            # Lecture-modification-écriture exclusive entre workers et CLI
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Repartir de la dernière version écrite par un autre worker ou par la CLI
+            self.reload()
+            self.checked_at = time.time()
+            entries = dict(self.entries)
+            entries[original] = entry
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, ensure_ascii=False, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+            self.entries = entries
+            self.loaded_mtime = os.path.getmtime(self.path)
+
+
+manifest = DerivativeManifest()
+
+
+def static_relpath(path):
+    """Normalise a filesystem path or /static/ URL to a static-relative path"""
+    if os.path.isabs(path) and path.startswith(STATIC_DIR):
+        path = os.path.relpath(path, STATIC_DIR)
+    path = path.replace(os.sep, '/')
+    for prefix in ('/lca/static/', '/static/'):
+        if path.startswith(prefix):
+            return path[len(prefix):]
+    return path.lstrip('/')
+
+
+def derivative_formats():
+    return ('avif', 'webp') if AVIF_AVAILABLE else ('webp',)
+
+
+def generate_derivatives(original, force=False):
+    """Generate every width/format of one original and record it in the manifest"""
+    original = static_relpath(original)
+    source_path = os.path.join(STATIC_DIR, original)
+    stat = os.stat(source_path)
+
+    existing = manifest.get(original)
+    if existing and not force and existing.get('mtime') == int(stat.st_mtime):
+        return existing
+
+    base, _ = os.path.splitext(original)
+    variants = []
+    with Image.open(source_path) as img:
+        img.load()
+        width, height = img.size
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+
+        # Always keep at least one derivative, capped at the original width
+        widths = [w for w in WIDTHS if w < width] + [min(width, WIDTHS[-1])]
+        for target_width in sorted(set(widths)):
+            target_height = max(1, round(height * target_width / width))
+            resized = img if target_width == width else img.resize((target_width, target_height), Image.LANCZOS)
+            for fmt in derivative_formats():
+                relpath = f"derivatives/{base}-{target_width}w.{fmt}"
+                out_path = os.path.join(STATIC_DIR, relpath)
+                os.makedirs(os.path.dirname(out_path), exist_ok=True)
+                options = {'quality': QUALITY[fmt]}
+                if fmt == 'webp':
+                    options['method'] = 4
+                resized.save(out_path, fmt.upper(), **options)
+                variants.append({
+                    'path': relpath,
+                    'width': target_width,
+                    'height': target_height,
+                    'format': fmt,
+                    'bytes': os.path.getsize(out_path)
+                })
+
+    entry = {
+        'width': width,
+        'height': height,
+        'bytes': stat.st_size,
+        'mtime': int(stat.st_mtime),
+        'variants': variants
+    }
+    manifest.update(original, entry)
+    return entry
+
+
+def iter_sources():
+    for source_dir in SOURCE_DIRS:
+        root_dir = os.path.join(STATIC_DIR, source_dir)
+        for root, _, files in os.walk(root_dir):
+            for name in sorted(files):
+                if os.path.splitext(name)[1].lower() in SOURCE_EXTENSIONS:
+                    yield static_relpath(os.path.join(root, name))
+
+
+def build(force=False):
+    """Offline build: generate derivatives for every source image"""
+    generated = 0
+    for original in iter_sources():
+        try:
+            generate_derivatives(original, force=force)
+            generated += 1
+        except Exception as e:
+            print(f"❌ {original}: {e}")
+    return generated
+
+
+def process_upload(file_path):
+    """On-upload hook: generate derivatives for a freshly saved image"""
+    if os.path.splitext(file_path)[1].lower() not in SOURCE_EXTENSIONS:
+        return None
+    try:
+        return generate_derivatives(file_path)
+    except Exception as e:
+        print(f"Image derivative error for {file_path}: {e}")
+        return None
+
+
+# ============================================================================
+# Jinja helpers
+# ============================================================================
+
+def image_srcset(filename, fmt='webp'):
+    """srcset value listing every derivative width of an image"""
+    from flask import url_for
+    entry = manifest.get(static_relpath(filename))
+    if not entry:
+        return ''
+    return ', '.join(
+        f"{url_for('static', filename=v['path'])} {v['width']}w"
+        for v in entry['variants'] if v['format'] == fmt
+    )
+
+
+def is_external(filename):
+    """True for absolute URLs (YouTube thumbnails, data: URIs) that have no derivatives"""
+    return bool(EXTERNAL_URL.match(filename))
+
+
+def responsive_image(filename, alt='', sizes='100vw', loading='lazy', **attrs):
+    """<picture> element with AVIF/WebP sources falling back to the original"""
+    from flask import url_for
+    attributes = ''.join(f' {escape(k.rstrip("_").replace("_", "-"))}="{escape(v)}"' for k, v in attrs.items())
+    if loading:
+        attributes = f' loading="{escape(loading)}"' + attributes
+    if not filename or is_external(filename):
+        return Markup(f'<img src="{escape(filename or "")}" alt="{escape(alt)}"{attributes}>')
+
+    original = static_relpath(filename)
+    entry = manifest.get(original)
+    if entry:
+        attributes += f' width="{entry["width"]}" height="{entry["height"]}"'
+    img = f'<img src="{escape(url_for("static", filename=original))}" alt="{escape(alt)}"{attributes}>'
+    if not entry:
+        return Markup(img)
+
+    sources = ''.join(
+        f'<source type="image/{fmt}" srcset="{escape(image_srcset(original, fmt))}" sizes="{escape(sizes)}">'
+        for fmt in derivative_formats()
+        if any(v['format'] == fmt for v in entry['variants'])
+    )
+    return Markup(f'<picture>{sources}{img}</picture>')
+
+
+def init_image_derivatives(app):
+    """Register the responsive image helpers on a Flask app"""
+    app.jinja_env.globals['responsive_image'] = responsive_image
+    app.jinja_env.globals['image_srcset'] = image_srcset
+
+
+# ============================================================================
+# Savings report
+# ============================================================================
+
+# Les affiches ont des parenthèses dans leur nom: seule la fin de l'URL termine la référence
+IMAGE_REFERENCE = re.compile(
+    r"""(?:static/|filename=['"])((?:images|uploads)/[^'"]+?\.(?:png|jpe?g))(?=['"?#)]|\s|$)""", re.IGNORECASE)
+
+
+def report(width=REPORT_WIDTH):
+    """Bytes saved per template when serving the `width` WebP derivative"""
+    pages = {}
+    for name in sorted(os.listdir(TEMPLATES_DIR)):
+        if not name.endswith('.html'):
+            continue
+        with open(os.path.join(TEMPLATES_DIR, name), 'r', encoding='utf-8') as f:
+            images = sorted(set(IMAGE_REFERENCE.findall(f.read())))
+
+        original_bytes = derivative_bytes = 0
+        for image in images:
+            entry = manifest.get(image)
+            if not entry:
+                continue
+            webp = [v for v in entry['variants'] if v['format'] == 'webp']
+            chosen = min((v for v in webp if v['width'] >= width), key=lambda v: v['width'],
+                         default=max(webp, key=lambda v: v['width']))
+            original_bytes += entry['bytes']
+            derivative_bytes += chosen['bytes']
+
+        if images:
+            pages[name] = {
+                'images': len(images),
+                'original_bytes': original_bytes,
+                'derivative_bytes': derivative_bytes,
+                'saved_bytes': original_bytes - derivative_bytes
+            }
+    return pages
+
+
+def main(argv):
+    command = argv[1] if len(argv) > 1 else 'build'
+    if command == 'build':
+        start = time.time()
+        count = build(force='--force' in argv)
+        print(f"✅ {count} images traitées en {time.time() - start:.1f}s ({', '.join(derivative_formats())})")
+    elif command == 'report':
+        manifest.refresh(max_age=0)
+        pages = report()
+        total = 0
+        for name, stats in pages.items():
+            total += stats['saved_bytes']
+            print(f"{name:40} {stats['images']:3} images  "
+                  f"{stats['original_bytes'] / 1024:9.0f} KB -> {stats['derivative_bytes'] / 1024:7.0f} KB  "
+                  f"(-{stats['saved_bytes'] / 1024:.0f} KB)")
+        print(f"Total économisé: {total / 1024 / 1024:.1f} MB")
+    else:
+        print(__doc__)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -7,6 +7,8 @@ import sqlite3
 import os
 from datetime import datetime
 
+from migrations import migrate
+
 def create_database():
     """Créer la base de données avec toutes les tables nécessaires"""
     
@@ -168,6 +170,9 @@ def create_database():
         conn.commit()
         print("✅ Données de test insérées")
         
+        # Index et évolutions de schéma versionnés
+        migrate(conn)
+        
         # Afficher les statistiques
         cursor.execute("SELECT COUNT(*) FROM clients")
         client_count = cursor.fetchone()[0]
@@ -0,0 +1,54 @@
+"""
+JSON provider for API responses
+
+jsonify() goes through app.json; RecordJSONProvider also serializes the row
+records of row_mapping.py, and encodes with orjson when it is installed
+instead of the json module. Output keeps Flask's conventions: sorted keys,
+HTTP dates for datetime values, indentation in debug mode. orjson writes
+non-ASCII text as UTF-8 instead of \\uXXXX escapes.
+"""
+from flask.json.provider import DefaultJSONProvider
+
+from row_mapping import Record
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+def default(value):
+    if isinstance(value, Record):
+        return value.to_dict()
+    return DefaultJSONProvider.default(value)
+
+
+class RecordJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that understands row records, backed by orjson if available"""
+
+    default = staticmethod(default)
+
+    if ORJSON_AVAILABLE:
+        def dumps(self, obj, **kwargs):
+            # Dates et Decimal passent par le default de Flask, comme avant
+            if not set(kwargs) <= {'indent', 'separators'}:
+                return super().dumps(obj, **kwargs)
+            # Clés int (statistiques par jour, par id...) acceptées comme par le module json
+            option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+            if self.sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            if kwargs.get('indent'):
+                option |= orjson.OPT_INDENT_2
+            try:
+                return orjson.dumps(obj, default=self.default, option=option).decode()
+            except TypeError:
+                # Entiers hors 64 bits, clés mixtes...: le module json décide, comme avant
+                return super().dumps(obj, **kwargs)
+
+
+def init_json_provider(app):
+    """Use RecordJSONProvider for jsonify() and the |tojson filter"""
+    app.json_provider_class = RecordJSONProvider
+    app.json = RecordJSONProvider(app)
+    return app.json
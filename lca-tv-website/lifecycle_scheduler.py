@@ -0,0 +1,246 @@
+"""
+In-process scheduler and ad/subscription lifecycle transitions
+
+A single daemon thread runs periodic jobs. The built-in lifecycle job moves
+`advertisements` and `subscriptions` between states at their date boundaries
+so that serving queries only ever see rows whose status is accurate:
+
+    pending  -> active    start_date reached
+    active   -> pending   start_date still in the future
+    pending/active -> expired   end_date passed
+    expired  -> {table}_archive   ended more than ARCHIVE_AFTER_DAYS ago
+
+Archived rows are moved out of the live table (see ensure_archive_schema),
+so admin lists and serving queries stop scanning them. The statements are
+built from each database's schema: a transition to a status the table's
+CHECK constraint does not allow is skipped, and `updated_at` is only set
+where the column exists. Rows disabled by an admin ('inactive') are left
+alone. Listeners subscribed with on_change() receive the table name and
+number of transitioned rows, so the caches depending on them can be
+invalidated. The job also runs right
+after midnight, when flight dates roll over.
+"""
+import os
+import re
+import threading
+import time
+import traceback
+from datetime import date, datetime, timedelta
+
+LIFECYCLE_INTERVAL = 300
+ARCHIVE_AFTER_DAYS = 90
+LIFECYCLE_TABLES = ('advertisements', 'subscriptions')
+LIFECYCLE_COLUMNS = {'status', 'start_date', 'end_date'}
+
+# (new status, rows that move to it)
+TRANSITIONS = (
+    ('active', "status = 'pending' AND start_date <= :today AND end_date >= :today"),
+    ('pending', "status = 'active' AND start_date > :today"),
+    ('expired', "status IN ('active', 'pending') AND end_date < :today"),
+)
+ARCHIVE_CONDITION = "status = 'expired' AND end_date < :archive_before"
+STATUS_CHECK = re.compile(r"CHECK\s*\(\s*status\s+IN\s*\(([^)]*)\)\s*\)", re.IGNORECASE)
+
+
+def table_columns(cursor, table):
+    return [row[1] for row in cursor.execute(f'PRAGMA table_info({table})').fetchall()]
+
+
+def allowed_statuses(cursor, table):
+    """Statuses permitted by the CHECK constraint on `status`, or None if unconstrained"""
+    row = cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+    match = STATUS_CHECK.search(row[0] or '') if row else None
+    return set(re.findall(r"'([^']*)'", match.group(1))) if match else None
+
+
+def ensure_archive_schema(conn):
+    """Create {table}_archive for each lifecycle table, with the columns of the live table"""
+    cursor = conn.cursor()
+    for table in LIFECYCLE_TABLES:
+        columns = table_columns(cursor, table)
+        if not LIFECYCLE_COLUMNS <= set(columns):
+            continue
+        archive = f'{table}_archive'
+        # Sans contraintes: les lignes archivées gardent leurs valeurs telles quelles
+        cursor.execute(f'CREATE TABLE IF NOT EXISTS {archive} AS SELECT * FROM {table} WHERE 0')
+        archived = set(table_columns(cursor, archive))
+        for column in columns + ['archived_at']:
+            if column not in archived:
+                cursor.execute(f'ALTER TABLE {archive} ADD COLUMN {column}')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{archive}_end_date ON {archive} (end_date)')
+    conn.commit()
+
+
+class Scheduler:
+    """Runs registered jobs every `interval` seconds in one daemon thread"""
+
+    def __init__(self):
+        self.jobs = []             # [name, interval, function, next_run]
+        self.lock = threading.Lock()
+        self.start_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.pid = None
+        self.last_runs = {}        # name -> (finished_at, duration, error)
+        self.teardowns = []        # called after every job, e.g. ConnectionPool.release
+
+    def add_job(self, name, interval, function, run_now=True):
+        with self.lock:
+            self.jobs.append([name, interval, function, 0 if run_now else time.time() + interval])
+        self.wakeup.set()
+
+    def start(self):
+        """Start the scheduler thread (again in a forked worker)"""
+        if self.pid == os.getpid() and self.thread and self.thread.is_alive():
+            return
+        with self.start_lock:
+            # Premières requêtes simultanées: un seul thread par processus
+            if self.pid == os.getpid() and self.thread and self.thread.is_alive():
+                return
+            self.pid = os.getpid()
+            self.thread = threading.Thread(target=self.run_loop, name='scheduler', daemon=True)
+            self.thread.start()
+
+    def run_pending(self):
+        now = time.time()
+        with self.lock:
+            due = [job for job in self.jobs if job[3] <= now]
+            for job in due:
+                job[3] = now + job[1]
+
+        for name, _, function, _ in due:
+            start = time.perf_counter()
+            error = None
+            try:
+                function()
+            except Exception as e:
+                error = str(e)
+                print(f"Scheduled job {name} failed: {e}")
+                traceback.print_exc()
+            finally:
+                # Un job interrompu ne doit pas garder une transaction (et le verrou d'écriture) ouverte
+                for teardown in self.teardowns:
+                    teardown()
+            self.last_runs[name] = (datetime.now().isoformat(), time.perf_counter() - start, error)
+
+    def seconds_until_next(self):
+        with self.lock:
+            next_run = min((job[3] for job in self.jobs), default=time.time() + 60)
+        return max(0.0, next_run - time.time())
+
+    def run_loop(self):
+        while True:
+            self.run_pending()
+            self.wakeup.wait(self.seconds_until_next())
+            self.wakeup.clear()
+
+    def get_stats(self):
+        with self.lock:
+            jobs = {name: {'interval': interval, 'next_run': datetime.fromtimestamp(next_run).isoformat()}
+                    for name, interval, _, next_run in self.jobs}
+        for name, (finished_at, duration, error) in self.last_runs.items():
+            jobs.setdefault(name, {}).update(last_run=finished_at, duration=duration, error=error)
+        return jobs
+
+
+class LifecycleManager:
+    """Status transitions of dated rows"""
+
+    def __init__(self, db_manager, archive_after_days=ARCHIVE_AFTER_DAYS):
+        self.db = db_manager
+        self.archive_after_days = archive_after_days
+        self.listeners = []
+        self.transitions = 0
+        self.statements = None     # {table: [(sql, is_archive), ...]} for this database's schema
+
+    def on_change(self, listener):
+        """Register listener(table, changed_rows), called after each commit"""
+        self.listeners.append(listener)
+        return listener
+
+    def resolve_statements(self, cursor):
+        """Transition and archive statements each table of this database supports"""
+        if self.statements is not None:
+            return self.statements
+        statements = {}
+        for table in LIFECYCLE_TABLES:
+            columns = table_columns(cursor, table)
+            if not LIFECYCLE_COLUMNS <= set(columns):
+                continue
+            allowed = allowed_statuses(cursor, table)
+            touch = ', updated_at = :now' if 'updated_at' in columns else ''
+            table_statements = [(f"UPDATE {table} SET status = '{status}'{touch} WHERE {condition}", False)
+                                for status, condition in TRANSITIONS if allowed is None or status in allowed]
+
+            archived = table_columns(cursor, f'{table}_archive')
+            if archived:
+                shared = ', '.join(column for column in columns if column in archived)
+                table_statements.append((f'INSERT INTO {table}_archive ({shared}, archived_at) '
+                                         f'SELECT {shared}, :now FROM {table} WHERE {ARCHIVE_CONDITION}', True))
+                table_statements.append((f'DELETE FROM {table} WHERE {ARCHIVE_CONDITION}', False))
+            statements[table] = table_statements
+        self.statements = statements
+        return statements
+
+    def run(self, today=None):
+        """Apply every due transition in one transaction; returns {table: rows}"""
+        today = (today or date.today()).isoformat()
+        archive_before = (date.fromisoformat(today) - timedelta(days=self.archive_after_days)).isoformat()
+        params = {'today': today, 'archive_before': archive_before, 'now': datetime.now()}
+
+        changed = {}
+        conn = self.db.get_connection()
+        try:
+            cursor = conn.cursor()
+            for table, statements in self.resolve_statements(cursor).items():
+                rows = 0
+                for sql, is_archive in statements:
+                    cursor.execute(sql, params)
+                    # Une ligne archivée compte une fois (copie puis suppression)
+                    if not is_archive:
+                        rows += cursor.rowcount
+                if rows:
+                    changed[table] = rows
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        for table, rows in changed.items():
+            self.transitions += rows
+            for listener in self.listeners:
+                listener(table, rows)
+        return changed
+
+
+def seconds_until_midnight():
+    tomorrow = datetime.combine(date.today() + timedelta(days=1), datetime.min.time())
+    return (tomorrow - datetime.now()).total_seconds()
+
+
+def init_lifecycle_scheduler(app, db_manager, interval=LIFECYCLE_INTERVAL):
+    """Scheduler of an app with the lifecycle job; the thread starts on the first request"""
+    scheduler = Scheduler()
+    lifecycle = LifecycleManager(db_manager)
+    pool = getattr(db_manager, 'pool', None)
+    if pool is not None:
+        scheduler.teardowns.append(pool.release)
+
+    def lifecycle_job():
+        lifecycle.run()
+        # Repasser juste après minuit, quand les dates de diffusion basculent
+        with scheduler.lock:
+            for job in scheduler.jobs:
+                if job[0] == 'lifecycle':
+                    job[3] = min(job[3], time.time() + seconds_until_midnight() + 1)
+
+    scheduler.add_job('lifecycle', interval, lifecycle_job)
+
+    @app.before_request
+    def start_scheduler():
+        scheduler.start()
+
+    app.extensions['scheduler'] = scheduler
+    return scheduler, lifecycle
@@ -0,0 +1,411 @@
+"""
+Background media processing for ad creatives and media library uploads
+
+Uploads are saved as-is by the request, then a job is persisted in the
+`media_jobs` table and picked up by in-process worker threads that validate
+the image, scale it to fit the target ad space (never cropped), build a
+thumbnail and optimized encodings, and record every variant in `media_files`.
+An ad whose creative fails validation is deactivated and stops pointing at
+the rejected file.
+"""
+import json
+import mimetypes
+import os
+import threading
+import traceback
+from datetime import datetime
+
+from PIL import Image, ImageOps
+
+from image_derivatives import process_upload as generate_responsive_derivatives
+
+MAX_ATTEMPTS = 3
+MAX_PIXELS = 40_000_000
+THUMBNAIL_SIZE = (320, 320)
+STALE_JOB_SECONDS = 600
+JPEG_QUALITY = 85
+WEBP_QUALITY = 80
+
+
+def ensure_media_schema(conn):
+    """Create the job table and the variant columns of media_files"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS media_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            source_path TEXT NOT NULL,
+            params TEXT,
+            status TEXT DEFAULT 'queued',
+            attempts INTEGER DEFAULT 0,
+            error TEXT,
+            result TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS media_files (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            filename TEXT NOT NULL,
+            original_filename TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            file_type TEXT NOT NULL,
+            file_size INTEGER,
+            mime_type TEXT,
+            uploaded_by INTEGER,
+            description TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (uploaded_by) REFERENCES users (id)
+        )
+    ''')
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(media_files)')}
+    for column, definition in (('parent_id', 'INTEGER'), ('variant', 'TEXT'),
+                               ('width', 'INTEGER'), ('height', 'INTEGER')):
+        if column not in columns:
+            conn.execute(f'ALTER TABLE media_files ADD COLUMN {column} {definition}')
+    conn.commit()
+
+
+class MediaJobQueue:
+    """SQLite-backed job queue drained by in-process worker threads"""
+
+    def __init__(self, db_manager, static_folder, workers=2):
+        self.db = db_manager
+        self.static_folder = static_folder
+        self.workers = workers
+        self.processors = {
+            'ad_creative': self.process_ad_creative,
+            'media_upload': self.process_media_upload
+        }
+        self.wakeup = threading.Event()
+        self.lock = threading.Lock()
+        self.threads = []
+        self.pid = None
+        self.schema_ready = False
+        # Callback run once an ad creative was replaced by its resized variant
+        self.on_ad_updated = None
+
+    # ------------------------------------------------------------------
+    # Queue management
+    # ------------------------------------------------------------------
+
+    def ensure_schema(self):
+        if not self.schema_ready:
+            conn = self.db.get_connection()
+            ensure_media_schema(conn)
+            conn.close()
+            self.schema_ready = True
+
+    def start(self):
+        """Start the workers (again after a fork) and requeue stale jobs"""
+        with self.lock:
+            if self.pid == os.getpid() and all(t.is_alive() for t in self.threads):
+                return
+            self.ensure_schema()
+            self.requeue_stale_jobs()
+            self.pid = os.getpid()
+            self.threads = []
+            for i in range(self.workers):
+                thread = threading.Thread(target=self.worker_loop, name=f'media-worker-{i}', daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def enqueue(self, kind, source_path, **params):
+        """Persist a job and wake a worker; returns the job id"""
+        self.start()
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO media_jobs (kind, source_path, params)
+            VALUES (?, ?, ?)
+        ''', (kind, source_path, json.dumps(params)))
+        job_id = cursor.lastrowid
+        conn.commit()
+        conn.close()
+        self.wakeup.set()
+        return job_id
+
+    def get_job(self, job_id):
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM media_jobs WHERE id = ?', (job_id,))
+        row = cursor.fetchone()
+        conn.close()
+        if not row:
+            return None
+        job = dict(row)
+        job['params'] = json.loads(job['params'] or '{}')
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def requeue_stale_jobs(self):
+        """Jobs left 'running' by a dead worker go back to the queue"""
+        conn = self.db.get_connection()
+        conn.execute('''
+            UPDATE media_jobs SET status = 'queued', updated_at = ?
+            WHERE status = 'running' AND updated_at < datetime('now', ?)
+        ''', (datetime.now(), f'-{STALE_JOB_SECONDS} seconds'))
+        conn.commit()
+        conn.close()
+
+    def claim_next(self):
+        """Atomically mark the oldest queued job as running"""
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        try:
+            while True:
+                cursor.execute('''
+                    SELECT * FROM media_jobs
+                    WHERE status = 'queued' AND attempts < ?
+                    ORDER BY id LIMIT 1
+                ''', (MAX_ATTEMPTS,))
+                job = cursor.fetchone()
+                if not job:
+                    return None
+
+                cursor.execute('''
+                    UPDATE media_jobs SET status = 'running', attempts = attempts + 1, updated_at = ?
+                    WHERE id = ? AND status = 'queued'
+                ''', (datetime.now(), job['id']))
+                conn.commit()
+                if cursor.rowcount == 1:
+                    return dict(job)
+        finally:
+            conn.close()
+
+    def finish(self, job_id, status, result=None, error=None):
+        conn = self.db.get_connection()
+        conn.execute('''
+            UPDATE media_jobs SET status = ?, result = ?, error = ?, updated_at = ?
+            WHERE id = ?
+        ''', (status, json.dumps(result) if result is not None else None, error, datetime.now(), job_id))
+        conn.commit()
+        conn.close()
+
+    def worker_loop(self):
+        while True:
+            try:
+                job = self.claim_next()
+            except Exception as e:
+                print(f"Media job queue error: {e}")
+                job = None
+
+            if job is None:
+                self.wakeup.wait(timeout=30)
+                self.wakeup.clear()
+                continue
+
+            try:
+                self.run_job(job)
+            except Exception:
+                # Ne jamais laisser mourir le worker; le job sera repris comme 'running' périmé
+                traceback.print_exc()
+
+    def run_job(self, job):
+        result = error = None
+        params = {}
+        try:
+            params = json.loads(job['params'] or '{}')
+            result = self.processors[job['kind']](job['source_path'], **params)
+            status = 'done'
+        except ValueError as e:
+            # Fichier invalide: inutile de réessayer
+            print(f"Media job {job['id']} rejected: {e}")
+            status, error = 'failed', str(e)
+            if job['kind'] == 'ad_creative':
+                try:
+                    self.reject_ad_creative(job['source_path'], params.get('ad_id'))
+                except Exception:
+                    traceback.print_exc()
+        except Exception as e:
+            traceback.print_exc()
+            status = 'failed' if job['attempts'] + 1 >= MAX_ATTEMPTS else 'queued'
+            error = str(e)
+
+        try:
+            self.finish(job['id'], status, result=result, error=error)
+        except Exception as e:
+            traceback.print_exc()
+            self.finish(job['id'], 'failed', error=f"{error or 'finish'}: {e}")
+
+    # ------------------------------------------------------------------
+    # Image processing
+    # ------------------------------------------------------------------
+
+    def open_image(self, source_path):
+        """Validate an upload and return it decoded, with EXIF orientation applied"""
+        try:
+            with Image.open(source_path) as img:
+                img.verify()
+        except Exception as e:
+            raise ValueError(f'Image invalide: {e}')
+
+        img = Image.open(source_path)
+        if img.width * img.height > MAX_PIXELS:
+            img.close()
+            raise ValueError('Image trop grande')
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+        return img
+
+    def static_url(self, path):
+        return '/static/' + os.path.relpath(os.path.abspath(path), self.static_folder).replace(os.sep, '/')
+
+    def save_variant(self, img, source_path, suffix, fmt):
+        """Encode one variant next to the original, under variants/"""
+        directory = os.path.join(os.path.dirname(source_path), 'variants')
+        os.makedirs(directory, exist_ok=True)
+        name = os.path.splitext(os.path.basename(source_path))[0]
+        extension = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}[fmt]
+        path = os.path.join(directory, f"{name}-{suffix}.{extension}")
+
+        if fmt == 'JPEG':
+            img.convert('RGB').save(path, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+        elif fmt == 'PNG':
+            img.save(path, 'PNG', optimize=True)
+        else:
+            img.save(path, 'WEBP', quality=WEBP_QUALITY, method=4)
+
+        return {
+            'variant': f"{suffix}-{extension}",
+            'path': path,
+            'url': self.static_url(path),
+            'width': img.width,
+            'height': img.height,
+            'bytes': os.path.getsize(path),
+            'mime_type': mimetypes.guess_type(path)[0]
+        }
+
+    def encode_variants(self, img, source_path, suffix):
+        """Optimized original-format encoding plus a WebP one"""
+        fallback = 'PNG' if img.mode == 'RGBA' else 'JPEG'
+        return [self.save_variant(img, source_path, suffix, fallback),
+                self.save_variant(img, source_path, suffix, 'WEBP')]
+
+    def contained(self, img, width, height):
+        """The image scaled down to fit inside width x height, never cropped nor enlarged"""
+        resized = img.copy()
+        resized.thumbnail((int(width), int(height)), Image.LANCZOS)
+        return resized
+
+    def build_variants(self, source_path, width=None, height=None):
+        img = self.open_image(source_path)
+        variants = []
+        try:
+            if width and height:
+                width, height = int(width), int(height)
+                variants += self.encode_variants(self.contained(img, width, height), source_path,
+                                                 f"{width}x{height}")
+                # Version haute densité si la source dépasse l'espace
+                if img.width > width or img.height > height:
+                    variants += self.encode_variants(self.contained(img, width * 2, height * 2), source_path,
+                                                     f"{width}x{height}@2x")
+
+            thumbnail = img.copy()
+            thumbnail.thumbnail(THUMBNAIL_SIZE, Image.LANCZOS)
+            variants += self.encode_variants(thumbnail, source_path, 'thumb')
+            return img.size, variants
+        finally:
+            img.close()
+
+    def record_variants(self, conn, parent_id, source_path, variants, uploaded_by=None):
+        cursor = conn.cursor()
+        for variant in variants:
+            cursor.execute('''
+                INSERT INTO media_files
+                (filename, original_filename, file_path, file_type, file_size, mime_type,
+                 uploaded_by, description, parent_id, variant, width, height)
+                VALUES (?, ?, ?, 'image', ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (os.path.basename(variant['path']), os.path.basename(source_path), variant['path'],
+                  variant['bytes'], variant['mime_type'], uploaded_by,
+                  f"Variante {variant['variant']}", parent_id, variant['variant'],
+                  variant['width'], variant['height']))
+
+    def process_ad_creative(self, source_path, ad_id=None, width=None, height=None, uploaded_by=None):
+        """Resize an ad creative to its ad space and point the ad at the result"""
+        (source_width, source_height), variants = self.build_variants(source_path, width, height)
+        generate_responsive_derivatives(source_path)
+
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO media_files
+            (filename, original_filename, file_path, file_type, file_size, mime_type,
+             uploaded_by, description, width, height)
+            VALUES (?, ?, ?, 'image', ?, ?, ?, ?, ?, ?)
+        ''', (os.path.basename(source_path), os.path.basename(source_path), source_path,
+              os.path.getsize(source_path), mimetypes.guess_type(source_path)[0], uploaded_by,
+              f'Publicité {ad_id}', source_width, source_height))
+        media_id = cursor.lastrowid
+        self.record_variants(conn, media_id, source_path, variants, uploaded_by)
+
+        # Servir la version redimensionnée (encodage optimisé) à la place de l'original
+        sized = [v for v in variants if not v['variant'].startswith('thumb') and not v['variant'].endswith('webp')]
+        if ad_id and sized:
+            original_url = self.static_url(source_path)
+            columns = {row[1] for row in cursor.execute('PRAGMA table_info(advertisements)')}
+            for column in ('image_url', 'media_url', 'ad_content', 'html_content'):
+                if column in columns:
+                    cursor.execute(f'UPDATE advertisements SET {column} = REPLACE({column}, ?, ?) WHERE id = ?',
+                                   (original_url, sized[0]['url'], ad_id))
+            if 'updated_at' in columns:
+                cursor.execute('UPDATE advertisements SET updated_at = ? WHERE id = ?', (datetime.now(), ad_id))
+        conn.commit()
+        conn.close()
+
+        if self.on_ad_updated and ad_id:
+            self.on_ad_updated(ad_id)
+        return {'media_id': media_id, 'variants': [v['url'] for v in variants]}
+
+    def reject_ad_creative(self, source_path, ad_id):
+        """Deactivate an ad whose uploaded creative is invalid and drop the file"""
+        if ad_id:
+            original_url = self.static_url(source_path)
+            conn = self.db.get_connection()
+            try:
+                columns = {row[1] for row in conn.execute('PRAGMA table_info(advertisements)')}
+                # Vider les colonnes qui référencent encore le fichier rejeté
+                references = {'image_url': original_url, 'media_url': original_url, 'ad_content': original_url,
+                              'html_content': original_url, 'media_filename': os.path.basename(source_path)}
+                assignments, params = [], []
+                for column, value in references.items():
+                    if column in columns:
+                        assignments.append(f"{column} = CASE WHEN instr({column}, ?) THEN '' ELSE {column} END")
+                        params.append(value)
+                assignments.append("status = 'inactive'")
+                if 'updated_at' in columns:
+                    assignments.append('updated_at = ?')
+                    params.append(datetime.now())
+                conn.execute(f"UPDATE advertisements SET {', '.join(assignments)} WHERE id = ?", params + [ad_id])
+                conn.commit()
+            finally:
+                conn.close()
+        try:
+            os.remove(source_path)
+        except OSError:
+            pass
+        if self.on_ad_updated and ad_id:
+            self.on_ad_updated(ad_id)
+
+    def process_media_upload(self, source_path, media_id=None, uploaded_by=None):
+        """Thumbnail and optimized encodings for a media library image"""
+        (source_width, source_height), variants = self.build_variants(source_path)
+        generate_responsive_derivatives(source_path)
+
+        conn = self.db.get_connection()
+        conn.execute('UPDATE media_files SET width = ?, height = ? WHERE id = ?',
+                     (source_width, source_height, media_id))
+        self.record_variants(conn, media_id, source_path, variants, uploaded_by)
+        conn.commit()
+        conn.close()
+        return {'media_id': media_id, 'dimensions': f"{source_width}x{source_height}",
+                'variants': [v['url'] for v in variants]}
+
+
+def init_media_jobs(app, db_manager, workers=2):
+    """Create the upload job queue of an app; workers start on first use"""
+    queue = MediaJobQueue(db_manager, app.static_folder, workers)
+    queue.ensure_schema()
+    app.extensions['media_jobs'] = queue
+    return queue
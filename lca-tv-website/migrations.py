@@ -0,0 +1,248 @@
+"""
+Versioned schema migrations
+
+The databases in use were created by different scripts (init_database.py,
+models.DatabaseManager, earlier app variants) and disagree on their schema.
+Schema changes are therefore applied as numbered migrations, recorded in a
+`schema_version` table, and every step only touches the tables and columns
+that exist in the database at hand:
+
+    from migrations import migrate
+    migrate(conn)          # applies the pending migrations, returns their versions
+
+A migration must be idempotent. Each step runs in its own BEGIN IMMEDIATE
+transaction: the runner takes the write lock, re-reads schema_version and
+only then applies the step and records its version, so workers booting
+together never apply a step twice. The ensure_* helpers commit for their
+other callers; inside a step those commits are deferred to the runner. New
+schema work goes at the end of MIGRATIONS rather than in ad-hoc ensure_*
+calls at startup. The modules owning each piece of schema are imported by their
+migration only, so importing this module (and models.py) stays cheap.
+"""
+from datetime import datetime
+
+MIGRATIONS = []
+
+# name -> (table, columns, unique). Serves the hot queries checked by
+# tests/test_query_plans.py; skipped when the table or a column is missing.
+HOT_PATH_INDEXES = {
+    'idx_advertisements_status_dates': ('advertisements', ('status', 'start_date', 'end_date'), False),
+    'idx_advertisements_position_status': ('advertisements', ('position', 'status'), False),
+    'idx_advertisements_created_at': ('advertisements', ('created_at',), False),
+    'ux_ad_stats_ad_date': ('ad_stats', ('advertisement_id', 'date'), True),
+    'idx_subscriptions_status_dates': ('subscriptions', ('status', 'start_date', 'end_date'), False),
+    'idx_clients_status': ('clients', ('status',), False),
+    'idx_activity_logs_created_at': ('activity_logs', ('created_at',), False),
+    'idx_videos_category_created_at': ('videos', ('category', 'created_at'), False),
+    'idx_videos_status_created_at': ('videos', ('status', 'created_at'), False),
+    'ux_videos_youtube_id': ('videos', ('youtube_id',), True),
+    'idx_media_files_parent_created': ('media_files', ('parent_id', 'created_at'), False),
+}
+
+
+def migration(version, description):
+    """Register a migration function under a version number"""
+    def register(function):
+        MIGRATIONS.append((version, description, function))
+        MIGRATIONS.sort(key=lambda entry: entry[0])
+        return function
+    return register
+
+
+def table_columns(conn, table):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+
+
+def has_index(conn, table, columns, unique=False):
+    """True when an existing index starts with `columns` (and is unique if required)"""
+    for index in conn.execute(f'PRAGMA index_list({table})').fetchall():
+        name, is_unique = index[1], index[2]
+        if unique and not is_unique:
+            continue
+        indexed = tuple(row[2] for row in conn.execute(f'PRAGMA index_info({name})'))
+        if indexed[:len(columns)] == tuple(columns) and (not unique or len(indexed) == len(columns)):
+            return True
+    return False
+
+
+def merge_ad_stats_duplicates(conn):
+    """Fold duplicate (advertisement_id, date) rows of ad_stats into the oldest one"""
+    conn.execute('''
+        UPDATE ad_stats SET
+            impressions = (SELECT SUM(COALESCE(d.impressions, 0)) FROM ad_stats d
+                           WHERE d.advertisement_id = ad_stats.advertisement_id AND d.date = ad_stats.date),
+            clicks = (SELECT SUM(COALESCE(d.clicks, 0)) FROM ad_stats d
+                      WHERE d.advertisement_id = ad_stats.advertisement_id AND d.date = ad_stats.date)
+        WHERE rowid IN (SELECT MIN(rowid) FROM ad_stats GROUP BY advertisement_id, date HAVING COUNT(*) > 1)
+    ''')
+    conn.execute('''
+        DELETE FROM ad_stats
+        WHERE rowid NOT IN (SELECT MIN(rowid) FROM ad_stats GROUP BY advertisement_id, date)
+    ''')
+
+
+# table -> function merging the rows that would violate its unique index
+MERGE_DUPLICATES = {
+    'ad_stats': merge_ad_stats_duplicates,
+}
+
+
+def count_duplicates(conn, table, columns):
+    return conn.execute(f'''
+        SELECT COUNT(*) FROM (SELECT 1 FROM {table} WHERE {' AND '.join(f'{c} IS NOT NULL' for c in columns)}
+                              GROUP BY {', '.join(columns)} HAVING COUNT(*) > 1)
+    ''').fetchone()[0]
+
+
+def create_index(conn, name, table, columns, unique=False):
+    """Create one index if the table has the columns and nothing covers it yet"""
+    available = table_columns(conn, table)
+    if not available or not set(columns) <= available or has_index(conn, table, columns, unique):
+        return False
+
+    column_list = ', '.join(columns)
+    if unique:
+        duplicates = count_duplicates(conn, table, columns)
+        if duplicates and table in MERGE_DUPLICATES:
+            # ad_counters écrit avec ON CONFLICT(advertisement_id, date): l'index unique est indispensable
+            MERGE_DUPLICATES[table](conn)
+            print(f"🗄️ {duplicates} doublon(s) fusionné(s) dans {table}")
+            duplicates = count_duplicates(conn, table, columns)
+        if duplicates:
+            print(f"⚠️ Index unique {name} non créé: {duplicates} doublon(s) dans {table}")
+            return False
+
+    conn.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name} ON {table} ({column_list})")
+    return True
+
+
+def ensure_version_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def current_version(conn):
+    ensure_version_table(conn)
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+class StepConnection:
+    """Connection handed to a migration step; its commits are left to the runner"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+    def commit(self):
+        pass
+
+
+def migrate(conn):
+    """Apply pending migrations in order; returns the versions applied"""
+    applied = []
+    version = current_version(conn)
+    conn.commit()
+    for number, description, function in MIGRATIONS:
+        if number <= version:
+            continue
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Relue sous le verrou d'écriture: un autre worker a pu appliquer l'étape entre-temps
+            version = current_version(conn)
+            if number <= version:
+                conn.rollback()
+                continue
+            function(StepConnection(conn))
+            conn.execute('INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)',
+                         (number, description, datetime.now()))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(number)
+        print(f"🗄️ Migration {number} appliquée: {description}")
+    return applied
+
+
+@migration(1, 'Delivery columns of advertisements (weight, target, frequency cap)')
+def add_delivery_columns(conn):
+    from ad_selection import ensure_selection_schema
+    ensure_selection_schema(conn)
+
+
+@migration(2, 'Hourly and monthly ad rollups, daily reach sketches')
+def add_ad_rollups(conn):
+    from ad_counters import ensure_rollup_schema
+    if table_columns(conn, 'ad_stats'):
+        ensure_rollup_schema(conn)
+
+
+@migration(3, 'Materialized dashboard counters')
+def add_dashboard_counters(conn):
+    from dashboard_counters import ensure_dashboard_schema
+    ensure_dashboard_schema(conn)
+
+
+@migration(4, 'Media job queue and image variant columns')
+def add_media_jobs(conn):
+    from media_jobs import ensure_media_schema
+    ensure_media_schema(conn)
+
+
+@migration(5, 'Hot-path indexes and unique constraints')
+def add_hot_path_indexes(conn):
+    for name, (table, columns, unique) in HOT_PATH_INDEXES.items():
+        create_index(conn, name, table, columns, unique)
+
+
+@migration(6, 'Settings version counter')
+def add_settings_version(conn):
+    from settings_snapshot import ensure_settings_version_schema
+    ensure_settings_version_schema(conn)
+
+
+@migration(7, 'Content hash of videos for bulk upserts')
+def add_video_content_hash(conn):
+    columns = table_columns(conn, 'videos')
+    if columns and 'content_hash' not in columns:
+        conn.execute('ALTER TABLE videos ADD COLUMN content_hash TEXT')
+
+
+@migration(8, 'Full-text search index over videos and articles')
+def add_search_index(conn):
+    from search_index import ensure_search_schema
+    ensure_search_schema(conn)
+
+
+@migration(9, 'Daily analytics rollups')
+def add_analytics_rollups(conn):
+    from analytics_events import ensure_analytics_schema
+    ensure_analytics_schema(conn)
+
+
+@migration(10, 'Catalog version counter for the page cache')
+def add_catalog_version(conn):
+    from page_cache import ensure_catalog_version_schema
+    ensure_catalog_version_schema(conn)
+
+
+@migration(11, 'Archive tables for ended ads and subscriptions')
+def add_lifecycle_archives(conn):
+    from lifecycle_scheduler import ensure_archive_schema
+    ensure_archive_schema(conn)
+
+
+@migration(12, 'Merge duplicate ad_stats rows and enforce one row per ad and day')
+def add_ad_stats_unique_index(conn):
+    create_index(conn, 'ux_ad_stats_ad_date', *HOT_PATH_INDEXES['ux_ad_stats_ad_date'])
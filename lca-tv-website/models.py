@@ -6,28 +6,90 @@ Complete backend functionality for dashboard management
 
 import sqlite3
 import os
+import threading
 import json
+import hashlib
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
 import uuid
 from typing import List, Dict, Optional, Any
 
+from db_pool import ConnectionPool
+from migrations import migrate, latest_version
+from settings_snapshot import SettingsSnapshot
+from row_mapping import Projection, fetch_records
+
+# Bump when insert_default_data() changes, so existing databases get re-seeded
+SEED_VERSION = 1
+
+# Columns returned by the list methods (no password hashes, no updated_at)
+PACKAGE_COLUMNS = Projection('publicity_packages', (
+    'id', 'name', 'description', 'price_monthly', 'features', 'max_ads', 'positions'))
+SUBSCRIPTION_COLUMNS = Projection('publicity_subscriptions', (
+    'id', 'client_name', 'client_email', 'client_phone', 'company_name', 'package_type',
+    'duration_months', 'price', 'start_date', 'end_date', 'status', 'payment_status',
+    'created_by', 'created_at'), alias='s')
+ADVERTISEMENT_COLUMNS = Projection('advertisements', (
+    'id', 'subscription_id', 'title', 'content', 'media_type', 'media_url', 'media_filename',
+    'position', 'start_date', 'end_date', 'status', 'impressions', 'clicks', 'created_by',
+    'created_at'), alias='a')
+VIDEO_COLUMNS = Projection('videos', (
+    'id', 'youtube_id', 'title', 'description', 'thumbnail_url', 'category', 'duration',
+    'published_at', 'view_count', 'like_count', 'is_featured', 'is_live', 'status',
+    'created_by', 'created_at'), alias='v')
+
+# Video fields refreshed by bulk_upsert(); category, featured flag and status
+# are editorial and only set when a video is first inserted
+VIDEO_CONTENT_FIELDS = ('title', 'description', 'thumbnail_url', 'duration', 'published_at',
+                        'view_count', 'like_count', 'is_live')
+
 class DatabaseManager:
     """Main database manager for LCA TV"""
     
     def __init__(self, db_path='lcatv.db'):
+        # No I/O here: the database is checked on first use
         self.db_path = db_path
-        self.init_database()
+        self.pool = ConnectionPool(db_path)
+        self.initialized = False
+        self.init_lock = threading.Lock()
     
     def get_connection(self):
-        """Get database connection"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+        """Get the calling thread's pooled connection (close() releases it)"""
+        if not self.initialized:
+            self.ensure_initialized()
+        return self.pool.get_connection()
+    
+    def ensure_initialized(self):
+        """Create/migrate/seed the database unless it is already up to date"""
+        with self.init_lock:
+            if self.initialized:
+                return
+            if not self.is_up_to_date():
+                self.init_database()
+            self.initialized = True
+    
+    def is_up_to_date(self) -> bool:
+        """Single-row check of the schema version and the seed version"""
+        conn = self.pool.get_connection()
+        try:
+            row = conn.execute('''
+                SELECT (SELECT MAX(version) FROM schema_version),
+                       (SELECT user_version FROM pragma_user_version)
+            ''').fetchone()
+        except sqlite3.OperationalError:
+            return False  # no schema_version table yet
+        finally:
+            conn.close()
+        return row[0] == latest_version() and row[1] == SEED_VERSION
+    
+    def transaction(self):
+        """Context manager committing on success and rolling back on error"""
+        self.ensure_initialized()
+        return self.pool.transaction()
     
     def init_database(self):
         """Initialize database with all required tables"""
-        conn = self.get_connection()
+        conn = self.pool.get_connection()
         cursor = conn.cursor()
         
         # Users table
@@ -201,6 +263,9 @@ class DatabaseManager:
         ''')
         
         conn.commit()
+        
+        # Versioned schema changes and hot-path indexes
+        migrate(conn)
         conn.close()
         
         # Insert default data
@@ -208,7 +273,7 @@ class DatabaseManager:
     
     def insert_default_data(self):
         """Insert default data for the application"""
-        conn = self.get_connection()
+        conn = self.pool.get_connection()
         cursor = conn.cursor()
         
         # Default admin user
@@ -255,6 +320,8 @@ class DatabaseManager:
                     VALUES (?, ?, ?, ?)
                 ''', (key, value, desc, category))
         
+        # Recorded in the database header, read back by is_up_to_date()
+        cursor.execute(f'PRAGMA user_version = {SEED_VERSION}')
         conn.commit()
         conn.close()
 
@@ -326,7 +393,7 @@ class UserManager:
         query += ' ORDER BY created_at DESC'
         
         cursor.execute(query, params)
-        users = [dict(row) for row in cursor.fetchall()]
+        users = fetch_records(cursor, 'User')
         conn.close()
         return users
     
@@ -378,14 +445,12 @@ class PublicityManager:
         conn = self.db.get_connection()
         cursor = conn.cursor()
         
-        cursor.execute('SELECT * FROM publicity_packages WHERE is_active = 1 ORDER BY price_monthly')
-        packages = []
-        for row in cursor.fetchall():
-            package = dict(row)
-            package['features'] = json.loads(package['features']) if package['features'] else []
-            package['positions'] = json.loads(package['positions']) if package['positions'] else []
-            packages.append(package)
-        
+        cursor.execute(f'''
+            SELECT {PACKAGE_COLUMNS.sql(self.db)} FROM publicity_packages
+            WHERE is_active = 1 ORDER BY price_monthly
+        ''')
+        # features/positions: JSON decoded once per distinct value, shared as tuples
+        packages = fetch_records(cursor, 'Package', json_fields=('features', 'positions'))
         conn.close()
         return packages
     
@@ -424,8 +489,8 @@ class PublicityManager:
         conn = self.db.get_connection()
         cursor = conn.cursor()
         
-        query = '''
-            SELECT s.*, u.username as created_by_username
+        query = f'''
+            SELECT {SUBSCRIPTION_COLUMNS.sql(self.db)}, u.username as created_by_username
             FROM publicity_subscriptions s
             LEFT JOIN users u ON s.created_by = u.id
         '''
@@ -438,7 +503,7 @@ class PublicityManager:
         query += ' ORDER BY s.created_at DESC'
         
         cursor.execute(query, params)
-        subscriptions = [dict(row) for row in cursor.fetchall()]
+        subscriptions = fetch_records(cursor, 'Subscription')
         conn.close()
         return subscriptions
     
@@ -468,8 +533,8 @@ class PublicityManager:
         conn = self.db.get_connection()
         cursor = conn.cursor()
         
-        query = '''
-            SELECT a.*, s.client_name, u.username as created_by_username
+        query = f'''
+            SELECT {ADVERTISEMENT_COLUMNS.sql(self.db)}, s.client_name, u.username as created_by_username
             FROM advertisements a
             LEFT JOIN publicity_subscriptions s ON a.subscription_id = s.id
             LEFT JOIN users u ON a.created_by = u.id
@@ -483,7 +548,7 @@ class PublicityManager:
         query += ' ORDER BY a.created_at DESC'
         
         cursor.execute(query, params)
-        ads = [dict(row) for row in cursor.fetchall()]
+        ads = fetch_records(cursor, 'Advertisement')
         conn.close()
         return ads
 
@@ -492,6 +557,16 @@ class VideoManager:
     
     def __init__(self, db_manager):
         self.db = db_manager
+        self.listeners = []
+    
+    def on_change(self, listener):
+        """Register listener(), called after each commit that changed videos"""
+        self.listeners.append(listener)
+        return listener
+    
+    def notify(self):
+        for listener in self.listeners:
+            listener()
     
     def add_video(self, video_data: Dict, created_by: int) -> int:
         """Add a new video"""
@@ -513,15 +588,102 @@ class VideoManager:
         video_id = cursor.lastrowid
         conn.commit()
         conn.close()
+        self.notify()
         return video_id
     
+    @staticmethod
+    def content_hash(video: Dict) -> str:
+        """Hash of the fields bulk_upsert() keeps in sync"""
+        values = [video[field] for field in VIDEO_CONTENT_FIELDS]
+        return hashlib.sha1(json.dumps(values, default=str).encode()).hexdigest()
+    
+    def bulk_upsert(self, videos: List[Dict], created_by: Optional[int] = None) -> Dict[str, int]:
+        """Insert or update videos by youtube_id in a single transaction
+        
+        Rows whose content hash matches the stored one are not written.
+        Returns the inserted/updated/unchanged counts.
+        """
+        rows = {}
+        for video_data in videos:
+            if not video_data.get('youtube_id'):
+                raise ValueError("youtube_id is required for bulk upsert")
+            video = {
+                'youtube_id': video_data['youtube_id'],
+                'title': video_data['title'],
+                'description': video_data.get('description', ''),
+                'thumbnail_url': video_data.get('thumbnail_url', ''),
+                'duration': video_data.get('duration', ''),
+                'published_at': video_data.get('published_at'),
+                'view_count': video_data.get('view_count', 0),
+                'like_count': video_data.get('like_count', 0),
+                'is_live': bool(video_data.get('is_live', False)),
+                'category': video_data.get('category'),
+                'is_featured': bool(video_data.get('is_featured', False)),
+                'status': video_data.get('status', 'published'),
+            }
+            video['content_hash'] = self.content_hash(video)
+            rows[video['youtube_id']] = video  # last occurrence wins
+        
+        counts = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+        if not rows:
+            return counts
+        
+        with self.db.transaction() as conn:
+            stored = {row[0]: (row[1], row[2]) for row in conn.execute('''
+                SELECT youtube_id, content_hash, category FROM videos
+                WHERE youtube_id IN (SELECT value FROM json_each(?))
+            ''', (json.dumps(list(rows)),))}
+            
+            changed = []
+            for youtube_id, video in rows.items():
+                if youtube_id not in stored:
+                    if not video['category']:
+                        raise ValueError(f"category is required for new video {youtube_id}")
+                    category = video['category']
+                    counts['inserted'] += 1
+                elif stored[youtube_id][0] == video['content_hash']:
+                    counts['unchanged'] += 1
+                    continue
+                else:
+                    # NOT NULL is checked before the conflict; the update keeps the stored category
+                    category = stored[youtube_id][1]
+                    counts['updated'] += 1
+                changed.append((video['youtube_id'], video['title'], video['description'],
+                                video['thumbnail_url'], category, video['duration'],
+                                video['published_at'], video['view_count'], video['like_count'],
+                                video['is_featured'], video['is_live'], video['status'],
+                                created_by, video['content_hash']))
+            
+            conn.executemany('''
+                INSERT INTO videos
+                (youtube_id, title, description, thumbnail_url, category, duration, published_at,
+                 view_count, like_count, is_featured, is_live, status, created_by, content_hash)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(youtube_id) DO UPDATE SET
+                    title = excluded.title,
+                    description = excluded.description,
+                    thumbnail_url = excluded.thumbnail_url,
+                    duration = excluded.duration,
+                    published_at = excluded.published_at,
+                    view_count = excluded.view_count,
+                    like_count = excluded.like_count,
+                    is_live = excluded.is_live,
+                    content_hash = excluded.content_hash,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE videos.content_hash IS NOT excluded.content_hash
+            ''', changed)
+        
+        if changed:
+            self.notify()
+        return counts
+    
     def get_videos(self, category: Optional[str] = None, status: Optional[str] = None) -> List[Dict]:
         """Get videos with optional filtering"""
         conn = self.db.get_connection()
         cursor = conn.cursor()
         
-        query = '''
-            SELECT v.*, u.username as created_by_username
+        query = f'''
+            SELECT {VIDEO_COLUMNS.sql(self.db)}, u.username as created_by_username
             FROM videos v
             LEFT JOIN users u ON v.created_by = u.id
         '''
@@ -541,7 +703,7 @@ class VideoManager:
         query += ' ORDER BY v.created_at DESC'
         
         cursor.execute(query, params)
-        videos = [dict(row) for row in cursor.fetchall()]
+        videos = fetch_records(cursor, 'Video')
         conn.close()
         return videos
 
@@ -550,17 +712,12 @@ class SettingsManager:
     
     def __init__(self, db_manager):
         self.db = db_manager
+        # In-memory copy of the table, reloaded when the settings version changes
+        self.snapshot = SettingsSnapshot(db_manager)
     
     def get_setting(self, key: str) -> Optional[str]:
         """Get a setting value"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT value FROM settings WHERE key = ?', (key,))
-        result = cursor.fetchone()
-        conn.close()
-        
-        return result['value'] if result else None
+        return self.snapshot.get(key)
     
     def set_setting(self, key: str, value: str, updated_by: int) -> bool:
         """Set a setting value"""
@@ -572,26 +729,15 @@ class SettingsManager:
             VALUES (?, ?, ?, ?)
         ''', (key, value, updated_by, datetime.now()))
         
+        # The settings_version triggers bump the version seen by every worker
         conn.commit()
         conn.close()
+        self.snapshot.invalidate()
         return True
     
     def get_all_settings(self, category: Optional[str] = None) -> Dict[str, str]:
-        """Get all settings as a dictionary"""
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        
-        query = 'SELECT key, value FROM settings'
-        params = []
-        
-        if category:
-            query += ' WHERE category = ?'
-            params.append(category)
-        
-        cursor.execute(query, params)
-        settings = {row['key']: row['value'] for row in cursor.fetchall()}
-        conn.close()
-        return settings
+        """Get all settings as a dictionary (a copy callers may modify)"""
+        return dict(self.snapshot.get_all(category))
 
 # Initialize managers
 db_manager = DatabaseManager()
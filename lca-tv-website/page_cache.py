@@ -0,0 +1,198 @@
+"""
+Full-page response cache for public Flask routes
+
+Rendered pages are stored once, pre-compressed and with an ETag, and served
+straight from memory until their TTL expires or one of their dependency tags
+('catalog', 'settings') is invalidated by an admin write. Ads are chosen per
+visitor and are never part of a cached body: pages carry empty slots that
+components/ad_display.html fills from /api/ads/slots.
+
+Writes made by other workers are caught by VersionedTag: triggers bump a
+one-row version counter (`catalog_version` for videos and articles,
+`settings_version` for settings, see migrations.py), which is only read again when PRAGMA data_version reports a
+commit, and a moved counter invalidates its tag.
+"""
+import functools
+import gzip
+import hashlib
+import sqlite3
+import threading
+
+from flask import request, session, g, make_response
+
+from cache_layer import cache
+from data_version import DataVersionWatcher
+
+# Cookies that change the rendered page and therefore belong in the cache key
+VARY_COOKIES = ('lang',)
+DEFAULT_TTL = 120
+MIN_GZIP_SIZE = 500
+CATALOG_TABLES = ('videos', 'articles')
+# Compteurs mis à jour à chaque vue: ils ne changent pas les pages en cache
+COUNTER_COLUMNS = ('view_count', 'like_count', 'views')
+
+
+def ensure_catalog_version_schema(conn):
+    """Create the catalog version counter and its triggers on videos and articles"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS catalog_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0)')
+    for table in CATALOG_TABLES:
+        columns = [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+        watched = [name for name in columns if name not in COUNTER_COLUMNS]
+        if not watched:
+            continue
+        for event in ('INSERT', 'DELETE', f"UPDATE OF {', '.join(watched)}"):
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS catalog_version_{table}_{event.split()[0].lower()}
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+                END
+            ''')
+    conn.commit()
+
+
+class CachedPage:
+    """Pre-rendered page body with its compressed variant"""
+    __slots__ = ('body', 'gzip_body', 'etag', 'status', 'mimetype')
+
+    def __init__(self, body, status, mimetype):
+        self.body = body
+        self.gzip_body = gzip.compress(body, 6) if len(body) >= MIN_GZIP_SIZE else None
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.status = status
+        self.mimetype = mimetype
+
+
+class VersionedTag:
+    """Invalidates a tag when its trigger-maintained version row moves, in any worker"""
+
+    def __init__(self, db_manager, tag, table):
+        self.db = db_manager
+        self.tag = tag
+        self.table = table
+        self.watcher = DataVersionWatcher(db_manager.db_path)
+        self.data_version = None
+        self.version = None
+        self.lock = threading.Lock()
+
+    def changed(self):
+        """True once per change of the version row since the previous call"""
+        data_version = self.watcher.version()
+        if data_version is not None and data_version == self.data_version:
+            return False
+        with self.lock:
+            if data_version is not None and data_version == self.data_version:
+                return False
+            conn = self.db.get_connection()
+            try:
+                row = conn.execute(f'SELECT version FROM {self.table} WHERE id = 1').fetchone()
+            except sqlite3.OperationalError:
+                row = None  # base sans compteur: expiration par TTL seulement
+            finally:
+                conn.close()
+            version = row[0] if row else None
+            changed = self.version is not None and version != self.version
+            self.version = version
+            self.data_version = data_version
+        return changed
+
+
+class PageCache:
+    """Page cache keyed by path, query string and relevant cookies"""
+
+    def __init__(self, store, ttl=DEFAULT_TTL, vary_cookies=VARY_COOKIES):
+        self.store = store
+        self.ttl = ttl
+        self.vary_cookies = vary_cookies
+        self.enabled = True
+        self.versioned_tags = []
+
+    def skip(self):
+        """Keep the page being rendered out of the cache (e.g. degraded output)"""
+        g.page_cache_skip = True
+
+    def is_bypassed(self):
+        """Admins, non-GET requests and pending flash messages skip the cache"""
+        if not self.enabled or request.method not in ('GET', 'HEAD'):
+            return True
+        return 'user' in session or '_flashes' in session
+
+    def cache_key(self):
+        query = '&'.join(sorted(request.query_string.decode('latin-1').split('&')))
+        cookies = '|'.join(request.cookies.get(name, '') for name in self.vary_cookies)
+        return f"page:{request.path}?{query}#{cookies}"
+
+    def put(self, key, response, tags, ttl=None):
+        entry = CachedPage(response.get_data(), response.status_code, response.mimetype)
+        self.store.set(key, entry, ttl or self.ttl, tags)
+        return entry
+
+    def build_response(self, entry, cache_status):
+        """Build a response for an entry, honouring If-None-Match and gzip"""
+        if entry.etag in request.if_none_match:
+            response = make_response('', 304)
+        elif entry.gzip_body is not None and 'gzip' in request.accept_encodings:
+            response = make_response(entry.gzip_body, entry.status)
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = make_response(entry.body, entry.status)
+
+        response.mimetype = entry.mimetype
+        response.set_etag(entry.etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Page-Cache'] = cache_status
+        response.vary.add('Accept-Encoding')
+        response.vary.add('Cookie')
+        return response
+
+    def invalidate(self, *tags):
+        return self.store.invalidate_tags(*tags)
+
+    def watch(self, db_manager, tag, table):
+        """Invalidate `tag` whenever the version row of `table` changes"""
+        versioned = VersionedTag(db_manager, tag, table)
+        versioned.changed()  # version de départ
+        self.versioned_tags.append(versioned)
+        return versioned
+
+    def check_versions(self):
+        for versioned in self.versioned_tags:
+            if versioned.changed():
+                self.invalidate(versioned.tag)
+
+
+# Global page cache
+page_cache = PageCache(cache)
+
+
+def cached_page(*tags, ttl=None):
+    """Decorator caching the full rendered page of a public route"""
+    def decorator(f):
+        @functools.wraps(f)
+        def decorated_function(*args, **kwargs):
+            if page_cache.is_bypassed():
+                return f(*args, **kwargs)
+
+            page_cache.check_versions()
+            key = page_cache.cache_key()
+            entry = page_cache.store.get(key)
+            if entry is not None:
+                return page_cache.build_response(entry, 'HIT')
+
+            response = make_response(f(*args, **kwargs))
+
+            # Only plain successful pages that did not touch the session are shared
+            if (response.status_code != 200 or response.direct_passthrough
+                    or session.modified or g.get('page_cache_skip')):
+                return response
+
+            entry = page_cache.put(key, response, tags, ttl)
+            return page_cache.build_response(entry, 'MISS')
+        return decorated_function
+    return decorator
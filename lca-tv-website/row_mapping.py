@@ -0,0 +1,171 @@
+"""
+Compact row records for list queries and API responses
+
+Manager methods and admin list APIs used to run `SELECT *` and turn every
+sqlite3.Row into a dict, which allocates a hash table per row and serializes
+every column whether the caller needs it or not. This module provides:
+
+    USERS = Projection('users', ('id', 'username', 'email'))
+    cursor.execute(f'SELECT {USERS.sql(db_manager)} FROM users')
+    users = fetch_records(cursor, 'User')   # list of __slots__ records
+
+Records read like the dicts they replace (`user['username']`, `user.get()`,
+`keys()`, `dict(user)`) and can be assigned a declared field; templates may use
+`user.username`. Projections list the columns explicitly and skip the ones a
+given database does not have, since the databases in use disagree on their
+schema (see migrations.py). JSON text columns are decoded once per distinct
+value and shared between records, with lists frozen into tuples.
+
+json_provider.init_json_provider(app) lets jsonify() serialize records.
+"""
+import json
+import keyword
+import threading
+from functools import lru_cache
+from itertools import starmap
+
+JSON_CACHE_SIZE = 1024
+
+
+class Record:
+    """Base class of the generated record types: a read-mostly mapping over __slots__"""
+
+    __slots__ = ()
+    _fields = ()
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        if key not in self._fields:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self._fields
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            return self._fields == other._fields and self.values() == other.values()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        fields = ', '.join(f'{name}={getattr(self, name)!r}' for name in self._fields)
+        return f'{type(self).__name__}({fields})'
+
+    def get(self, key, default=None):
+        if key in self._fields:
+            return getattr(self, key)
+        return default
+
+    def keys(self):
+        return self._fields
+
+    def values(self):
+        return tuple(getattr(self, name) for name in self._fields)
+
+    def items(self):
+        return tuple((name, getattr(self, name)) for name in self._fields)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self._fields}
+
+
+@lru_cache(maxsize=JSON_CACHE_SIZE)
+def decode_json(text):
+    """Decoded JSON column value, cached per distinct text; lists become tuples"""
+    if not text:
+        return ()
+    try:
+        return freeze(json.loads(text))
+    except ValueError:
+        return ()
+
+
+def freeze(value):
+    # Les valeurs en cache sont partagées entre requêtes: pas de listes mutables
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+@lru_cache(maxsize=None)
+def record_type(name, fields, json_fields=()):
+    """Record class with one slot per field; JSON fields are decoded on creation"""
+    if len(set(fields)) != len(fields):
+        raise ValueError(f"Duplicate record field names: {fields!r}")
+    for field in fields:
+        if not field.isidentifier() or keyword.iskeyword(field) or field.startswith('_'):
+            raise ValueError(f"Invalid record field name: {field!r}")
+
+    # Un __init__ positionnel généré, comme collections.namedtuple
+    arguments = ', '.join(fields)
+    body = '\n'.join(
+        f'    self.{field} = decode_json({field})' if field in json_fields else f'    self.{field} = {field}'
+        for field in fields
+    ) or '    pass'
+    namespace = {'decode_json': decode_json}
+    exec(f'def __init__(self, {arguments}):\n{body}', namespace)
+
+    return type(name, (Record,), {
+        '__slots__': fields,
+        '_fields': fields,
+        '__init__': namespace['__init__'],
+    })
+
+
+def fetch_records(cursor, name, json_fields=(), extra=()):
+    """All remaining rows of an executed cursor as records named after `name`
+
+    `extra` declares additional fields (initialised to None) that the caller
+    fills in afterwards, e.g. values computed in Python.
+    """
+    fields = tuple(column[0] for column in cursor.description)
+    cursor.row_factory = None  # tuples: no sqlite3.Row per row
+    rows = cursor.fetchall()
+    if extra:
+        padding = (None,) * len(extra)
+        rows = [row + padding for row in rows]
+        fields += tuple(extra)
+    return list(starmap(record_type(name, fields, tuple(json_fields)), rows))
+
+
+class Projection:
+    """Explicit column list of one table, limited to the columns a database has"""
+
+    def __init__(self, table, columns, alias=None):
+        self.table = table
+        self.columns = tuple(columns)
+        self.alias = alias
+        self.resolved = {}
+        self.lock = threading.Lock()
+
+    def sql(self, db_manager):
+        """`alias.col, ...` for the database of `db_manager` (resolved once per path)"""
+        select = self.resolved.get(db_manager.db_path)
+        if select is None:
+            with self.lock:
+                conn = db_manager.get_connection()
+                try:
+                    available = {row[1] for row in conn.execute(f'PRAGMA table_info({self.table})')}
+                finally:
+                    conn.close()
+                prefix = f'{self.alias}.' if self.alias else ''
+                select = ', '.join(f'{prefix}{column}' for column in self.columns if column in available)
+                if not select:
+                    raise ValueError(f"Table {self.table} has none of the projected columns")
+                self.resolved[db_manager.db_path] = select
+        return select
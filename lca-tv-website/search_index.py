@@ -0,0 +1,246 @@
+"""
+Full-text search over videos and articles
+
+One FTS5 table, `search_index`, holds the title, description/body and tags of
+every published video and article, tokenized with unicode61 and
+remove_diacritics 2 so that "emission" finds "Émission" and "Franc-Parler"
+is found by "franc parl". Triggers on `videos` and `articles` keep it in sync
+(see migrations.py); only the indexed columns fire the update triggers, so
+view counters do not touch the index. Each row's rowid is derived from the
+source row (id * 2 + kind), so updates and deletes are direct lookups.
+
+Results are ranked with BM25, titles weighing more than tags and tags more
+than the body. Every term must match and the last one matches as a prefix,
+which suits search-as-you-type. Titles and snippets come back HTML-escaped
+with the matches wrapped in <mark>.
+
+The schemas differ between databases: lca_tv.db, used by app_advanced, has
+both tables, but its videos have no status (every video is indexed) and its
+articles no slug. Columns a table lacks are left empty in the index.
+
+    from search_index import init_search
+    init_search(app, db_manager)     # GET /api/search?q=...&type=video&limit=20
+"""
+import html
+import re
+import sqlite3
+import time
+
+from flask import jsonify, request
+
+# kind -> source table and the columns feeding the index (missing ones are skipped)
+SOURCES = {
+    'video': {
+        'code': 0, 'table': 'videos', 'body': ('description',),
+        'key': 'youtube_id', 'image': 'thumbnail_url',
+    },
+    'article': {
+        'code': 1, 'table': 'articles', 'body': ('excerpt', 'content'),
+        'key': 'slug', 'image': 'featured_image',
+    },
+}
+KINDS = {source['code']: kind for kind, source in SOURCES.items()}
+
+# BM25 weights of title, body, tags (explicit: faster than a configured rank)
+RANK = 'bm25(search_index, 10.0, 1.0, 4.0)'
+MARK_START, MARK_END = '\x02', '\x03'
+SNIPPET_TOKENS = 16
+MAX_QUERY_LENGTH = 200
+MAX_TERMS = 8
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 50
+TERM = re.compile(r'\w+')
+
+
+def table_columns(conn, table):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+
+
+def row_values(source, columns, ref):
+    """SQL expressions of one index row for the `new`/`old` row alias `ref`"""
+    def column(name, default="''"):
+        return f"COALESCE({ref}.{name}, '')" if name in columns else default
+
+    body = [column(name) for name in source['body'] if name in columns] or ["''"]
+    return [
+        f"{ref}.id * 2 + {source['code']}",
+        column('title'),
+        " || char(10) || ".join(body),
+        column('tags'),
+        str(source['code']),
+        f'{ref}.id',
+        column(source['key'], 'NULL'),
+        column(source['image'], 'NULL'),
+        column('category', 'NULL'),
+        f'{ref}.published_at' if 'published_at' in columns else 'NULL',
+    ]
+
+
+INDEX_COLUMNS = 'rowid, title, body, tags, kind, ref_id, ref_key, image, category, published_at'
+
+
+def ensure_search_schema(conn):
+    """Create the index and its triggers for the source tables present, then fill it"""
+    present = {kind: table_columns(conn, source['table']) for kind, source in SOURCES.items()}
+    present = {kind: columns for kind, columns in present.items() if columns}
+    if not present:
+        return False
+
+    try:
+        conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+                title, body, tags,
+                kind UNINDEXED, ref_id UNINDEXED, ref_key UNINDEXED,
+                image UNINDEXED, category UNINDEXED, published_at UNINDEXED,
+                tokenize = "unicode61 remove_diacritics 2",
+                prefix = '2 3'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"⚠️ Recherche plein texte indisponible (FTS5): {e}")
+        return False
+
+    for kind, columns in present.items():
+        source = SOURCES[kind]
+        table = source['table']
+        published = "{ref}.status = 'published'" if 'status' in columns else '1'
+        watched = [name for name in ('title', 'tags', 'status', 'category', 'published_at',
+                                     source['key'], source['image'], *source['body'])
+                   if name in columns]
+
+        for trigger in ('ai', 'au', 'ad'):
+            conn.execute(f'DROP TRIGGER IF EXISTS search_{table}_{trigger}')
+        conn.execute(f'''
+            CREATE TRIGGER search_{table}_ai AFTER INSERT ON {table}
+            WHEN {published.format(ref='new')}
+            BEGIN
+                INSERT INTO search_index ({INDEX_COLUMNS}) VALUES ({', '.join(row_values(source, columns, 'new'))});
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER search_{table}_au AFTER UPDATE OF {', '.join(watched)} ON {table}
+            BEGIN
+                DELETE FROM search_index WHERE rowid = old.id * 2 + {source['code']};
+                INSERT INTO search_index ({INDEX_COLUMNS})
+                SELECT {', '.join(row_values(source, columns, 'new'))} WHERE {published.format(ref='new')};
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER search_{table}_ad AFTER DELETE ON {table}
+            BEGIN
+                DELETE FROM search_index WHERE rowid = old.id * 2 + {source['code']};
+            END
+        ''')
+
+    rebuild_search_index(conn, present)
+    conn.commit()
+    return True
+
+
+def rebuild_search_index(conn, present=None):
+    """Refill the index from the source tables"""
+    if present is None:
+        present = {kind: table_columns(conn, source['table']) for kind, source in SOURCES.items()}
+    conn.execute('DELETE FROM search_index')
+    for kind, columns in present.items():
+        source = SOURCES[kind]
+        if not columns:
+            continue
+        where = "WHERE src.status = 'published'" if 'status' in columns else ''
+        conn.execute(f'''
+            INSERT INTO search_index ({INDEX_COLUMNS})
+            SELECT {', '.join(row_values(source, columns, 'src'))} FROM {source['table']} src {where}
+        ''')
+    conn.execute("INSERT INTO search_index (search_index) VALUES ('optimize')")
+
+
+def build_match(query):
+    """FTS5 MATCH expression: every word quoted, the last one as a prefix"""
+    terms = TERM.findall(query[:MAX_QUERY_LENGTH].lower())[:MAX_TERMS]
+    if not terms:
+        return None
+    phrases = [f'"{term}"' for term in terms]
+    if len(terms[-1]) >= 2:
+        phrases[-1] += '*'
+    return ' '.join(phrases)
+
+
+def highlighted(text):
+    """HTML-escape indexed text, then turn the match markers into <mark> tags"""
+    return html.escape(text or '').replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+
+
+def search(conn, query, kind=None, category=None, limit=DEFAULT_LIMIT, offset=0):
+    """Ranked matches for a user query, as dicts ready to be serialized"""
+    match = build_match(query)
+    if match is None:
+        return []
+
+    sql = f'''
+        SELECT kind, ref_id, ref_key, image, category, published_at,
+               highlight(search_index, 0, ?, ?),
+               snippet(search_index, 1, ?, ?, '…', {SNIPPET_TOKENS})
+        FROM search_index
+        WHERE search_index MATCH ?
+    '''
+    params = [MARK_START, MARK_END, MARK_START, MARK_END, match]
+    if kind:
+        sql += ' AND kind = ?'
+        params.append(SOURCES[kind]['code'])
+    if category:
+        sql += ' AND category = ?'
+        params.append(category)
+    sql += f' ORDER BY {RANK} LIMIT ? OFFSET ?'
+    params += [limit, offset]
+
+    results = []
+    for code, ref_id, ref_key, image, row_category, published_at, title, snippet in conn.execute(sql, params):
+        result_kind = KINDS[code]
+        results.append({
+            'type': result_kind,
+            'id': ref_id,
+            SOURCES[result_kind]['key']: ref_key,
+            'title': highlighted(title),
+            'snippet': highlighted(snippet),
+            'thumbnail': image,
+            'category': row_category,
+            'published_at': published_at,
+        })
+    return results
+
+
+def init_search(app, db_manager):
+    """Register GET /api/search on the app"""
+
+    @app.route('/api/search')
+    def api_search():
+        """Recherche plein texte dans les vidéos et les articles"""
+        query = request.args.get('q', '').strip()
+        kind = request.args.get('type')
+        if not query:
+            return jsonify({'error': 'Missing query parameter q'}), 400
+        if kind and kind not in SOURCES:
+            return jsonify({'error': f"Unknown type: {kind}"}), 400
+        limit = min(max(request.args.get('limit', DEFAULT_LIMIT, type=int), 1), MAX_LIMIT)
+        offset = max(request.args.get('offset', 0, type=int), 0)
+
+        start = time.perf_counter()
+        conn = db_manager.get_connection()
+        try:
+            results = search(conn, query, kind, request.args.get('category'), limit, offset)
+        except sqlite3.OperationalError as e:
+            if 'no such table' not in str(e):
+                return jsonify({'error': str(e)}), 500
+            results = []  # base sans vidéos ni articles
+        finally:
+            conn.close()
+
+        return jsonify({
+            'query': query,
+            'results': results,
+            'limit': limit,
+            'offset': offset,
+            'took_ms': round((time.perf_counter() - start) * 1000, 2),
+        })
+
+    return api_search
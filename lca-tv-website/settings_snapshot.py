@@ -0,0 +1,119 @@
+"""
+Cross-worker-consistent settings snapshot
+
+Settings are read on every dashboard render and template, but change only
+when an admin saves them. SettingsSnapshot keeps them as an immutable
+mapping in each process and decides whether it is still current in two
+cheap steps:
+
+    1. PRAGMA data_version on a dedicated connection: unchanged means no
+       connection (in any worker) committed anything since the last check;
+    2. otherwise the `settings_version` row, bumped by triggers on every
+       insert/update/delete of `settings` (see migrations.py), tells whether
+       the commit touched settings at all.
+
+Only a changed version reloads the table. Every read checks, so a save in one
+Passenger worker is visible to the next request served by any other.
+"""
+import sqlite3
+import threading
+from types import MappingProxyType
+
+from data_version import DataVersionWatcher
+
+EMPTY = MappingProxyType({})
+
+
+def ensure_settings_version_schema(conn):
+    """Create the settings version counter and its triggers if missing"""
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'settings'").fetchone():
+        return
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS settings_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO settings_version (id, version) VALUES (1, 0)')
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS settings_version_{event.lower()} AFTER {event} ON settings
+            BEGIN
+                UPDATE settings_version SET version = version + 1 WHERE id = 1;
+            END
+        ''')
+    conn.commit()
+
+
+class SettingsSnapshot:
+    """Immutable key -> value mapping of the settings table, refreshed on change"""
+
+    def __init__(self, db_manager):
+        self.db = db_manager
+        self.watcher = DataVersionWatcher(db_manager.db_path, interval=0)
+        self.lock = threading.Lock()
+        self.values = EMPTY
+        self.by_category = {}
+        self.version = None
+        self.data_version = None
+        self.reloads = 0
+
+    def current(self):
+        """The up-to-date snapshot (reloaded only if settings changed)"""
+        data_version = self.watcher.version()
+        if data_version is not None and data_version == self.data_version:
+            return self.values
+        with self.lock:
+            if data_version is None or data_version != self.data_version:
+                if self.refresh():
+                    self.data_version = data_version
+        return self.values
+
+    def refresh(self):
+        """Reload if settings_version moved; False when read inside the caller's open transaction"""
+        conn = self.db.get_connection()
+        # Transaction déjà ouverte par l'appelant: elle donne déjà une lecture cohérente
+        began = not conn.in_transaction
+        try:
+            if began:
+                # Version et contenu lus dans la même transaction de lecture
+                conn.execute('BEGIN')
+            try:
+                row = conn.execute('SELECT version FROM settings_version WHERE id = 1').fetchone()
+                version = row[0] if row else None
+            except sqlite3.OperationalError:
+                version = None  # base sans compteur: toujours relire
+            if version is not None and version == self.version:
+                return began
+            columns = {column[1] for column in conn.execute('PRAGMA table_info(settings)')}
+            category = 'category' if 'category' in columns else 'NULL'
+            rows = conn.execute(f'SELECT key, value, {category} FROM settings').fetchall()
+        finally:
+            if began:
+                conn.rollback()
+            conn.close()
+
+        by_category = {}
+        for key, value, row_category in rows:
+            by_category.setdefault(row_category, {})[key] = value
+        self.by_category = {name: MappingProxyType(values) for name, values in by_category.items()}
+        self.values = MappingProxyType({row[0]: row[1] for row in rows})
+        # Lu avec les écritures non validées de l'appelant: à relire après son commit ou rollback
+        self.version = version if began else None
+        self.reloads += 1
+        return began
+
+    def invalidate(self):
+        """Force a reload on the next read (after a write in this process)"""
+        with self.lock:
+            self.data_version = None
+            self.version = None
+
+    def get(self, key, default=None):
+        return self.current().get(key, default)
+
+    def get_all(self, category=None):
+        values = self.current()
+        if category is None:
+            return values
+        return self.by_category.get(category, EMPTY)
@@ -0,0 +1,77 @@
+"""
+Serving of user uploads (ad creatives, media library, videos)
+
+Three modes, selected with the UPLOAD_SERVING_MODE setting (or environment
+variable of the same name):
+
+    python      Flask/Werkzeug send_file with Range/206, ETag and
+                Last-Modified. The file object is handed to the server's
+                wsgi.file_wrapper, which lets servers that support it
+                (gunicorn, mod_wsgi) transmit it with sendfile(2).
+    x-sendfile  Apache mod_xsendfile / lighttpd: the front server reads the
+                absolute path from the X-Sendfile header.
+    x-accel     nginx: X-Accel-Redirect to UPLOAD_ACCEL_PREFIX + the
+                percent-encoded filename, an internal location aliased to
+                the upload folder.
+
+Upload names embed a uuid or a random hex suffix and are never overwritten,
+so they are served as immutable for a year; other files get a short max-age.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from flask import abort, current_app, send_file
+from werkzeug.security import safe_join
+
+SERVING_MODES = ('python', 'x-sendfile', 'x-accel')
+IMMUTABLE_MAX_AGE = 31536000  # 1 an
+DEFAULT_MAX_AGE = 3600
+
+# uuid4 prefixes (ads), _<8 hex> suffixes (media library) and their variants
+CONTENT_ADDRESSED_NAME = re.compile(
+    r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|_[0-9a-f]{8}(?:[.-])',
+    re.IGNORECASE
+)
+
+
+def serving_mode(app):
+    mode = app.config.get('UPLOAD_SERVING_MODE') or os.environ.get('UPLOAD_SERVING_MODE', 'python')
+    if mode not in SERVING_MODES:
+        raise ValueError(f"Unknown UPLOAD_SERVING_MODE: {mode}")
+    return mode
+
+
+def is_content_addressed(filename):
+    return bool(CONTENT_ADDRESSED_NAME.search(os.path.basename(filename)))
+
+
+def send_upload(upload_folder, filename):
+    """Response serving one uploaded file according to the configured mode"""
+    path = safe_join(os.path.abspath(upload_folder), filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    app = current_app._get_current_object()
+    mode = serving_mode(app)
+    max_age = IMMUTABLE_MAX_AGE if is_content_addressed(filename) else DEFAULT_MAX_AGE
+
+    if mode == 'python':
+        response = send_file(path, conditional=True, etag=True, max_age=max_age)
+    else:
+        response = app.response_class()
+        response.mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if mode == 'x-sendfile':
+            response.headers['X-Sendfile'] = path
+        else:
+            prefix = app.config.get('UPLOAD_ACCEL_PREFIX') or os.environ.get('UPLOAD_ACCEL_PREFIX', '/protected-uploads/')
+            # URI interne: espaces, accents, ? et # encodés (nginx décode avant de chercher le fichier)
+            response.headers['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(filename.replace(os.sep, '/'))
+        response.cache_control.max_age = max_age
+
+    response.cache_control.public = True
+    if max_age == IMMUTABLE_MAX_AGE:
+        response.cache_control.immutable = True
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,42 @@
+"""
+Shared fixtures: a migrated copy of lca_tv.db, the database app_advanced runs
+on, behind the same pooled manager interface as app_advanced.DatabaseManager.
+"""
+import os
+import shutil
+import sqlite3
+import sys
+
+import pytest
+
+WEBSITE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lca-tv-website')
+sys.path.insert(0, WEBSITE_DIR)
+
+from db_pool import ConnectionPool  # noqa: E402
+from migrations import migrate  # noqa: E402
+
+
+class PooledManager:
+    """get_connection()/transaction() over a ConnectionPool, like app_advanced.DatabaseManager"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.pool = ConnectionPool(db_path)
+
+    def get_connection(self):
+        return self.pool.get_connection()
+
+    def transaction(self):
+        return self.pool.transaction()
+
+
+@pytest.fixture
+def lca_tv_db(tmp_path):
+    path = str(tmp_path / 'lca_tv.db')
+    shutil.copy(os.path.join(WEBSITE_DIR, 'lca_tv.db'), path)
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    conn.close()
+    manager = PooledManager(path)
+    yield manager
+    manager.pool.close()
@@ -0,0 +1,69 @@
+"""
+Impression beacon tests: serve tokens are bound to the visitor, ad and slot
+they were issued for, expire, and count once.
+"""
+import json
+import os
+import sys
+
+WEBSITE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lca-tv-website')
+sys.path.insert(0, WEBSITE_DIR)
+
+from ad_beacons import ServeTokens, parse_beacon  # noqa: E402
+
+NOW = 1_700_000_000
+ADS = {3: {'id': 3, 'location': 'header'}, 4: {'id': 4, 'location': 'sidebar'}}
+
+
+def beacon(*events):
+    return json.dumps({'events': [dict(event, ts=NOW * 1000) for event in events]})
+
+
+def test_token_counts_once_for_its_visitor():
+    tokens = ServeTokens('secret')
+    token = tokens.issue(3, 'header', 'visitor-a', now=NOW)
+
+    assert not tokens.redeem(token, 3, 'header', 'visitor-b', now=NOW)
+    assert tokens.redeem(token, 3, 'header', 'visitor-a', now=NOW)
+    assert not tokens.redeem(token, 3, 'header', 'visitor-a', now=NOW)
+
+
+def test_token_is_bound_to_ad_and_slot():
+    tokens = ServeTokens('secret')
+    token = tokens.issue(3, 'header', 'visitor-a', now=NOW)
+
+    assert not tokens.redeem(token, 4, 'header', 'visitor-a', now=NOW)
+    assert not tokens.redeem(token, 3, 'sidebar', 'visitor-a', now=NOW)
+    assert not ServeTokens('other').redeem(token, 3, 'header', 'visitor-a', now=NOW)
+
+
+def test_expired_and_malformed_tokens_are_rejected():
+    tokens = ServeTokens('secret', max_age=60)
+    token = tokens.issue(3, 'header', 'visitor-a', now=NOW)
+
+    assert not tokens.redeem(token, 3, 'header', 'visitor-a', now=NOW + 61)
+    for bad in (None, '', 'abc', 'a.b.c', token[:-1]):
+        assert not tokens.redeem(bad, 3, 'header', 'visitor-a', now=NOW)
+    assert tokens.rejected == 6
+
+
+def test_redeemed_tokens_stay_bounded():
+    tokens = ServeTokens('secret', max_entries=10)
+    for serve in range(25):
+        assert tokens.redeem(tokens.issue(3, 'header', f'visitor-{serve}', now=NOW),
+                             3, 'header', f'visitor-{serve}', now=NOW)
+    assert len(tokens.redeemed) <= 10
+
+
+def test_beacon_counts_only_redeemed_events():
+    tokens = ServeTokens('secret')
+    served = tokens.issue(3, 'header', 'visitor-a', now=NOW)
+
+    def redeem(ad, slot, token):
+        return tokens.redeem(token, ad['id'], slot, 'visitor-a', now=NOW)
+
+    body = beacon({'ad_id': 3, 'slot': 'header', 'token': served},
+                  {'ad_id': 4, 'slot': 'sidebar'},
+                  {'ad_id': 4, 'slot': 'header', 'token': served})
+    assert parse_beacon(body, ADS.get, now=NOW, redeem=redeem) == [(ADS[3], 'header')]
+    assert parse_beacon(body, ADS.get, now=NOW, redeem=redeem) == []
@@ -0,0 +1,112 @@
+"""
+Batched ad counter tests: one flush maintains every rollup, a failed flush
+keeps its counts for the next one, and only one flush thread is started.
+"""
+import threading
+from datetime import datetime
+
+import ad_counters
+from ad_counters import AdCounterAggregator, ClickDeduplicator
+
+AD_ID = 1
+
+
+def counters(manager):
+    # Flushes are triggered by the tests, never by the background thread
+    return AdCounterAggregator(manager, flush_interval=3600, max_pending=10 ** 6)
+
+
+def stored(manager):
+    now = datetime.now()
+    day, month = now.strftime('%Y-%m-%d'), now.strftime('%Y-%m')
+    conn = manager.get_connection()
+    try:
+        return {
+            'hourly': conn.execute('SELECT impressions, clicks FROM ad_stats_hourly WHERE advertisement_id = ? '
+                                   'AND date = ? AND hour = ?', (AD_ID, day, now.hour)).fetchone(),
+            'daily': conn.execute('SELECT impressions, clicks FROM ad_stats WHERE advertisement_id = ? AND date = ?',
+                                  (AD_ID, day)).fetchone(),
+            'monthly': conn.execute('SELECT impressions, clicks FROM ad_stats_monthly WHERE advertisement_id = ? '
+                                    'AND month = ?', (AD_ID, month)).fetchone(),
+            'total': conn.execute('SELECT impressions, clicks FROM advertisements WHERE id = ?', (AD_ID,)).fetchone(),
+        }
+    finally:
+        conn.close()
+
+
+def test_flush_updates_every_rollup_in_one_pass(lca_tv_db):
+    aggregator = counters(lca_tv_db)
+    for visitor in range(30):
+        aggregator.record_impression(AD_ID, f'visitor-{visitor % 10}')
+    for _ in range(3):
+        aggregator.record_click(AD_ID)
+
+    assert aggregator.flush() == 33
+    assert {level: tuple(row) for level, row in stored(lca_tv_db).items()} == {
+        'hourly': (30, 3), 'daily': (30, 3), 'monthly': (30, 3), 'total': (30, 3)}
+    assert aggregator.get_stats()['pending_events'] == 0
+    assert aggregator.flush() == 0
+
+    # Counts add up across flushes
+    aggregator.record_impression(AD_ID)
+    aggregator.flush()
+    assert tuple(stored(lca_tv_db)['daily']) == (31, 3)
+
+
+def test_failed_flush_merges_counts_back(lca_tv_db):
+    aggregator = counters(lca_tv_db)
+    for _ in range(5):
+        aggregator.record_impression(AD_ID, 'visitor')
+
+    with lca_tv_db.transaction() as conn:
+        conn.execute('ALTER TABLE ad_stats_monthly RENAME TO ad_stats_monthly_moved')
+    assert aggregator.flush() == 0
+    assert aggregator.get_stats()['errors'] == 1
+    conn = lca_tv_db.get_connection()
+    # The whole transaction rolled back
+    assert conn.execute('SELECT COUNT(*) FROM ad_stats_hourly').fetchone()[0] == 0
+    conn.close()
+
+    # Events recorded meanwhile join the merged-back ones
+    aggregator.record_impression(AD_ID, 'visitor')
+    aggregator.record_click(AD_ID)
+    assert aggregator.get_stats()['pending_events'] == 7
+
+    with lca_tv_db.transaction() as conn:
+        conn.execute('ALTER TABLE ad_stats_monthly_moved RENAME TO ad_stats_monthly')
+    assert aggregator.flush() == 7
+    assert tuple(stored(lca_tv_db)['total']) == (6, 1)
+
+
+def test_concurrent_first_events_start_one_thread(lca_tv_db, monkeypatch):
+    started = []
+
+    class CountedThread(threading.Thread):
+        def start(self):
+            started.append(self.name)
+            super().start()
+
+    monkeypatch.setattr(ad_counters.threading, 'Thread', CountedThread)
+    aggregator = counters(lca_tv_db)
+    barrier = threading.Barrier(8)
+
+    def record():
+        barrier.wait()
+        aggregator.record_impression(AD_ID)
+
+    threads = [threading.Thread(target=record) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert started.count('ad-counters') == 1
+    assert aggregator.flush() == 8
+
+
+def test_repeated_clicks_are_counted_once_per_window():
+    dedup = ClickDeduplicator(window=30)
+    assert not dedup.is_duplicate(AD_ID, 'visitor-a')
+    assert dedup.is_duplicate(AD_ID, 'visitor-a')
+    assert not dedup.is_duplicate(AD_ID, 'visitor-b')
+    assert dedup.duplicates == 1
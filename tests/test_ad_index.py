@@ -0,0 +1,35 @@
+"""
+Ad index tests: status changes written without touching updated_at (the
+lifecycle scheduler's UPDATEs, other workers) drop the ad from the index,
+while counter updates do not rebuild it.
+"""
+import sqlite3
+
+from ad_index import AdServingIndex
+from data_version import DataVersionWatcher
+
+AD_ID = 1
+
+
+def other_worker(manager, sql):
+    conn = sqlite3.connect(manager.db_path)
+    conn.execute(sql)
+    conn.commit()
+    conn.close()
+
+
+def test_status_change_without_updated_at_rebuilds(lca_tv_db):
+    other_worker(lca_tv_db, f"UPDATE advertisements SET status = 'active', start_date = '2020-01-01', "
+                            f"end_date = '2999-12-31' WHERE id = {AD_ID}")
+    index = AdServingIndex(lca_tv_db, DataVersionWatcher(lca_tv_db.db_path, interval=0))
+    assert index.get_ad(AD_ID) is not None
+    rebuilds = index.rebuilds
+
+    other_worker(lca_tv_db, f"UPDATE advertisements SET clicks = clicks + 1 WHERE id = {AD_ID}")
+    assert index.get_ad(AD_ID) is not None
+    assert index.rebuilds == rebuilds
+
+    other_worker(lca_tv_db, f"UPDATE advertisements SET status = 'expired' WHERE id = {AD_ID}")
+    assert index.get_ad(AD_ID) is None
+    other_worker(lca_tv_db, f"UPDATE advertisements SET status = 'active' WHERE id = {AD_ID}")
+    assert index.get_ad(AD_ID) is not None
@@ -0,0 +1,69 @@
+"""
+Ad report tests: each granularity reads its rollup table, totals and CTR
+are computed over the range, and the CSV stream matches the JSON rows.
+"""
+from datetime import date
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from ad_reports import CSV_COLUMNS, build_report, parse_report_args, stream_report_csv
+
+AD_ID = 1
+
+
+@pytest.fixture
+def reports_db(lca_tv_db):
+    with lca_tv_db.transaction() as conn:
+        conn.executemany('INSERT INTO ad_stats_hourly (advertisement_id, date, hour, impressions, clicks) '
+                         'VALUES (?, ?, ?, ?, ?)', [
+                             (AD_ID, '2026-04-30', 23, 50, 1),
+                             (AD_ID, '2026-05-01', 9, 200, 4), (AD_ID, '2026-05-01', 10, 100, 2),
+                             (AD_ID, '2026-05-03', 8, 400, 0), (2, '2026-05-01', 9, 999, 99)])
+        conn.executemany('INSERT INTO ad_stats (advertisement_id, date, impressions, clicks) VALUES (?, ?, ?, ?)', [
+            (AD_ID, '2026-04-30', 50, 1), (AD_ID, '2026-05-01', 300, 6), (AD_ID, '2026-05-03', 400, 0),
+            (2, '2026-05-01', 999, 99)])
+        conn.executemany('INSERT INTO ad_stats_monthly (advertisement_id, month, impressions, clicks) '
+                         'VALUES (?, ?, ?, ?)', [(AD_ID, '2026-04', 50, 1), (AD_ID, '2026-05', 700, 6)])
+    return lca_tv_db
+
+
+def report(manager, start, end, granularity):
+    conn = manager.get_connection()
+    try:
+        return build_report(conn, AD_ID, start, end, granularity)
+    finally:
+        conn.close()
+
+
+def test_daily_report_rows_and_totals(reports_db):
+    result = report(reports_db, date(2026, 5, 1), date(2026, 5, 31), 'day')
+    assert [(row['period'], row['impressions'], row['clicks'], row['ctr']) for row in result['rows']] == [
+        ('2026-05-01', 300, 6, 2.0), ('2026-05-03', 400, 0, 0.0)]
+    assert result['totals'] == {'impressions': 700, 'clicks': 6, 'ctr': 0.86, 'uniques': None, 'frequency': None}
+
+
+def test_hourly_and_monthly_reports_read_their_rollups(reports_db):
+    hourly = report(reports_db, date(2026, 4, 30), date(2026, 5, 1), 'hour')
+    assert [row['period'] for row in hourly['rows']] == ['2026-04-30 23:00', '2026-05-01 09:00', '2026-05-01 10:00']
+
+    monthly = report(reports_db, date(2026, 4, 15), date(2026, 5, 15), 'month')
+    assert [(row['period'], row['impressions']) for row in monthly['rows']] == [('2026-04', 50), ('2026-05', 700)]
+
+
+def test_csv_stream_matches_the_report(reports_db):
+    chunks = list(stream_report_csv(reports_db, AD_ID, date(2026, 4, 1), date(2026, 5, 31), 'day', chunk_rows=2))
+    lines = ''.join(chunks).splitlines()
+    assert lines[0] == ','.join(CSV_COLUMNS)
+    assert lines[1:] == ['2026-04-30,50,1,2.0,,', '2026-05-01,300,6,2.0,,', '2026-05-03,400,0,0.0,,']
+    assert len(chunks) == 2
+
+
+def test_report_arguments_are_validated():
+    assert parse_report_args(MultiDict({'from': '2026-05-01', 'to': '2026-05-31', 'granularity': 'month'})) == (
+        date(2026, 5, 1), date(2026, 5, 31), 'month')
+    start, end, granularity = parse_report_args(MultiDict({'to': '2026-05-31'}))
+    assert (end - start).days == 29 and granularity == 'day'
+    for args in ({'granularity': 'week'}, {'from': '2026-06-01', 'to': '2026-05-01'}, {'from': '01/05/2026'}):
+        with pytest.raises(ValueError):
+            parse_report_args(MultiDict(args))
@@ -0,0 +1,157 @@
+"""
+Analytics tests: track() only buffers, flushes append to the day partition
+in batches, rollups recount a day idempotently, retention drops old
+partitions while keeping their rollups, only public pages and player
+events from visitors are tracked, and a worker writes only its own queue.
+"""
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask, render_template_string
+
+from analytics_events import AnalyticsTracker, init_analytics, partition_name
+
+
+def tracker_for(manager, **kwargs):
+    # The writer thread never wakes up on its own during a test
+    kwargs.setdefault('batch_size', 10 ** 6)
+    return AnalyticsTracker(manager, flush_interval=3600, **kwargs)
+
+
+def today():
+    return datetime.utcnow().strftime('%Y%m%d')
+
+
+def count(manager, sql, params=()):
+    conn = manager.get_connection()
+    try:
+        return conn.execute(sql, params).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_events_are_buffered_then_appended_in_batches(lca_tv_db):
+    tracker = tracker_for(lca_tv_db)
+    for visitor in range(10):
+        tracker.track('page_view', {'category': 'sport', 'path': '/videos/category/sport'}, f'v{visitor}')
+    tracker.track('video_play', {'video_id': 'abc'}, 'v1')
+
+    assert tracker.get_stats()['queued'] == 11
+    assert count(lca_tv_db, "SELECT COUNT(*) FROM sqlite_master WHERE name = ?", (partition_name(today()),)) == 0
+
+    tracker.batch_size = 4
+    assert tracker.flush() == 11
+    assert tracker.get_stats()['batches'] == 3
+    assert count(lca_tv_db, f'SELECT COUNT(*) FROM {partition_name(today())}') == 11
+    assert tracker.get_stats()['tracked'] == {'page_view': 10, 'video_play': 1}
+
+
+def test_full_queue_drops_the_oldest_events(lca_tv_db):
+    tracker = tracker_for(lca_tv_db, max_queue=3)
+    for index in range(5):
+        tracker.track('page_view', {'category': f'page-{index}'})
+    assert tracker.get_stats()['dropped'] == 2
+    tracker.flush()
+    conn = lca_tv_db.get_connection()
+    try:
+        categories = [row[0] for row in conn.execute(f'SELECT category FROM {partition_name(today())} ORDER BY id')]
+    finally:
+        conn.close()
+    assert categories == ['page-2', 'page-3', 'page-4']
+
+
+def test_rollup_counts_events_and_visitors_idempotently(lca_tv_db):
+    tracker = tracker_for(lca_tv_db)
+    for visit in range(12):
+        tracker.track('page_view', {'category': 'home'}, f'v{visit % 4}')
+    tracker.track('ad_impression', {'category': 'header', 'ad_id': 1}, 'v1')
+    tracker.track('ad_click', None, 'v1')
+
+    assert tracker.rollup() == 1  # today only: yesterday has no partition
+    assert tracker.rollup() == 1
+    rows = {(row.event_type, row.category): (row.events, row.visitors) for row in tracker.daily(days=1)}
+    assert rows == {('page_view', 'home'): (12, 4), ('ad_impression', 'header'): (1, 1), ('ad_click', ''): (1, 1)}
+    assert tracker.totals() == {'page_view': 12, 'ad_impression': 1, 'ad_click': 1}
+
+    # Events tracked after a rollup are picked up by the next one
+    tracker.track('page_view', {'category': 'home'}, 'v9')
+    tracker.rollup()
+    assert tracker.totals()['page_view'] == 13
+
+
+def test_purge_drops_old_partitions_and_keeps_rollups(lca_tv_db):
+    tracker = tracker_for(lca_tv_db, retention_days=30)
+    old_day = (datetime.utcnow() - timedelta(days=40)).strftime('%Y%m%d')
+    recent_day = (datetime.utcnow() - timedelta(days=5)).strftime('%Y%m%d')
+    with lca_tv_db.transaction() as conn:
+        for day in (old_day, recent_day):
+            tracker.ensure_partition(conn, day)
+            conn.execute(f"INSERT INTO {partition_name(day)} (event_type, created_at) VALUES ('page_view', '')")
+    tracker.rollup(days=[old_day, recent_day])
+
+    assert tracker.purge() == 1
+    conn = lca_tv_db.get_connection()
+    try:
+        assert tracker.existing_partitions(conn) == [partition_name(recent_day)]
+    finally:
+        conn.close()
+    assert count(lca_tv_db, 'SELECT COUNT(*) FROM analytics_daily') == 2
+
+
+def test_partition_names_are_validated():
+    assert partition_name('20260501') == 'analytics_events_20260501'
+    for day in ('2026-05-01', '20260501; DROP TABLE users', ''):
+        with pytest.raises(ValueError):
+            partition_name(day)
+
+
+def test_only_public_pages_and_player_events_are_tracked(lca_tv_db):
+    app = Flask(__name__)
+    staff = {'logged_in': False}
+    tracker = init_analytics(app, tracker_for(lca_tv_db), is_staff=lambda: staff['logged_in'])
+    for rule, endpoint in (('/videos', 'videos'), ('/admin/clients', 'admin_clients'),
+                           ('/dashboard/ads', 'dashboard_ads')):
+        app.add_url_rule(rule, endpoint, lambda: '<html></html>')
+    client = app.test_client()
+    headers = {'User-Agent': 'Mozilla/5.0 (Linux; Android 13)'}
+    play = json.dumps({'events': [{'type': 'video_play', 'video_id': 'abc', 'category': 'sport'}]})
+
+    for path in ('/videos', '/admin/clients', '/dashboard/ads'):
+        client.get(path, headers=headers)
+    assert client.post('/api/analytics/events', data=play, headers=headers).status_code == 204
+    staff['logged_in'] = True
+    client.get('/videos', headers=headers)
+    client.post('/api/analytics/events', data=play, headers=headers)
+
+    assert tracker.get_stats()['tracked'] == {'page_view': 1, 'video_play': 1}
+    with app.test_request_context():
+        assert render_template_string('{{ analytics_events_url() }}') == '/api/analytics/events'
+
+
+def test_one_writer_thread_and_no_flush_of_an_inherited_queue(lca_tv_db):
+    tracker = tracker_for(lca_tv_db)
+    running = set(threading.enumerate())
+    barrier = threading.Barrier(8)
+
+    def first_event():
+        barrier.wait()
+        tracker.track('page_view', {'category': 'home'})
+
+    callers = [threading.Thread(target=first_event) for _ in range(8)]
+    for thread in callers:
+        thread.start()
+    for thread in callers:
+        thread.join()
+    assert [thread.name for thread in set(threading.enumerate()) - running] == [tracker.name]
+    assert tracker.exit_registered
+
+    # Forked worker that never tracked anything: the queue it inherited belongs to the parent
+    tracker.pid = os.getpid() + 1
+    tracker.flush_at_exit()
+    assert tracker.get_stats()['written'] == 0
+    tracker.pid = os.getpid()
+    tracker.flush_at_exit()
+    assert tracker.get_stats()['written'] == 8
@@ -0,0 +1,70 @@
+"""
+VideoManager.bulk_upsert tests: new videos are inserted, changed ones
+updated in place (keeping their category and id), identical ones not
+written at all, and a bad batch leaves the table untouched.
+"""
+import importlib
+
+import pytest
+
+
+@pytest.fixture
+def videos(tmp_path):
+    models = importlib.import_module('models')
+    manager = models.VideoManager(models.DatabaseManager(str(tmp_path / 'lcatv.db')))
+    manager.notified = []
+    manager.on_change(lambda: manager.notified.append(True))
+    return manager
+
+
+def video(youtube_id, title='Journal du soir', **fields):
+    return dict({'youtube_id': youtube_id, 'title': title, 'description': 'Édition', 'category': 'actualites',
+                 'view_count': 10}, **fields)
+
+
+def stored(manager):
+    conn = manager.db.get_connection()
+    try:
+        return {row['youtube_id']: dict(row) for row in conn.execute(
+            'SELECT id, youtube_id, title, category, view_count, content_hash, updated_at FROM videos')}
+    finally:
+        conn.close()
+
+
+def test_insert_update_and_no_op(videos):
+    assert videos.bulk_upsert([video('a'), video('b'), video('c')]) == {'inserted': 3, 'updated': 0, 'unchanged': 0}
+    before = stored(videos)
+    assert len(videos.notified) == 1
+
+    result = videos.bulk_upsert([video('a'), video('b', title='Journal - édition spéciale', category='sport'),
+                                 video('c', view_count=11), video('d')])
+    assert result == {'inserted': 1, 'updated': 2, 'unchanged': 1}
+    after = stored(videos)
+    assert after['a'] == before['a']
+    assert after['b']['title'] == 'Journal - édition spéciale'
+    assert after['b']['category'] == 'actualites'  # an update keeps the stored category
+    assert after['b']['id'] == before['b']['id']
+    assert after['c']['view_count'] == 11
+    assert after['c']['content_hash'] != before['c']['content_hash']
+
+    assert videos.bulk_upsert([video('a'), video('b', title='Journal - édition spéciale'), video('c', view_count=11),
+                               video('d')]) == {'inserted': 0, 'updated': 0, 'unchanged': 4}
+    assert stored(videos) == after
+    assert len(videos.notified) == 2  # no-op batches do not invalidate caches
+
+
+def test_last_duplicate_in_a_batch_wins(videos):
+    assert videos.bulk_upsert([video('a', title='Premier'), video('a', title='Second')]) == {
+        'inserted': 1, 'updated': 0, 'unchanged': 0}
+    assert stored(videos)['a']['title'] == 'Second'
+
+
+def test_invalid_batch_writes_nothing(videos):
+    videos.bulk_upsert([video('a')])
+    with pytest.raises(ValueError):
+        videos.bulk_upsert([video('a', title='Modifié'), video('new', category=None)])
+    with pytest.raises(ValueError):
+        videos.bulk_upsert([video(None)])
+    assert stored(videos)['a']['title'] == 'Journal du soir'
+    assert set(stored(videos)) == {'a'}
+    assert videos.bulk_upsert([]) == {'inserted': 0, 'updated': 0, 'unchanged': 0}
@@ -0,0 +1,62 @@
+"""
+Dashboard counter tests: triggers keep the counters row in step with every
+write, and reconciliation repairs drift and records how much it corrected.
+"""
+from dashboard_counters import DashboardCounters, reconcile
+
+
+def recount(manager):
+    conn = manager.get_connection()
+    try:
+        return dict(zip(('total_users', 'total_clients', 'total_ads', 'monthly_revenue'), conn.execute('''
+            SELECT (SELECT COUNT(*) FROM users WHERE is_active = 1),
+                   (SELECT COUNT(*) FROM clients WHERE status = 'active'),
+                   (SELECT COUNT(*) FROM advertisements WHERE status = 'active'),
+                   (SELECT COALESCE(SUM(price), 0) FROM subscriptions WHERE status = 'active')
+        ''').fetchone()))
+    finally:
+        conn.close()
+
+
+def test_triggers_follow_every_write(lca_tv_db):
+    counters = DashboardCounters(lca_tv_db)
+    assert counters.read() == recount(lca_tv_db)
+
+    with lca_tv_db.transaction() as conn:
+        conn.execute("INSERT INTO clients (name, email, status) VALUES ('Nouveau', 'n@example.com', 'active')")
+        conn.execute("INSERT INTO advertisements (client_name, ad_title, start_date, end_date, status) "
+                     "VALUES ('Nouveau', 'Annonce', '2026-01-01', '2026-12-31', 'active')")
+        conn.execute("INSERT INTO subscriptions (client_id, ad_space_id, start_date, end_date, price, status) "
+                     "VALUES (1, 1, '2026-01-01', '2026-12-31', 150000, 'active')")
+    with lca_tv_db.transaction() as conn:
+        conn.execute("UPDATE advertisements SET status = 'inactive' WHERE ad_title = 'Annonce'")
+        conn.execute("UPDATE subscriptions SET price = 200000 WHERE price = 150000")
+        conn.execute("UPDATE users SET is_active = 0")
+    with lca_tv_db.transaction() as conn:
+        conn.execute("DELETE FROM clients WHERE email = 'n@example.com'")
+
+    assert counters.read() == recount(lca_tv_db)
+    assert counters.read()['monthly_revenue'] == 200000
+
+
+def test_reconcile_repairs_drift(lca_tv_db):
+    counters = DashboardCounters(lca_tv_db)
+    assert counters.reconcile() == 0
+
+    # Writes made without the triggers (bulk import, older code)
+    with lca_tv_db.transaction() as conn:
+        conn.execute('DROP TRIGGER dashboard_clients_insert')
+        conn.execute('DROP TRIGGER dashboard_advertisements_update')
+        conn.execute("INSERT INTO clients (name, email, status) VALUES ('Import', 'i@example.com', 'active')")
+        conn.execute("UPDATE advertisements SET status = 'inactive'")
+    assert counters.read() != recount(lca_tv_db)
+
+    assert counters.reconcile() == 2
+    assert counters.read() == recount(lca_tv_db)
+    conn = lca_tv_db.get_connection()
+    try:
+        assert tuple(conn.execute('SELECT drift, reconciled_at IS NOT NULL FROM dashboard_counters').fetchone()) == (2, 1)
+        # A second pass finds nothing left to correct
+        assert reconcile(conn) == 0
+    finally:
+        conn.close()
@@ -0,0 +1,105 @@
+"""
+Backup tests: a run writes a verified .db.gz snapshot that restores to the
+same data, rotation keeps the `keep` newest, concurrent or recent runs are
+skipped, and damaged snapshots fail verification and restore.
+"""
+import fcntl
+import gzip
+import os
+import sqlite3
+
+import pytest
+
+from db_backup import DatabaseBackup, restore_snapshot, verify_snapshot
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = str(tmp_path / 'lca_tv.db')
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('CREATE TABLE videos (id INTEGER PRIMARY KEY, title TEXT)')
+    conn.executemany('INSERT INTO videos (title) VALUES (?)', [(f'Journal {i}',) for i in range(2000)])
+    conn.commit()
+    # Connexion laissée ouverte: les pages restent dans le -wal jusqu'au checkpoint
+    yield path
+    conn.close()
+
+
+def backup_of(database, tmp_path, **kwargs):
+    return DatabaseBackup(database, str(tmp_path / 'backups'), pages=16, sleep=0, **kwargs)
+
+
+def titles(path):
+    conn = sqlite3.connect(path)
+    try:
+        return [row[0] for row in conn.execute('SELECT title FROM videos ORDER BY id')]
+    finally:
+        conn.close()
+
+
+def test_snapshot_is_verified_and_restores(database, tmp_path):
+    backup = backup_of(database, tmp_path)
+    snapshot = backup.run()
+    assert os.path.basename(snapshot).startswith('lca_tv-') and snapshot.endswith('.db.gz')
+    assert backup.snapshots() == [snapshot]
+    assert not [name for name in os.listdir(backup.backup_dir) if name.endswith('.partial')]
+
+    ok, detail = verify_snapshot(snapshot)
+    assert ok, detail
+    target = str(tmp_path / 'restored.db')
+    restore_snapshot(snapshot, target)
+    assert titles(target) == titles(database)
+    with pytest.raises(FileExistsError):
+        restore_snapshot(snapshot, target)
+
+
+def test_rotation_keeps_the_newest(database, tmp_path):
+    backup = backup_of(database, tmp_path, keep=2)
+    os.makedirs(backup.backup_dir)
+    older = [os.path.join(backup.backup_dir, f'lca_tv-2020010{day}-030000.db.gz') for day in (1, 2, 3)]
+    for path in older:
+        with gzip.open(path, 'wb') as handle:
+            handle.write(b'ancienne sauvegarde')
+    # Other databases' snapshots are rotated separately
+    other = os.path.join(backup.backup_dir, 'lcatv-20200101-030000.db.gz')
+    open(other, 'wb').close()
+
+    snapshot = backup.run()
+    assert backup.snapshots() == [older[-1], snapshot]
+    assert os.path.exists(other)
+
+
+def test_concurrent_and_recent_runs_are_skipped(database, tmp_path):
+    backup = backup_of(database, tmp_path, min_interval=3600)
+    os.makedirs(backup.backup_dir)
+    with open(os.path.join(backup.backup_dir, '.lca_tv.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        assert backup.run() is None
+    assert backup.snapshots() == []
+
+    assert backup.run() is not None
+    assert backup.run() is None
+    assert backup.run(force=True) is not None
+    assert backup.get_stats()['skipped'] == 2
+    assert backup.get_stats()['failures'] == 0
+
+
+def test_damaged_snapshots_fail_verification(database, tmp_path):
+    snapshot = backup_of(database, tmp_path).run()
+    with open(snapshot, 'rb') as handle:
+        data = handle.read()
+
+    truncated = str(tmp_path / 'truncated.db.gz')
+    with open(truncated, 'wb') as handle:
+        handle.write(data[:len(data) // 2])
+    garbage = str(tmp_path / 'garbage.db.gz')
+    with gzip.open(garbage, 'wb') as handle:
+        handle.write(b'SQLite format 3\x00' + b'\xff' * 4096)
+
+    for damaged in (truncated, garbage):
+        ok, detail = verify_snapshot(damaged)
+        assert not ok, detail
+        with pytest.raises(ValueError):
+            restore_snapshot(damaged, str(tmp_path / 'restored.db'))
+        assert not os.path.exists(str(tmp_path / 'restored.db'))
@@ -0,0 +1,137 @@
+"""
+Connection pool tests: nested checkouts work in savepoints, and leaked
+checkouts cannot keep a transaction (and the write lock) open.
+"""
+import gc
+import os
+import sqlite3
+import sys
+
+import pytest
+
+WEBSITE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lca-tv-website')
+sys.path.insert(0, WEBSITE_DIR)
+
+from db_pool import ConnectionPool  # noqa: E402
+from lifecycle_scheduler import Scheduler  # noqa: E402
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'pool.db'), pragmas={'busy_timeout': 100})
+    conn = pool.get_connection()
+    conn.execute('CREATE TABLE items (name TEXT)')
+    conn.commit()
+    conn.close()
+    yield pool
+    pool.close()
+
+
+def names(pool):
+    other = sqlite3.connect(pool.db_path)
+    try:
+        return sorted(row[0] for row in other.execute('SELECT name FROM items'))
+    finally:
+        other.close()
+
+
+def can_write(pool):
+    other = sqlite3.connect(pool.db_path, timeout=0.1)
+    try:
+        other.execute('BEGIN IMMEDIATE')
+        other.rollback()
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        other.close()
+
+
+def test_nested_commit_does_not_commit_the_caller(pool):
+    outer = pool.get_connection()
+    outer.execute("INSERT INTO items VALUES ('outer')")
+    inner = pool.get_connection()
+    inner.execute("INSERT INTO items VALUES ('inner')")
+    inner.commit()
+    inner.close()
+    assert names(pool) == []
+
+    outer.commit()
+    outer.close()
+    assert names(pool) == ['inner', 'outer']
+
+
+def test_nested_rollback_only_undoes_its_own_writes(pool):
+    outer = pool.get_connection()
+    outer.execute("INSERT INTO items VALUES ('outer')")
+    inner = pool.get_connection()
+    inner.execute("INSERT INTO items VALUES ('inner')")
+    inner.rollback()
+    inner.close()
+
+    unclosed = pool.get_connection()
+    unclosed.execute("INSERT INTO items VALUES ('unclosed')")
+    unclosed.close()
+
+    outer.commit()
+    outer.close()
+    assert names(pool) == ['outer']
+
+
+def test_nested_transaction_block(pool):
+    with pool.transaction() as conn:
+        conn.execute("INSERT INTO items VALUES ('outer')")
+        with pytest.raises(ValueError):
+            with pool.transaction() as nested:
+                nested.execute("INSERT INTO items VALUES ('failed')")
+                raise ValueError
+        with pool.transaction() as nested:
+            nested.execute("INSERT INTO items VALUES ('nested')")
+    assert names(pool) == ['nested', 'outer']
+
+
+def test_release_rolls_back_a_leaked_checkout(pool):
+    leaked = pool.get_connection()
+    leaked.execute("INSERT INTO items VALUES ('leaked')")
+    assert not can_write(pool)
+
+    pool.release()
+    assert can_write(pool)
+
+    # The stale proxy must not end the next checkout's transaction
+    conn = pool.get_connection()
+    conn.execute("INSERT INTO items VALUES ('kept')")
+    leaked.close()
+    assert conn.in_transaction
+    conn.commit()
+    conn.close()
+    assert names(pool) == ['kept']
+
+
+def test_dropped_proxy_is_checked_in(pool):
+    def forgets_to_close():
+        conn = pool.get_connection()
+        conn.execute("INSERT INTO items VALUES ('dropped')")
+
+    forgets_to_close()
+    gc.collect()
+    assert pool.local.depth == 0
+    assert can_write(pool)
+
+
+def test_scheduler_releases_connections_after_each_job(pool):
+    def failing_job():
+        conn = pool.get_connection()
+        conn.execute("INSERT INTO items VALUES ('job')")
+        leaked.append(conn)
+        raise RuntimeError('job failed')
+
+    leaked = []
+    scheduler = Scheduler()
+    scheduler.teardowns.append(pool.release)
+    scheduler.add_job('failing', 60, failing_job)
+    scheduler.run_pending()
+
+    assert scheduler.last_runs['failing'][2] == 'job failed'
+    assert can_write(pool)
+    assert names(pool) == []
@@ -0,0 +1,83 @@
+"""
+Unique reach tests: HyperLogLog estimates stay within a few standard errors,
+sketches merge as unions and survive serialization, and reports derive
+uniques and frequency from the daily sketches the counters store.
+"""
+from datetime import date, datetime
+
+import pytest
+
+from ad_counters import AdCounterAggregator
+from ad_reports import build_report
+from hyperloglog import HyperLogLog
+
+AD_ID = 1
+# 3 standard errors of the default precision (1.04 / sqrt(4096))
+TOLERANCE = 0.05
+
+
+def sketch_of(visitors):
+    sketch = HyperLogLog()
+    for visitor in visitors:
+        sketch.add(visitor)
+    return sketch
+
+
+@pytest.mark.parametrize('distinct', [10, 1000, 50000])
+def test_estimate_within_tolerance(distinct):
+    sketch = sketch_of(f'visitor-{i}' for i in range(distinct) for _ in range(3))
+    assert abs(sketch.count() - distinct) <= max(1, distinct * TOLERANCE)
+
+
+def test_merge_is_a_union_and_round_trips():
+    monday = sketch_of(f'visitor-{i}' for i in range(0, 6000))
+    tuesday = sketch_of(f'visitor-{i}' for i in range(4000, 10000))
+    week = HyperLogLog.union([monday, tuesday])
+    assert abs(week.count() - 10000) <= 10000 * TOLERANCE
+
+    restored = HyperLogLog.from_bytes(week.to_bytes())
+    assert restored.registers == week.registers
+    assert len(week.to_bytes()) < len(week.registers)
+
+    with pytest.raises(ValueError):
+        week.merge(HyperLogLog(precision=10))
+    with pytest.raises(ValueError):
+        HyperLogLog.from_bytes(b'\x09' + week.to_bytes()[1:])
+
+
+def test_report_uniques_from_flushed_sketches(lca_tv_db):
+    aggregator = AdCounterAggregator(lca_tv_db, flush_interval=3600, max_pending=10 ** 6)
+    for visit in range(3000):
+        aggregator.record_impression(AD_ID, f'visitor-{visit % 1000}')
+    aggregator.flush()
+    # A second flush merges into the stored sketch instead of replacing it
+    for visitor in range(1000, 1500):
+        aggregator.record_impression(AD_ID, f'visitor-{visitor}')
+    aggregator.flush()
+
+    today = datetime.now().date()
+    conn = lca_tv_db.get_connection()
+    try:
+        result = build_report(conn, AD_ID, today, today, 'day')
+        monthly = build_report(conn, AD_ID, today.replace(day=1), today, 'month')
+        hourly = build_report(conn, AD_ID, today, today, 'hour')
+    finally:
+        conn.close()
+
+    totals = result['totals']
+    assert totals['impressions'] == 3500
+    assert abs(totals['uniques'] - 1500) <= 1500 * TOLERANCE
+    assert totals['frequency'] == round(3500 / totals['uniques'], 2)
+    assert result['rows'][0]['uniques'] == totals['uniques']
+    assert monthly['rows'][0]['uniques'] == totals['uniques']
+    # Below daily resolution there is no sketch
+    assert all(row['uniques'] is None for row in hourly['rows'])
+
+
+def test_no_sketch_means_unknown_reach(lca_tv_db):
+    conn = lca_tv_db.get_connection()
+    try:
+        result = build_report(conn, AD_ID, date(2026, 1, 1), date(2026, 1, 31), 'day')
+    finally:
+        conn.close()
+    assert result['totals']['uniques'] is None and result['totals']['frequency'] is None
@@ -0,0 +1,81 @@
+"""
+Responsive image tests: poster names with parentheses are found by the
+savings report, thumbnails get <picture> markup only for local images with
+derivatives, and manifest updates from several processes are all kept.
+"""
+import multiprocessing
+import os
+
+from flask import Flask, render_template_string
+
+import image_derivatives
+from image_derivatives import IMAGE_REFERENCE, DerivativeManifest, init_image_derivatives
+
+POSTER = 'images/7 AFRIQUE (TOUS LES DIMANCHES A 13H 00).png'
+THUMBNAIL = '''{% from 'components/thumbnail.html' import thumbnail %}{{ thumbnail(src, 'Émission', '400px') }}'''
+
+
+def entry(width=1920):
+    return {'width': width, 'height': 1080, 'bytes': 2000000, 'mtime': 0, 'variants': [
+        {'path': 'derivatives/images/poster-640w.webp', 'width': 640, 'height': 360, 'format': 'webp', 'bytes': 40000},
+        {'path': 'derivatives/images/poster-1280w.webp', 'width': 1280, 'height': 720, 'format': 'webp', 'bytes': 90000},
+    ]}
+
+
+def test_references_with_parentheses_are_found():
+    html = f'''
+        <img src="/lca/static/images/LOGO LCA.png" onerror="this.src='/lca/static/{POSTER}'">
+        <div style="background: url(/static/images/bg5.jpg)"></div>
+        <img src="{{{{ url_for('static', filename='images/logo.png') }}}}">
+    '''
+    assert sorted(set(IMAGE_REFERENCE.findall(html))) == [POSTER, 'images/LOGO LCA.png', 'images/bg5.jpg',
+                                                          'images/logo.png']
+
+
+def test_thumbnails_use_derivatives_only_for_local_images(tmp_path, monkeypatch):
+    manifest = DerivativeManifest(str(tmp_path / 'manifest.json'))
+    manifest.update(POSTER, entry())
+    monkeypatch.setattr(image_derivatives, 'manifest', manifest)
+    app = Flask(__name__, template_folder=image_derivatives.TEMPLATES_DIR)
+    init_image_derivatives(app)
+
+    with app.test_request_context():
+        poster = render_template_string(THUMBNAIL, src='/static/' + POSTER)
+        youtube = render_template_string(THUMBNAIL, src='https://i.ytimg.com/vi/abc/mqdefault.jpg')
+        missing = render_template_string(THUMBNAIL, src='')
+
+    assert '<picture><source type="image/webp"' in poster
+    assert '/static/derivatives/images/poster-640w.webp 640w' in poster
+    assert 'sizes="400px"' in poster and 'width="1920" height="1080"' in poster
+    assert youtube.strip() == ('<img src="https://i.ytimg.com/vi/abc/mqdefault.jpg" alt="Émission" '
+                               'loading="lazy">')
+    assert '<img src="" alt="Émission"' in missing
+
+
+def test_thumbnail_without_the_helpers_is_a_plain_image():
+    app = Flask(__name__, template_folder=image_derivatives.TEMPLATES_DIR)
+    with app.test_request_context():
+        html = render_template_string(THUMBNAIL, src='/static/' + POSTER)
+    assert html.strip() == f'<img src="/static/{POSTER}" alt="Émission" loading="lazy">'
+
+
+def update_many(path, worker):
+    manifest = DerivativeManifest(path)
+    for index in range(15):
+        manifest.update(f'images/worker-{worker}-{index}.png', entry())
+
+
+def test_concurrent_updates_keep_every_entry(tmp_path):
+    path = str(tmp_path / 'manifest.json')
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=update_many, args=(path, worker)) for worker in range(4)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join(30)
+        assert process.exitcode == 0
+
+    manifest = DerivativeManifest(path)
+    manifest.refresh(max_age=0)
+    assert len(manifest.entries) == 60
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
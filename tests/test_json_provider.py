@@ -0,0 +1,28 @@
+"""
+JSON provider tests: orjson output matches what the stdlib provider accepted,
+including non-str dict keys and values orjson cannot encode.
+"""
+import json
+from datetime import datetime
+
+from flask import Flask
+
+from json_provider import init_json_provider
+
+
+def dumps(obj):
+    app = Flask(__name__)
+    init_json_provider(app)
+    with app.app_context():
+        return app.json.dumps(obj)
+
+
+def test_int_keys_are_accepted():
+    stats = {2025: {1: 12, 2: 30}, 'total': 42}
+    assert json.loads(dumps(stats)) == {'2025': {'1': 12, '2': 30}, 'total': 42}
+
+
+def test_values_orjson_rejects_fall_back_to_the_json_module():
+    big = 2 ** 70
+    assert json.loads(dumps({'views': big})) == {'views': big}
+    assert json.loads(dumps({'at': datetime(2025, 1, 2, 3, 4, 5)})) == {'at': 'Thu, 02 Jan 2025 03:04:05 GMT'}
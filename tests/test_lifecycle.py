@@ -0,0 +1,140 @@
+"""
+Lifecycle transition tests against the schema of lca_tv.db, whose
+advertisements only accept the statuses of their CHECK constraint and whose
+ad spaces have no updated_at column, and of the scheduler starting a single
+thread per process.
+"""
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+from datetime import date
+
+import pytest
+
+WEBSITE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lca-tv-website')
+sys.path.insert(0, WEBSITE_DIR)
+
+from db_pool import ConnectionPool  # noqa: E402
+from lifecycle_scheduler import LifecycleManager, Scheduler, allowed_statuses  # noqa: E402
+from migrations import migrate  # noqa: E402
+
+TODAY = date(2026, 6, 1)
+
+# (title, start_date, end_date, status before, status after or None if archived)
+ADS = [
+    ('starts today', '2026-06-01', '2026-06-30', 'pending', 'active'),
+    ('moved to the future', '2026-07-01', '2026-07-31', 'active', 'pending'),
+    ('ended yesterday', '2026-05-01', '2026-05-31', 'active', 'expired'),
+    ('ended long ago', '2025-01-01', '2025-12-31', 'expired', None),
+    ('ends long ago, still active', '2025-01-01', '2025-12-31', 'active', None),
+    ('disabled by an admin', '2025-01-01', '2025-12-31', 'inactive', 'inactive'),
+]
+
+
+class Manager:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.pool = ConnectionPool(db_path)
+
+    def get_connection(self):
+        return self.pool.get_connection()
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / 'lca_tv.db')
+    shutil.copy(os.path.join(WEBSITE_DIR, 'lca_tv.db'), path)
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    conn.execute('DELETE FROM advertisements')
+    conn.execute('DELETE FROM subscriptions')
+    conn.executemany('''
+        INSERT INTO advertisements (client_name, ad_title, start_date, end_date, position, status, updated_at)
+        VALUES ('Client', ?, ?, ?, 'header', ?, '2020-01-01')
+    ''', [ad[:4] for ad in ADS])
+    conn.execute('''
+        INSERT INTO subscriptions (client_id, ad_space_id, start_date, end_date, price, status)
+        VALUES (1, 1, '2025-01-01', '2025-12-31', 100, 'active')
+    ''')
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def statuses(conn):
+    return dict(conn.execute('SELECT ad_title, status FROM advertisements').fetchall())
+
+
+def test_status_constraint_is_read_from_the_schema(db):
+    assert allowed_statuses(db.cursor(), 'advertisements') == {'active', 'inactive', 'expired', 'pending'}
+    assert allowed_statuses(db.cursor(), 'subscriptions') is None
+
+
+def test_transitions_and_archiving(db):
+    lifecycle = LifecycleManager(Manager(db.execute('PRAGMA database_list').fetchone()[2]))
+    changed = lifecycle.run(today=TODAY)
+
+    expected = {title: after for title, _, _, _, after in ADS if after}
+    assert statuses(db) == expected
+    archived = dict(db.execute('SELECT ad_title, status FROM advertisements_archive').fetchall())
+    assert archived == {'ended long ago': 'expired', 'ends long ago, still active': 'expired'}
+    assert db.execute('SELECT COUNT(*) FROM advertisements_archive WHERE archived_at IS NULL').fetchone()[0] == 0
+    assert db.execute('SELECT COUNT(*) FROM subscriptions').fetchone()[0] == 0
+    assert db.execute('SELECT COUNT(*) FROM subscriptions_archive').fetchone()[0] == 1
+
+    # Transitions touch updated_at, admin-disabled rows are left alone
+    untouched = dict(db.execute('SELECT ad_title, updated_at FROM advertisements').fetchall())
+    assert untouched['disabled by an admin'] == '2020-01-01'
+    assert untouched['starts today'] != '2020-01-01'
+
+    # 3 transitions + 2 archived (the still-active one also expired first)
+    assert changed == {'advertisements': 6, 'subscriptions': 2}
+    assert lifecycle.run(today=TODAY) == {}
+
+
+def test_transition_to_a_forbidden_status_is_skipped(tmp_path):
+    path = str(tmp_path / 'strict.db')
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE advertisements (
+            id INTEGER PRIMARY KEY, start_date DATE, end_date DATE,
+            status TEXT CHECK(status IN ('active', 'expired', 'paused'))
+        )
+    ''')
+    conn.execute("INSERT INTO advertisements VALUES (1, '2026-05-01', '2026-05-31', 'active')")
+    conn.execute("INSERT INTO advertisements VALUES (2, '2026-07-01', '2026-07-31', 'active')")
+    conn.commit()
+
+    # 'pending' is not allowed: the future ad stays active instead of failing the whole run
+    assert LifecycleManager(Manager(path)).run(today=TODAY) == {'advertisements': 1}
+    assert conn.execute('SELECT id, status FROM advertisements ORDER BY id').fetchall() == [
+        (1, 'expired'), (2, 'active')]
+    conn.close()
+
+
+def test_concurrent_first_requests_start_one_scheduler_thread():
+    release = threading.Event()
+    loops = []
+
+    class BlockingScheduler(Scheduler):
+        def run_loop(self):
+            loops.append(threading.current_thread())
+            release.wait(5)
+
+    scheduler = BlockingScheduler()
+    barrier = threading.Barrier(8)
+
+    def first_request():
+        barrier.wait()
+        scheduler.start()
+
+    requests = [threading.Thread(target=first_request) for _ in range(8)]
+    for thread in requests:
+        thread.start()
+    for thread in requests:
+        thread.join()
+    release.set()
+    scheduler.thread.join(5)
+    assert len(loops) == 1
@@ -0,0 +1,97 @@
+"""
+Migration runner tests: concurrent first boots apply each step once, and
+duplicate ad_stats rows are merged so the unique index the counters rely on
+can be created.
+"""
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+
+import pytest
+
+WEBSITE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lca-tv-website')
+sys.path.insert(0, WEBSITE_DIR)
+
+import migrations  # noqa: E402
+from migrations import has_index, latest_version, migrate  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'lca_tv.db')
+    shutil.copy(os.path.join(WEBSITE_DIR, 'lcatv_advanced.db'), path)
+    return path
+
+
+def test_concurrent_boots_apply_each_step_once(db_path, monkeypatch):
+    runs = []
+
+    def counted(number, function):
+        def run(conn):
+            runs.append(number)
+            function(conn)
+        return run
+
+    monkeypatch.setattr(migrations, 'MIGRATIONS', [(number, description, counted(number, function))
+                                                   for number, description, function in migrations.MIGRATIONS])
+
+    barrier = threading.Barrier(4)
+    applied = []
+
+    def boot():
+        conn = sqlite3.connect(db_path, timeout=30)
+        barrier.wait()
+        applied.append(migrate(conn))
+        conn.close()
+
+    threads = [threading.Thread(target=boot) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    every_version = [number for number, _, _ in migrations.MIGRATIONS]
+    assert sorted(runs) == every_version
+    assert sorted(number for versions in applied for number in versions) == every_version
+    conn = sqlite3.connect(db_path)
+    assert conn.execute('SELECT COUNT(*), MAX(version) FROM schema_version').fetchone() == (
+        len(every_version), latest_version())
+    conn.close()
+
+
+def test_duplicate_ad_stats_are_merged_before_the_unique_index(db_path):
+    conn = sqlite3.connect(db_path)
+    # Table created without its UNIQUE(advertisement_id, date) constraint
+    conn.execute('DROP TABLE ad_stats')
+    conn.execute('''
+        CREATE TABLE ad_stats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            advertisement_id INTEGER NOT NULL,
+            date DATE NOT NULL,
+            impressions INTEGER DEFAULT 0,
+            clicks INTEGER DEFAULT 0
+        )
+    ''')
+    conn.executemany('INSERT INTO ad_stats (advertisement_id, date, impressions, clicks) VALUES (?, ?, ?, ?)', [
+        (1, '2026-05-01', 10, 1), (1, '2026-05-01', 5, None), (1, '2026-05-01', 2, 2),
+        (1, '2026-05-02', 7, 0), (2, '2026-05-01', 3, 1),
+    ])
+    conn.commit()
+
+    migrate(conn)
+
+    assert has_index(conn, 'ad_stats', ('advertisement_id', 'date'), unique=True)
+    assert conn.execute('SELECT advertisement_id, date, impressions, clicks FROM ad_stats ORDER BY id').fetchall() == [
+        (1, '2026-05-01', 17, 3), (1, '2026-05-02', 7, 0), (2, '2026-05-01', 3, 1)]
+
+    # The counter flush upsert now works
+    conn.execute('''
+        INSERT INTO ad_stats (advertisement_id, date, impressions, clicks) VALUES (1, '2026-05-01', 1, 0)
+        ON CONFLICT(advertisement_id, date) DO UPDATE SET impressions = impressions + excluded.impressions
+    ''')
+    assert conn.execute("SELECT impressions FROM ad_stats WHERE advertisement_id = 1 AND date = '2026-05-01'"
+                        ).fetchone()[0] == 18
+    conn.close()
+
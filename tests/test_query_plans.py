@@ -0,0 +1,123 @@
+"""
+EXPLAIN QUERY PLAN regression tests for the hot queries
+
+Each query runs against a migrated copy of the database it is issued on and
+fails if SQLite plans a full scan of one of its tables (a SCAN without an
+index), or, for ordered/limited queries, needs a temporary B-tree to sort.
+"""
+import importlib
+import os
+import re
+import shutil
+import sqlite3
+import sys
+
+import pytest
+
+WEBSITE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lca-tv-website')
+sys.path.insert(0, WEBSITE_DIR)
+
+from migrations import migrate, latest_version  # noqa: E402
+
+# 'SCAN a' since SQLite 3.36, 'SCAN TABLE advertisements AS a' before
+FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+
+# (description, sql, index-ordered) against app_advanced's database
+ADVANCED_QUERIES = [
+    ('ad serving index',
+     '''SELECT a.*, s.location, s.width, s.height, c.name as client_name
+        FROM advertisements a
+        JOIN ad_spaces s ON a.ad_space_id = s.id
+        JOIN clients c ON a.client_id = c.id
+        WHERE a.status = 'active' AND a.start_date <= ? AND a.end_date >= ?''', False),
+    ('daily ad stats lookup',
+     'SELECT impressions, clicks FROM ad_stats WHERE advertisement_id = ? AND date = ?', False),
+    ('daily ad report',
+     'SELECT date, impressions, clicks FROM ad_stats WHERE advertisement_id = ? AND date BETWEEN ? AND ? ORDER BY date', True),
+    ('hourly ad report',
+     'SELECT date, hour, impressions FROM ad_stats_hourly WHERE advertisement_id = ? AND date BETWEEN ? AND ? ORDER BY date, hour', True),
+    ('recent activity',
+     '''SELECT l.*, u.username FROM activity_logs l
+        LEFT JOIN users u ON l.user_id = u.id
+        ORDER BY l.created_at DESC LIMIT 10''', True),
+    ('admin ad list',
+     '''SELECT a.*, c.name as client_name, s.name as space_name
+        FROM advertisements a
+        JOIN clients c ON a.client_id = c.id
+        JOIN ad_spaces s ON a.ad_space_id = s.id
+        ORDER BY a.created_at DESC''', True),
+    ('ad activation',
+     "UPDATE advertisements SET status = 'active' WHERE status = 'pending' AND start_date <= ? AND end_date >= ?", False),
+    ('ad expiry',
+     "UPDATE advertisements SET status = 'expired' WHERE status IN ('active', 'pending') AND end_date < ?", False),
+    ('subscription expiry',
+     "UPDATE subscriptions SET status = 'expired' WHERE status IN ('active', 'pending') AND end_date < ?", False),
+    ('ad archiving',
+     "DELETE FROM advertisements WHERE status = 'expired' AND end_date < ?", False),
+    ('dashboard counters', 'SELECT * FROM dashboard_counters WHERE id = 1', False),
+    ('media library',
+     'SELECT * FROM media_files WHERE parent_id IS NULL ORDER BY created_at DESC LIMIT 20', True),
+]
+
+# against the models.py database
+MODELS_QUERIES = [
+    ('videos by category',
+     "SELECT * FROM videos WHERE category = ? ORDER BY created_at DESC", True),
+    ('published videos',
+     "SELECT * FROM videos WHERE status = ? ORDER BY created_at DESC", True),
+    ('videos by category and status',
+     "SELECT * FROM videos WHERE category = ? AND status = ? ORDER BY created_at DESC", True),
+    ('video by youtube id', 'SELECT id FROM videos WHERE youtube_id = ?', False),
+    ('setting by key', 'SELECT value FROM settings WHERE key = ?', False),
+    ('user login', 'SELECT * FROM users WHERE username = ? AND is_active = 1', False),
+    ('active ads',
+     "SELECT * FROM advertisements WHERE status = ? ORDER BY created_at DESC", False),
+]
+
+
+def query_plan(conn, sql):
+    return [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, [None] * sql.count('?'))]
+
+
+def assert_indexed(conn, description, sql, ordered):
+    plan = query_plan(conn, sql)
+    scans = [step for step in plan if FULL_SCAN.match(step)]
+    assert not scans, f"{description}: full scan {scans} in {plan}"
+    if ordered:
+        assert not any('TEMP B-TREE' in step for step in plan), f"{description}: sort without index in {plan}"
+
+
+@pytest.fixture(scope='module')
+def advanced_db(tmp_path_factory):
+    path = tmp_path_factory.mktemp('advanced') / 'lca_tv.db'
+    shutil.copy(os.path.join(WEBSITE_DIR, 'lcatv_advanced.db'), path)
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture(scope='module')
+def models_db(tmp_path_factory):
+    models = importlib.import_module('models')
+    db = models.DatabaseManager(str(tmp_path_factory.mktemp('models') / 'lcatv.db'))
+    db.ensure_initialized()
+    conn = sqlite3.connect(db.db_path)
+    yield conn
+    conn.close()
+
+
+def test_migrations_are_recorded_and_idempotent(advanced_db):
+    version = advanced_db.execute('SELECT MAX(version) FROM schema_version').fetchone()[0]
+    assert version == latest_version()
+    assert migrate(advanced_db) == []
+
+
+@pytest.mark.parametrize('description,sql,ordered', ADVANCED_QUERIES, ids=[q[0] for q in ADVANCED_QUERIES])
+def test_advanced_hot_queries_use_indexes(advanced_db, description, sql, ordered):
+    assert_indexed(advanced_db, description, sql, ordered)
+
+
+@pytest.mark.parametrize('description,sql,ordered', MODELS_QUERIES, ids=[q[0] for q in MODELS_QUERIES])
+def test_models_hot_queries_use_indexes(models_db, description, sql, ordered):
+    assert_indexed(models_db, description, sql, ordered)
@@ -0,0 +1,160 @@
+"""
+Full-text search tests: accent folding, prefixes, trigger sync, highlighting,
+and p95 latency of /api/search-style queries over 100k indexed rows.
+"""
+import importlib
+import itertools
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import time
+
+import pytest
+
+WEBSITE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lca-tv-website')
+sys.path.insert(0, WEBSITE_DIR)
+
+from migrations import migrate  # noqa: E402
+from search_index import build_match, search  # noqa: E402
+
+VIDEO_ROWS = 60000
+ARTICLE_ROWS = 40000
+VOCABULARY = 20000
+P95_BUDGET_MS = 50
+
+# Topical words, placed at mid-frequency ranks of a Zipf-distributed vocabulary
+WORDS = ('politique', 'économie', 'santé', 'éducation', 'sécurité', 'agriculture', 'culture',
+         'sport', 'football', 'musique', 'élections', 'gouvernement', 'développement', 'jeunesse',
+         'femmes', 'entreprises', 'marché', 'énergie', 'transport', 'université', 'région',
+         'capitale', 'débat', 'interview', 'reportage', 'festival', 'cinéma', 'littérature')
+CATEGORIES = ('actualites', 'emissions', 'sport', 'culture', 'economie')
+QUERIES = ('franc parler', 'economie', 'élections', 'sante publique', 'debat', 'musiq', 'cinema festival',
+           'gouvern', 'université région', 'emission', 'agri', 'securite', 'football', 'jeunesse fem')
+SYLLABLES = ('ba', 'ko', 'li', 'ma', 'né', 'ro', 'su', 'ta', 'vi', 'zo', 'dé', 'fè', 'gu', 'pa', 'ri', 'wé')
+
+
+class Corpus:
+    """Random French-looking text with a Zipf word-frequency distribution"""
+
+    def __init__(self, rng):
+        self.rng = rng
+        words = [''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(VOCABULARY)]
+        words[100:100 + len(WORDS)] = WORDS
+        self.words = words
+        self.cumulative = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(words))))
+
+    def sentence(self, length):
+        return ' '.join(self.rng.choices(self.words, cum_weights=self.cumulative, k=length))
+
+
+@pytest.fixture(scope='module')
+def db(tmp_path_factory):
+    models = importlib.import_module('models')
+    manager = models.DatabaseManager(str(tmp_path_factory.mktemp('search') / 'lcatv.db'))
+    rng = random.Random(42)
+    corpus = Corpus(rng)
+    with manager.transaction() as conn:
+        conn.executemany('''
+            INSERT INTO videos (youtube_id, title, description, category, status, created_by)
+            VALUES (?, ?, ?, ?, ?, 1)
+        ''', [(f'yt{i}', corpus.sentence(6), corpus.sentence(30), rng.choice(CATEGORIES), 'published')
+              for i in range(VIDEO_ROWS)])
+        conn.executemany('''
+            INSERT INTO articles (title, slug, content, excerpt, category, status)
+            VALUES (?, ?, ?, ?, ?, 'published')
+        ''', [(corpus.sentence(8), f'article-{i}', corpus.sentence(80), corpus.sentence(20), rng.choice(CATEGORIES))
+              for i in range(ARTICLE_ROWS)])
+        conn.execute('''
+            INSERT INTO videos (youtube_id, title, description, category, status, created_by)
+            VALUES ('fp1', 'Franc-Parler : l''Émission du dimanche', 'Débat <b>en direct</b>', 'emissions', 'published', 1)
+        ''')
+    return manager
+
+
+def run_search(db, query, **kwargs):
+    conn = db.get_connection()
+    try:
+        return search(conn, query, **kwargs)
+    finally:
+        conn.close()
+
+
+def test_build_match_quotes_terms_and_prefixes_the_last():
+    assert build_match('Franc-Parler') == '"franc" "parler"*'
+    assert build_match('a OR b*') == '"a" "or" "b"'
+    assert build_match('  ') is None
+
+
+def test_accent_folding_and_prefix(db):
+    for query in ('franc parler', 'emission dimanche', 'FRANC-PARL', 'émission'):
+        results = run_search(db, query, kind='video', category='emissions')
+        assert any(r['youtube_id'] == 'fp1' for r in results), query
+
+
+def test_title_is_highlighted_and_escaped(db):
+    result = run_search(db, 'franc parler')[0]
+    assert result['youtube_id'] == 'fp1'
+    assert '<mark>Franc</mark>-<mark>Parler</mark>' in result['title']
+    snippet = run_search(db, 'direct')
+    assert all('<b>' not in r['snippet'] for r in snippet)
+
+
+def test_triggers_keep_index_in_sync(db):
+    with db.transaction() as conn:
+        conn.execute("UPDATE videos SET title = 'Zygomatique spécial' WHERE youtube_id = 'yt1'")
+    assert [r['youtube_id'] for r in run_search(db, 'zygomatique')] == ['yt1']
+
+    with db.transaction() as conn:
+        conn.execute("UPDATE videos SET status = 'draft' WHERE youtube_id = 'yt1'")
+    assert run_search(db, 'zygomatique') == []
+
+    with db.transaction() as conn:
+        conn.execute("UPDATE videos SET status = 'published', view_count = 5 WHERE youtube_id = 'yt1'")
+        conn.execute("DELETE FROM articles WHERE slug = 'article-1'")
+    assert len(run_search(db, 'zygomatique')) == 1
+    conn = db.get_connection()
+    indexed = conn.execute('SELECT COUNT(*) FROM search_index').fetchone()[0]
+    conn.close()
+    assert indexed == VIDEO_ROWS + ARTICLE_ROWS  # +1 franc-parler, -1 article
+
+
+def test_p95_latency_on_100k_rows(db):
+    for query in QUERIES:  # warm the page cache
+        run_search(db, query)
+
+    timings = []
+    for _ in range(10):
+        for query in QUERIES:
+            start = time.perf_counter()
+            run_search(db, query, limit=20)
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    assert p95 < P95_BUDGET_MS, f"p95 {p95:.1f} ms over {len(timings)} queries"
+
+
+def test_app_advanced_database_is_indexed(tmp_path):
+    # lca_tv.db: videos without a status column (all indexed), articles without a slug
+    path = tmp_path / 'lca_tv.db'
+    shutil.copy(os.path.join(WEBSITE_DIR, 'lca_tv.db'), path)
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    conn.execute('''
+        INSERT INTO videos (title, description, youtube_id, category)
+        VALUES ('Franc-Parler : spécial élections', 'Débat', 'fp2', 'emissions')
+    ''')
+    conn.execute('''
+        INSERT INTO articles (title, content, author, status)
+        VALUES ('Élections : le débat de Franc-Parler', 'Compte rendu', 'Rédaction', 'published')
+    ''')
+    conn.execute('''
+        INSERT INTO articles (title, content, author, status)
+        VALUES ('Élections : brouillon', 'Compte rendu', 'Rédaction', 'draft')
+    ''')
+    conn.commit()
+
+    results = search(conn, 'franc parler elections')
+    assert sorted((r['type'], r['id']) for r in results) == [('article', 1), ('video', 1)]
+    conn.close()
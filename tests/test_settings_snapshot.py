@@ -0,0 +1,98 @@
+"""
+Settings snapshot tests: a commit to settings from any connection (another
+worker) is visible on the next read, while commits to other tables never
+reload the table.
+"""
+import sqlite3
+
+import pytest
+
+from settings_snapshot import SettingsSnapshot
+
+
+def other_worker(manager, sql, params=()):
+    conn = sqlite3.connect(manager.db_path)
+    conn.execute(sql, params)
+    conn.commit()
+    conn.close()
+
+
+def test_settings_written_elsewhere_are_seen_on_next_read(lca_tv_db):
+    other_worker(lca_tv_db, "INSERT INTO settings (key, value) VALUES ('site_name', 'LCA TV')")
+    snapshot = SettingsSnapshot(lca_tv_db)
+    assert snapshot.get('site_name') == 'LCA TV'
+    assert snapshot.get('site_name') == 'LCA TV'
+    assert snapshot.reloads == 1
+
+    other_worker(lca_tv_db, "UPDATE settings SET value = 'LCA TV Burkina' WHERE key = 'site_name'")
+    assert snapshot.get('site_name') == 'LCA TV Burkina'
+    other_worker(lca_tv_db, "DELETE FROM settings WHERE key = 'site_name'")
+    assert snapshot.get('site_name', 'absent') == 'absent'
+    assert snapshot.reloads == 3
+
+
+def test_unrelated_commits_do_not_reload(lca_tv_db):
+    snapshot = SettingsSnapshot(lca_tv_db)
+    snapshot.current()
+    reloads = snapshot.reloads
+
+    other_worker(lca_tv_db, "UPDATE advertisements SET clicks = clicks + 1")
+    other_worker(lca_tv_db, "INSERT INTO clients (name, email) VALUES ('Client', 'c@example.com')")
+    snapshot.current()
+    assert snapshot.reloads == reloads
+
+
+def test_invalidate_and_immutability(lca_tv_db):
+    snapshot = SettingsSnapshot(lca_tv_db)
+    values = snapshot.current()
+    with pytest.raises(TypeError):
+        values['site_name'] = 'modifié'
+
+    reloads = snapshot.reloads
+    snapshot.invalidate()
+    snapshot.current()
+    assert snapshot.reloads == reloads + 1
+
+    # lca_tv.db has no settings.category column
+    assert snapshot.get_all('general') == {}
+    assert snapshot.get_all() is snapshot.current()
+
+
+def test_read_inside_an_open_pooled_transaction(lca_tv_db):
+    snapshot = SettingsSnapshot(lca_tv_db)
+    conn = lca_tv_db.get_connection()
+    try:
+        conn.execute("INSERT INTO settings (key, value) VALUES ('site_name', 'LCA TV')")
+        # The caller's transaction already gives a consistent read, including its own writes
+        assert snapshot.get('site_name') == 'LCA TV'
+        assert conn.in_transaction
+        conn.rollback()
+    finally:
+        conn.close()
+    # What was read before the rollback is not kept
+    assert snapshot.get('site_name') is None
+
+    conn = lca_tv_db.get_connection()
+    try:
+        conn.execute("INSERT INTO settings (key, value) VALUES ('site_name', 'LCA TV Burkina')")
+        snapshot.get('site_name')
+        conn.commit()
+    finally:
+        conn.close()
+    assert snapshot.get('site_name') == 'LCA TV Burkina'
+    reloads = snapshot.reloads
+    assert snapshot.get('site_name') == 'LCA TV Burkina'
+    assert snapshot.reloads == reloads
+
+
+def test_settings_tag_is_invalidated_by_other_workers(lca_tv_db):
+    from page_cache import VersionedTag
+
+    tag = VersionedTag(lca_tv_db, 'settings', 'settings_version')
+    tag.watcher.interval = 0
+    assert not tag.changed()
+    other_worker(lca_tv_db, "UPDATE advertisements SET clicks = clicks + 1")
+    assert not tag.changed()
+    other_worker(lca_tv_db, "INSERT INTO settings (key, value) VALUES ('site_name', 'LCA TV')")
+    assert tag.changed()
+    assert not tag.changed()
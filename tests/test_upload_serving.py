@@ -0,0 +1,28 @@
+"""
+Upload serving tests: the nginx X-Accel-Redirect URI is percent-encoded so
+names with spaces, accents, '?' or '#' reach the right file.
+"""
+from urllib.parse import unquote
+
+import pytest
+from flask import Flask
+
+from upload_serving import send_upload
+
+NAMES = ['affiche été 2025.png', 'ads/Questions de femmes?#1.jpg', 'Ouagadougou_ŚWIĘTO_a1b2c3d4.png']
+
+
+@pytest.mark.parametrize('name', NAMES)
+def test_accel_redirect_is_encoded(tmp_path, name):
+    (tmp_path / 'ads').mkdir()
+    (tmp_path / name).write_bytes(b'\x89PNG')
+    app = Flask(__name__)
+    app.config['UPLOAD_SERVING_MODE'] = 'x-accel'
+
+    with app.test_request_context():
+        response = send_upload(str(tmp_path), name)
+
+    uri = response.headers['X-Accel-Redirect']
+    uri.encode('ascii')
+    assert not set(' ?#') & set(uri)
+    assert unquote(uri) == '/protected-uploads/' + name